@@ -5,25 +5,37 @@
 import eventlet
 eventlet.monkey_patch()
 
+import atexit
 import logging
 import os
 from datetime import timedelta
 from pathlib import Path
 
 import torch
-from flask import Flask, jsonify, redirect, url_for, send_from_directory, make_response, Response
+from flask import Flask, jsonify, redirect, url_for, send_from_directory, Response
 from flask_socketio import emit
 
 import config
 from extensions import db, socketio, emit_progress
 from routes import register_blueprints
-import core.net.unet as net
+from core.jobs import JobManager
+from core.cache import ResultCache, model_fingerprint
+from core.singleflight import SingleFlight
+from core.model_manager import ModelManager
+from core.model_upload import ModelUploads
+from core.shadow import ShadowRunner
+from core.storage import UploadRequest, UploadStore
+from core.artifacts import ArtifactStore
+from core.serving import ArtifactServer
+from core.writebehind import writer
+from core import encoding, loader, predict, workspace
 
 # 初始化目录
 config.init_directories()
 
 # 创建 Flask 应用
 app = Flask(__name__)
+app.request_class = UploadRequest
 app.secret_key = config.SECRET_KEY
 app.config['UPLOAD_FOLDER'] = config.UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = config.MAX_CONTENT_LENGTH
@@ -31,12 +43,60 @@ app.config['SQLALCHEMY_DATABASE_URI'] = config.SQLALCHEMY_DATABASE_URI
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = config.SQLALCHEMY_TRACK_MODIFICATIONS
 app.config['SQLALCHEMY_ENGINE_OPTIONS'] = config.SQLALCHEMY_ENGINE_OPTIONS
 app.config['SEND_FILE_MAX_AGE_DEFAULT'] = timedelta(seconds=1)
+app.config['USE_X_SENDFILE'] = config.USE_X_SENDFILE
 app.model = None
+app.model_id = None
+app.inference_server = None
+app.result_cache = None
 
 # 初始化扩展
 db.init_app(app)
 socketio.init_app(app)
 
+# 异步诊断任务队列，状态变化通过 Socket.IO 推送
+app.job_manager = JobManager(
+    max_workers=config.JOB_WORKERS,
+    max_pending=config.JOB_MAX_PENDING,
+    on_update=lambda job: socketio.emit('job_update', job.to_dict(include_result=False))
+)
+
+# 同一图像的并发诊断合并为一次计算
+app.singleflight = SingleFlight()
+
+# 在线模型（后台加载预热后热切换，保留上一个模型用于回滚）
+app.model_manager = ModelManager(app)
+
+# 候选模型影子推理（抽样的诊断请求在后台用候选模型再推理一次并比较结果）
+app.shadow = ShadowRunner(app)
+
+# 模型分块上传会话（校验在后台任务的独立进程中进行）
+app.model_uploads = ModelUploads()
+
+# 内容寻址的上传存储（相同DICOM只保存一份）
+app.upload_store = UploadStore()
+
+# tmp/ 产物磁盘预算与 LRU 清理
+app.artifact_store = ArtifactStore(
+    config.ARTIFACT_BUDGET_MB * 1024 * 1024,
+    min_age=config.ARTIFACT_MIN_AGE,
+    interval=config.ARTIFACT_SWEEP_INTERVAL,
+    objects_dir=app.upload_store.objects_dir
+)
+
+# /tmp/ 产物访问（ETag / 304 / Range，热点文件内存缓存）
+app.artifact_server = ArtifactServer(
+    hot_cache_bytes=config.ARTIFACT_HOT_CACHE_MB * 1024 * 1024,
+    max_age=config.ARTIFACT_MAX_AGE
+)
+
+# 诊断结果缓存
+if config.RESULT_CACHE:
+    app.result_cache = ResultCache(
+        config.RESULT_CACHE_DIR,
+        memory_bytes=config.RESULT_CACHE_MEMORY_MB * 1024 * 1024,
+        disk_bytes=config.RESULT_CACHE_DISK_MB * 1024 * 1024
+    )
+
 
 # ==================== Socket.IO 事件 ====================
 
@@ -95,17 +155,16 @@ def show_photo(file):
     if file is None:
         return jsonify({'status': 0, 'error': '文件路径不能为空'}), 400
     
-    image_path = Path(config.BASE_DIR) / 'tmp' / file
+    image_path = app.artifact_server.resolve(file)
     
-    if not image_path.exists():
+    if image_path is None:
         return jsonify({'status': 0, 'error': '文件不存在'}), 404
     
-    with open(image_path, 'rb') as f:
-        image_data = f.read()
-    
-    response = make_response(image_data)
-    response.headers['Content-Type'] = 'image/png'
-    return response
+    # 按 pid 记录访问（平铺的旧文件以 pid 为清理单位，需从文件名还原）
+    pid = workspace.pid_of(file)
+    if pid is not None:
+        app.artifact_store.touch(pid)
+    return app.artifact_server.serve(file, image_path)
 
 
 @app.route("/download", methods=['GET'])
@@ -125,10 +184,9 @@ def upload_file_compat():
     from routes.diagnosis import upload_file
     # 绕过认证直接调用核心逻辑
     import datetime
-    import shutil
     from flask import request
     from utils import allowed_file, error_response, success_response
-    from core import process
+    from core import process, offload, workspace
     
     print(f"\n{'='*60}")
     print(f"[Upload] 收到上传请求（兼容接口）")
@@ -145,20 +203,15 @@ def upload_file_compat():
         print(f"[Upload] 文件名: {file.filename}")
         
         if file and allowed_file(file.filename, config.ALLOWED_EXTENSIONS):
-            src_path = Path(config.UPLOAD_FOLDER) / file.filename
-            file.save(str(src_path))
-            
-            tmp_ct_dir = Path(config.BASE_DIR) / 'tmp' / 'ct'
-            shutil.copy(str(src_path), str(tmp_ct_dir))
-            image_path = tmp_ct_dir / file.filename
+            pid, image_path = workspace.create(file.filename)
+            app.upload_store.link(app.upload_store.put(file), image_path)
             
-            image_data = process.pre_process(str(image_path))
-            pid = image_data[1]
+            offload.run_blocking(process.pre_process, str(image_path), None, pid)
             
             # 返回旧格式（直接返回 status 和 image_url）
             return jsonify({
                 'status': 1,
-                'image_url': f'{config.SERVER_URL}/tmp/image/{pid}.png',
+                'image_url': workspace.artifact_url('image', pid),
                 'message': '上传成功，请点击开始诊断'
             })
         else:
@@ -267,22 +320,15 @@ def upload_file_compat():
 
 def init_model():
     """加载 UNet 模型"""
-    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    model = net.Unet(1, 1).to(device)
-    
     model_path = os.path.join(config.BASE_DIR, "core", "net", "model.pth")
     if not os.path.exists(model_path):
         print(f"[Error] 模型文件未找到: {model_path}")
         raise FileNotFoundError(f"模型文件不存在: {model_path}")
     
-    if torch.cuda.is_available():
-        model.load_state_dict(torch.load(model_path))
-        print(f"[Model] 模型已加载 (GPU): {model_path}")
-    else:
-        model.load_state_dict(torch.load(model_path, map_location='cpu'))
-        print(f"[Model] 模型已加载 (CPU): {model_path}")
+    model = loader.load_serving_model(model_path)
+    print(f"[Model] 模型已加载 ({loader.backend_tag()}, "
+          f"{'GPU' if torch.cuda.is_available() else 'CPU'}): {model_path}")
     
-    model.eval()
     return model
 
 
@@ -303,12 +349,41 @@ if __name__ == '__main__':
         # 初始化模型
         print("[Init] 开始初始化模型...")
         try:
-            app.model = init_model()
+            model_path = os.path.join(config.BASE_DIR, "core", "net", "model.pth")
+            app.model_manager.install(
+                'default', model_path, init_model(),
+                model_fingerprint('default', model_path, loader.backend_tag())
+            )
         except Exception as e:
             print(f"[Warning] 模型初始化失败: {e}")
             print("提示: 系统将以无模型模式运行")
             app.model = None
         
+        # 启动微批推理服务
+        if config.BATCH_INFERENCE:
+            from core.batching import BatchInferenceServer
+            app.inference_server = BatchInferenceServer(
+                config.BATCH_MAX_SIZE, config.BATCH_MAX_WAIT_MS
+            ).start()
+        
+        # 读取结果图像编码与二值化阈值设置
+        try:
+            with app.app_context():
+                encoding.load_settings()
+                predict.load_settings()
+                app.model_manager.load_settings()
+                app.shadow.load_settings()
+        except Exception as e:
+            print(f"[Warning] 读取系统设置失败，使用默认编码、阈值与模型路由，不启用影子推理: {e}")
+        
+        # 启动 tmp/ 产物清理
+        app.artifact_store.start(app)
+        
+        # 退出前写完延迟写入队列中的产物与后台缓存写入（atexit 按注册的逆序执行，缓存采集先于产物写完）
+        atexit.register(writer.flush)
+        if app.result_cache is not None:
+            atexit.register(app.result_cache.flush, 30)
+        
         # 启动服务器
         print("[Server] 启动Flask-SocketIO服务器...")
         print(f"[Server] 服务器地址: {config.SERVER_URL}")
@@ -23,6 +23,69 @@ UPLOAD_FOLDER = BASE_DIR / 'uploads'
 ALLOWED_EXTENSIONS = {'dcm'}
 MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # 50MB
 
+# 诊断流水线配置
+# 内存模式：各阶段直接传递HU数组、概率图与mask，DICOM只解码一次，轮廓只查找一次
+PIPELINE_IN_MEMORY = os.environ.get('PIPELINE_IN_MEMORY', 'true').lower() == 'true'
+
+# 推理后端：torch / onnx（ONNX Runtime，需安装 onnxruntime）/ int8（量化 TorchScript，见 ADS_model/net/quantize.py）
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'torch').lower()
+# torch 后端使用优化构建（Conv-BN 折叠 + channels-last + 冻结 TorchScript，缓存为 <model>.opt.pt）
+MODEL_OPTIMIZE = os.environ.get('MODEL_OPTIMIZE', 'true').lower() == 'true'
+# ROI 裁剪推理：只对盆腔先验区域（外扩 ROI_MARGIN 像素）运行 Unet，关闭时为全图推理
+ROI_INFERENCE = os.environ.get('ROI_INFERENCE', 'false').lower() == 'true'
+ROI_MARGIN = int(os.environ.get('ROI_MARGIN', 48))
+# 使用内存映射权重（.pth 同名 .safetensors，首次加载时自动转换），加载更快且多进程共享物理页
+MMAP_WEIGHTS = os.environ.get('MMAP_WEIGHTS', 'true').lower() == 'true'
+# 加载模型后的预热次数
+MODEL_WARMUP_RUNS = int(os.environ.get('MODEL_WARMUP_RUNS', 1))
+# 常驻内存的模型总大小上限（MB），按需加载的器官模型超出时按 LRU 释放；当前模型与上一个模型不计入淘汰
+MODEL_MEMORY_BUDGET_MB = int(os.environ.get('MODEL_MEMORY_BUDGET_MB', 1024))
+# 模型分块上传：单块大小与文件上限（MB），上传后在独立进程中校验的超时时间（秒）
+MODEL_UPLOAD_CHUNK_MB = int(os.environ.get('MODEL_UPLOAD_CHUNK_MB', 8))
+MODEL_UPLOAD_MAX_MB = int(os.environ.get('MODEL_UPLOAD_MAX_MB', 1024))
+MODEL_VALIDATE_TIMEOUT = int(os.environ.get('MODEL_VALIDATE_TIMEOUT', 300))
+
+# 推理线程与进程配置
+TORCH_NUM_THREADS = int(os.environ.get('TORCH_NUM_THREADS', 4))
+# CPU 多进程推理池：>0 时启用，各进程共享同一份权重内存
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', 0))
+INFERENCE_WORKER_THREADS = int(os.environ.get('INFERENCE_WORKER_THREADS', 0))  # 0 表示按核数均分
+INFERENCE_PIN_CPUS = os.environ.get('INFERENCE_PIN_CPUS', 'true').lower() == 'true'
+
+# 微批推理配置：合并并发请求为一次批量前向
+BATCH_INFERENCE = os.environ.get('BATCH_INFERENCE', 'true').lower() == 'true'
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', 8))
+BATCH_MAX_WAIT_MS = float(os.environ.get('BATCH_MAX_WAIT_MS', 5))
+
+# 异步诊断任务配置
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_MAX_PENDING = int(os.environ.get('JOB_MAX_PENDING', 32))
+
+# 预推理：上传完成后立即在后台排队推理，/predict 直接复用其结果
+SPECULATIVE_INFERENCE = os.environ.get('SPECULATIVE_INFERENCE', 'false').lower() == 'true'
+
+# 诊断结果缓存配置（键：DICOM内容SHA-256 + 模型ID）
+RESULT_CACHE = os.environ.get('RESULT_CACHE', 'true').lower() == 'true'
+RESULT_CACHE_DIR = BASE_DIR / 'tmp' / 'cache'
+RESULT_CACHE_MEMORY_MB = int(os.environ.get('RESULT_CACHE_MEMORY_MB', 64))
+RESULT_CACHE_DISK_MB = int(os.environ.get('RESULT_CACHE_DISK_MB', 512))
+
+# tmp/ 产物磁盘预算：超出时按最近访问时间淘汰未被诊断记录引用的工作区
+ARTIFACT_BUDGET_MB = int(os.environ.get('ARTIFACT_BUDGET_MB', 2048))
+ARTIFACT_MIN_AGE = int(os.environ.get('ARTIFACT_MIN_AGE', 3600))  # 秒，最近访问过的工作区不淘汰
+ARTIFACT_SWEEP_INTERVAL = int(os.environ.get('ARTIFACT_SWEEP_INTERVAL', 300))  # 秒
+
+# /tmp/ 产物访问：热点文件内存缓存、工作区产物的浏览器缓存时间
+ARTIFACT_HOT_CACHE_MB = int(os.environ.get('ARTIFACT_HOT_CACHE_MB', 32))
+ARTIFACT_MAX_AGE = int(os.environ.get('ARTIFACT_MAX_AGE', 365 * 24 * 3600))  # 秒
+# 由前置 Web 服务器（Apache/lighttpd 等）通过 X-Sendfile 直接发送大文件
+USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', 'false').lower() == 'true'
+
+# 结果图像编码：各产物的格式在系统设置 system_encoding_* 中配置，编码在后台原生线程池中执行
+ENCODE_WORKERS = int(os.environ.get('ENCODE_WORKERS', 2))
+# 产物延迟写入：排队等待编码/写盘的产物数上限，超出时流水线等待
+WRITE_BEHIND_MAX_PENDING = int(os.environ.get('WRITE_BEHIND_MAX_PENDING', 256))
+
 # 数据库配置 - 从环境变量读取，提高安全性
 SQLALCHEMY_DATABASE_URI = os.environ.get(
     'DATABASE_URL', 
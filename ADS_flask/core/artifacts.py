@@ -0,0 +1,214 @@
+"""
+tmp/ 产物存储管理
+以工作区为单位统计 tmp/{ct,image,mask,draw,heatmap} 的磁盘占用，超过预算时按最近访问时间（LRU）淘汰，
+被 DiagnosisRecord 引用的工作区与最近仍在使用的工作区永不淘汰。
+后台线程定期清理，同时删除已无任何工作区引用的上传对象（uploads/objects 中链接数为 1 的文件）。
+"""
+import os
+import re
+import shutil
+import threading
+import time
+from pathlib import Path
+
+from core import offload, workspace
+
+_WORKSPACE_DIR = re.compile(r'^[0-9a-f]{32}$')
+
+
+class ArtifactStore:
+    """
+    :param budget_bytes: tmp 产物的磁盘预算
+    :param min_age: 最近访问时间在该秒数以内的工作区不淘汰（上传后尚未诊断等）
+    :param interval: 后台清理间隔（秒）
+    :param objects_dir: 上传对象目录，清理其中无引用的对象；为空时不处理
+    """
+
+    def __init__(self, budget_bytes, min_age=3600, interval=300, objects_dir=None):
+        self.budget_bytes = budget_bytes
+        self.min_age = min_age
+        self.interval = interval
+        self.objects_dir = Path(objects_dir) if objects_dir else None
+        self._access = {}  # 工作区键 -> 最近访问时间
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.stats = {
+            'bytes_used': 0, 'workspaces': 0, 'protected': 0,
+            'evictions': 0, 'evicted_bytes': 0,
+            'orphan_objects_removed': 0, 'sweeps': 0, 'last_sweep': None,
+        }
+
+    # ==================== 访问记录 ====================
+
+    def touch(self, pid):
+        """记录工作区被访问（pid 或 "<工作区ID>/..." 形式的相对路径）"""
+        key = self._unit_key(pid)
+        if key is not None:
+            with self._lock:
+                self._access[key] = time.time()
+
+    @staticmethod
+    def _unit_key(pid):
+        """工作区键：工作区ID；引入工作区之前的平铺文件为文件名"""
+        head = pid.split('/', 1)[0]
+        if _WORKSPACE_DIR.match(head):
+            return head
+        return None if '/' in pid else pid
+
+    # ==================== 清理 ====================
+
+    def sweep(self, referenced_pids=()):
+        """
+        执行一次清理
+        :param referenced_pids: 被诊断记录引用的 pid，对应工作区不会被淘汰
+        :return: 本次淘汰的工作区数
+        """
+        protected = {self._unit_key(pid) for pid in referenced_pids}
+        protected.discard(None)
+        units = offload.run_blocking(self._scan)
+
+        now = time.time()
+        with self._lock:
+            for key, unit in units.items():
+                unit['atime'] = max(unit['mtime'], self._access.get(key, 0))
+            # 已不存在的工作区不再记录访问时间
+            for key in list(self._access):
+                if key not in units:
+                    del self._access[key]
+
+        used = sum(unit['size'] for unit in units.values())
+        candidates = sorted(
+            (unit for key, unit in units.items()
+             if key not in protected and now - unit['atime'] >= self.min_age),
+            key=lambda unit: unit['atime']
+        )
+
+        evicted, evicted_bytes = 0, 0
+        for unit in candidates:
+            if used <= self.budget_bytes:
+                break
+            offload.run_blocking(self._remove, unit['paths'])
+            used -= unit['size']
+            evicted += 1
+            evicted_bytes += unit['size']
+            with self._lock:
+                self._access.pop(unit['key'], None)
+
+        orphans = offload.run_blocking(self._remove_orphan_objects) if self.objects_dir else 0
+
+        with self._lock:
+            self.stats['bytes_used'] = used
+            self.stats['workspaces'] = len(units) - evicted
+            self.stats['protected'] = sum(1 for key in units if key in protected)
+            self.stats['evictions'] += evicted
+            self.stats['evicted_bytes'] += evicted_bytes
+            self.stats['orphan_objects_removed'] += orphans
+            self.stats['sweeps'] += 1
+            self.stats['last_sweep'] = time.strftime('%Y-%m-%d %H:%M:%S')
+
+        if evicted or orphans:
+            print(f"[Artifacts] 清理完成: 淘汰 {evicted} 个工作区 ({evicted_bytes / 1024 / 1024:.1f}MB), "
+                  f"删除无引用上传 {orphans} 个, 当前占用 {used / 1024 / 1024:.1f}MB")
+        if used > self.budget_bytes:
+            print(f"[Artifacts] ⚠️ 占用 {used / 1024 / 1024:.1f}MB 仍超出预算，其余工作区受保护或仍在使用")
+        return evicted
+
+    def info(self):
+        with self._lock:
+            return dict(self.stats, budget_bytes=self.budget_bytes)
+
+    def _scan(self):
+        """按工作区汇总各产物目录下的文件：键 -> {key, size, mtime, paths}"""
+        units = {}
+        for kind, (subdir, _) in workspace.LAYOUT.items():
+            base = workspace.TMP_DIR / subdir
+            if not base.is_dir():
+                continue
+            for entry in os.scandir(base):
+                if entry.is_dir(follow_symlinks=False) and _WORKSPACE_DIR.match(entry.name):
+                    key = entry.name
+                    size, mtime = 0, 0.0
+                    for f in os.scandir(entry.path):
+                        st = f.stat(follow_symlinks=False)
+                        # 硬链接到上传对象的 DICOM 不单独占用空间，由无引用对象清理回收
+                        size += st.st_size if st.st_nlink <= 1 else 0
+                        mtime = max(mtime, st.st_mtime)
+                elif entry.is_file(follow_symlinks=False) and workspace.stem_of(kind, entry.name):
+                    # 引入工作区之前的平铺文件，以文件名为单位
+                    key = workspace.stem_of(kind, entry.name)
+                    st = entry.stat(follow_symlinks=False)
+                    size, mtime = st.st_size, st.st_mtime
+                else:
+                    continue
+                unit = units.setdefault(key, {'key': key, 'size': 0, 'mtime': 0.0, 'paths': []})
+                unit['size'] += size
+                unit['mtime'] = max(unit['mtime'], mtime)
+                unit['paths'].append(entry.path)
+        return units
+
+    @staticmethod
+    def _remove(paths):
+        for path in paths:
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+    def _remove_orphan_objects(self):
+        """删除没有任何工作区硬链接引用、且超过 min_age 的上传对象"""
+        removed = 0
+        if not self.objects_dir.is_dir():
+            return removed
+        now = time.time()
+        for path in self.objects_dir.glob('*/*.dcm'):
+            st = path.stat()
+            if st.st_nlink == 1 and now - st.st_mtime >= self.min_age:
+                path.unlink()
+                removed += 1
+                try:
+                    path.parent.rmdir()
+                except OSError:
+                    pass  # 目录中仍有其他对象
+        return removed
+
+    # ==================== 后台线程 ====================
+
+    def start(self, app):
+        """启动后台清理线程，每轮从数据库读取被诊断记录引用的工作区"""
+        if self._thread is not None:
+            return self
+
+        def loop():
+            while not self._stop.wait(self.interval):
+                try:
+                    with app.app_context():
+                        self.sweep(referenced_pids())
+                except Exception as e:
+                    print(f"[Artifacts] 清理失败: {e}")
+
+        self._thread = threading.Thread(target=loop, name='artifact-sweeper', daemon=True)
+        self._thread.start()
+        print(f"[Artifacts] 产物清理已启动 (预算 {self.budget_bytes / 1024 / 1024:.0f}MB, 间隔 {self.interval}秒)")
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+def referenced_pids():
+    """诊断记录引用的全部 pid（需在应用上下文中调用）"""
+    from extensions import db
+    from models import DiagnosisRecord
+
+    pids = set()
+    rows = db.session.query(DiagnosisRecord.image_url, DiagnosisRecord.draw_url).all()
+    for image_url, draw_url in rows:
+        for url, kind in ((image_url, 'image'), (draw_url, 'draw')):
+            pid = workspace.pid_from_url(url or '', kind)
+            if pid is not None:
+                pids.add(pid)
+    return pids
@@ -0,0 +1,165 @@
+"""
+动态微批推理服务
+把并发到达的推理请求合并成一个 batch，只执行一次 Unet 前向，再把结果拆分给各个调用方
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+
+from core import offload
+
+
+class _InferenceRequest:
+    """单个推理请求"""
+    __slots__ = ('model', 'x', 'future')
+
+    def __init__(self, model, x):
+        self.model = model
+        self.x = x
+        self.future = Future()
+
+
+class BatchedModel:
+    """
+    与模型调用方式一致的包装器，y = batched_model(x)
+    predict.predict 无需改动即可经由批处理服务推理
+    """
+    # 在协程中等待结果，前向计算由批处理线程卸载到原生线程执行
+    cooperative = True
+
+    def __init__(self, server, model):
+        self.server = server
+        self.model = model
+
+    def __call__(self, x):
+        return self.server.infer(self.model, x)
+
+
+class BatchInferenceServer:
+    """
+    微批推理服务
+    后台线程收集请求：凑满 max_batch_size 或等待超过 max_wait_ms 即执行一次批量前向。
+    同一批次内按 (模型, 输入shape) 分组，切换模型期间的请求不会混用权重。
+    """
+
+    def __init__(self, max_batch_size=8, max_wait_ms=5):
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._running = False
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'batches': 0, 'max_batch': 0}
+
+    def start(self):
+        """启动后台批处理线程"""
+        with self._lock:
+            if self._running:
+                return self
+            self._running = True
+            self._thread = threading.Thread(target=self._loop, name='batch-inference', daemon=True)
+            self._thread.start()
+        print(f"[Batch] 微批推理服务已启动 (max_batch_size={self.max_batch_size}, "
+              f"max_wait={self.max_wait * 1000:.0f}ms)")
+        return self
+
+    def stop(self):
+        """停止服务，未处理的请求以异常结束"""
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def submit(self, model, x):
+        """提交一个 (1, C, H, W) 输入，返回 Future"""
+        if not self._running:
+            raise RuntimeError('微批推理服务未启动')
+        request = _InferenceRequest(model, x)
+        self._queue.put(request)
+        return request.future
+
+    def infer(self, model, x):
+        """同步推理：提交后等待本请求的结果"""
+        return self.submit(model, x).result()
+
+    def bind(self, model):
+        """
+        返回绑定到指定模型的可调用对象
+        自身能并行处理并发调用的模型（parallel，如多进程推理池）直接返回，不经过批处理线程
+        """
+        if getattr(model, 'parallel', False):
+            return model
+        return BatchedModel(self, model)
+
+    # ==================== 后台线程 ====================
+
+    def _collect(self, first):
+        """以第一个请求为起点收集一个批次"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch = self._collect(first)
+
+            groups = {}
+            for request in batch:
+                key = (id(request.model), tuple(request.x.shape[1:]), request.x.device)
+                groups.setdefault(key, []).append(request)
+
+            for requests in groups.values():
+                self._run_batch(requests)
+
+        # 服务停止后清空队列
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item.future.set_exception(RuntimeError('微批推理服务已停止'))
+
+    def _run_batch(self, requests):
+        model = requests[0].model
+        try:
+            with torch.no_grad():
+                x = torch.cat([r.x for r in requests], dim=0)
+                y = offload.call_model(model, x)
+            offset = 0
+            for r in requests:
+                n = r.x.shape[0]
+                r.future.set_result(y[offset:offset + n])
+                offset += n
+        except Exception as e:
+            print(f"[Batch] ❌ 批量推理失败: {e}")
+            for r in requests:
+                if not r.future.done():
+                    r.future.set_exception(e)
+            return
+
+        self.stats['requests'] += len(requests)
+        self.stats['batches'] += 1
+        self.stats['max_batch'] = max(self.stats['max_batch'], len(requests))
+        if len(requests) > 1:
+            print(f"[Batch] 合并推理 {len(requests)} 个请求, 输入shape: {tuple(x.shape)}")
@@ -0,0 +1,310 @@
+"""
+诊断结果缓存
+以 DICOM 内容的 SHA-256 + 当前模型ID 作为键，缓存 mask、轮廓图、概率图（及已渲染的热力图）与特征数据。
+内存与磁盘两级均按字节数上限做 LRU 淘汰；切换模型后模型ID变化，旧条目自然失效。
+"""
+import copy
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from core import encoding, offload, predict, workspace
+from core.offload import native_threading
+from core.writebehind import writer
+
+# 缓存的产物：条目字段 -> 工作区产物类型
+# 热力图按需渲染，通常只有概率图；缓存写入时已渲染的热力图一并缓存
+# 概率图排在热力图之前：materialize 按此顺序提交，热力图不早于概率图，不会被视为过期
+ARTIFACTS = {
+    'mask': 'mask',
+    'overlay': 'draw',
+    'prob': 'prob',
+    'heatmap': 'heatmap',
+}
+
+
+def _disk_name(field):
+    """条目目录中产物的文件名"""
+    return f'{field}.npz' if field == 'prob' else f'{field}.png'
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """计算文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def model_fingerprint(name, model_path, backend='torch'):
+    """模型ID：名称 + 文件大小 + 修改时间 + 推理后端，同名模型被覆盖或更换后端后ID也会变化"""
+    stat = Path(model_path).stat()
+    return f'{name}:{stat.st_size}:{stat.st_mtime_ns}:{backend}'
+
+
+def make_key(content_hash, model_id):
+    """缓存键"""
+    return hashlib.sha256(f'{content_hash}|{model_id}'.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """
+    两级 LRU 结果缓存
+    :param root: 磁盘缓存目录，每个条目一个子目录
+    :param memory_bytes: 内存缓存上限（字节）
+    :param disk_bytes: 磁盘缓存上限（字节）
+    :param workers: 后台采集并写入缓存条目的原生线程数
+    锁只保护内存中的索引，磁盘读写在锁外进行；锁为原生锁，put 可在后台原生线程中调用
+    """
+
+    def __init__(self, root, memory_bytes=64 * 1024 * 1024, disk_bytes=512 * 1024 * 1024, workers=1):
+        self.root = Path(root)
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()  # key -> (entry, size)
+        self._memory_used = 0
+        self._disk = OrderedDict()    # key -> size
+        self._disk_used = 0
+        self._lock = native_threading.Lock()
+        self._pool = offload.NativePool(workers, name='result-cache')
+        self._storing = set()  # 尚未完成的后台写入任务
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._load_index()
+
+    # ==================== 读写 ====================
+
+    def get(self, key):
+        """命中返回条目字典 {'mask','overlay','heatmap','prob': bytes, 'features': dict}，否则返回 None"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                if key in self._disk:
+                    self._disk.move_to_end(key)
+                self.stats['hits'] += 1
+                return self._memory[key][0]
+
+            if key not in self._disk:
+                self.stats['misses'] += 1
+                return None
+
+        # 磁盘读取在原生线程中进行，不阻塞 hub
+        entry = offload.run_blocking(self._read_disk, key)
+        with self._lock:
+            if entry is None:
+                self._disk_used -= self._disk.pop(key, 0)
+                self.stats['misses'] += 1
+                return None
+            if key in self._disk:
+                self._disk.move_to_end(key)
+            self._put_memory(key, entry)
+            self.stats['hits'] += 1
+            return entry
+
+    def put(self, key, entry):
+        """
+        写入内存与磁盘
+        磁盘写入是阻塞调用，协程中应通过 offload.run_blocking 调用
+        """
+        with self._lock:
+            self._put_memory(key, entry)
+        size = self._write_disk(key, entry)
+
+        evicted_keys = []
+        with self._lock:
+            if key in self._disk:
+                self._disk_used -= self._disk.pop(key)
+            self._disk[key] = size
+            self._disk_used += size
+            while self._disk_used > self.disk_bytes and len(self._disk) > 1:
+                evicted_key, evicted = self._disk.popitem(last=False)
+                self._disk_used -= evicted
+                evicted_keys.append(evicted_key)
+                self.stats['evictions'] += 1
+        for evicted_key in evicted_keys:
+            shutil.rmtree(self.root / evicted_key, ignore_errors=True)
+
+    def store_later(self, key, pid, image_info):
+        """在后台线程池中等待产物写入完成后采集条目并写入缓存，立即返回"""
+        task = self._pool.submit(self._store, key, pid, copy.deepcopy(image_info))
+        with self._lock:
+            self._storing.add(task)
+        return task
+
+    def flush(self, timeout=None):
+        """等待后台缓存写入全部完成，返回是否在超时前完成"""
+        with self._lock:
+            tasks = list(self._storing)
+        deadline = None if timeout is None else time.time() + timeout
+        for task in tasks:
+            remaining = None if deadline is None else max(0.0, deadline - time.time())
+            try:
+                task.result(remaining)
+            except TimeoutError:
+                return False
+            except Exception:
+                pass
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_used = 0
+            keys = list(self._disk)
+            self._disk.clear()
+            self._disk_used = 0
+        for key in keys:
+            shutil.rmtree(self.root / key, ignore_errors=True)
+
+    def info(self):
+        with self._lock:
+            return dict(self.stats,
+                        memory_entries=len(self._memory), memory_bytes=self._memory_used,
+                        disk_entries=len(self._disk), disk_bytes=self._disk_used)
+
+    # ==================== 与 tmp/ 产物互转 ====================
+
+    @staticmethod
+    def capture(pid, image_info):
+        """在流水线完成后从工作区读取产物（含尚未落盘的产物），构造缓存条目"""
+        entry = {'features': image_info}
+        for field, kind in ARTIFACTS.items():
+            path = workspace.find_artifact(kind, pid)
+            if writer.exists(path):
+                entry[field] = writer.read_bytes(path)
+        return entry
+
+    @staticmethod
+    def materialize(pid, entry):
+        """缓存命中时把产物写入本次诊断的工作区（延迟写入），使结果URL可直接访问"""
+        for field, kind in ARTIFACTS.items():
+            data = entry.get(field)
+            if data is None:
+                continue
+            writer.submit(workspace.artifact_path(kind, pid), lambda data=data: data)
+        return copy.deepcopy(entry['features'])
+
+    # ==================== 内部方法 ====================
+
+    def _store(self, key, pid, image_info):
+        try:
+            self.put(key, self.capture(pid, image_info))
+        except Exception as e:
+            print(f"[Cache] 写入缓存失败: {pid} ({e})")
+        finally:
+            with self._lock:
+                self._storing = {task for task in self._storing if not task.done()}
+
+    @staticmethod
+    def _entry_size(entry):
+        return sum(len(v) for k, v in entry.items() if k in ARTIFACTS)
+
+    def _put_memory(self, key, entry):
+        size = self._entry_size(entry)
+        if key in self._memory:
+            self._memory_used -= self._memory.pop(key)[1]
+        if size > self.memory_bytes:
+            return
+        self._memory[key] = (entry, size)
+        self._memory_used += size
+        while self._memory_used > self.memory_bytes:
+            _, (_, evicted) = self._memory.popitem(last=False)
+            self._memory_used -= evicted
+
+    def _write_disk(self, key, entry):
+        """写入条目目录（不持有锁），返回条目大小"""
+        entry_dir = self.root / key
+        tmp_dir = self.root / f'.{key}.{threading.get_ident()}'
+        stale_dir = self.root / f'.{key}.{threading.get_ident()}.old'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+        for field in ARTIFACTS:
+            if entry.get(field) is not None:
+                (tmp_dir / _disk_name(field)).write_bytes(entry[field])
+        with open(tmp_dir / 'features.json', 'w', encoding='utf-8') as f:
+            json.dump(entry['features'], f, ensure_ascii=False)
+
+        # 目录不能直接替换非空目录，旧条目先移开
+        try:
+            os.replace(entry_dir, stale_dir)
+        except FileNotFoundError:
+            pass
+        try:
+            os.replace(tmp_dir, entry_dir)
+        except OSError:
+            # 同一条目被并发写入，键相同内容相同，保留先完成的一份
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        shutil.rmtree(stale_dir, ignore_errors=True)
+        return self._entry_size(entry)
+
+    def _read_disk(self, key):
+        """读取条目目录（不持有锁），损坏时删除目录并返回 None"""
+        entry_dir = self.root / key
+        try:
+            with open(entry_dir / 'features.json', encoding='utf-8') as f:
+                entry = {'features': json.load(f)}
+            for field in ARTIFACTS:
+                path = entry_dir / _disk_name(field)
+                if path.exists():
+                    entry[field] = path.read_bytes()
+            os.utime(entry_dir, None)
+            return entry
+        except (OSError, ValueError) as e:
+            print(f"[Cache] 缓存条目损坏，已丢弃: {key} ({e})")
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return None
+
+    def _load_index(self):
+        """启动时按目录修改时间重建磁盘 LRU 索引"""
+        entries = []
+        for entry_dir in self.root.iterdir():
+            if not entry_dir.is_dir():
+                continue
+            if entry_dir.name.startswith('.'):
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                continue
+            size = sum(f.stat().st_size for f in entry_dir.iterdir() if f.name != 'features.json')
+            entries.append((entry_dir.stat().st_mtime, entry_dir.name, size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_used += size
+        if entries:
+            print(f"[Cache] 已加载磁盘缓存 {len(entries)} 条, {self._disk_used / 1024 / 1024:.1f}MB")
+
+
+def cached_run(cache, dcm_path, pid, model_id, run, timings=None, content_hash=None):
+    """
+    带缓存的诊断：命中时直接还原产物并跳过模型，未命中时执行 run() 并写入缓存
+    :param pid: 诊断标识，命中时产物写入其工作区
+    :param content_hash: 已知的 DICOM 内容 SHA-256（如上传时计算的哈希），为空时读取文件计算
+    :param run: 无参函数，返回 (pid + '.png', image_info)
+    :return: (pid + '.png', image_info)
+    """
+    if cache is None or model_id is None:
+        return run()
+
+    t0 = time.time()
+    if content_hash is None:
+        content_hash = offload.run_blocking(file_sha256, dcm_path)
+    # 产物以编码后的字节缓存，二值化阈值或编码设置变化后不复用旧条目
+    key = make_key(content_hash, f'{model_id}|{predict.threshold}|{encoding.signature()}')
+    entry = cache.get(key)
+    if entry is not None:
+        # 提交延迟写入在队列满时会在原生锁上等待，不能在协程中直接调用
+        image_info = offload.run_blocking(cache.materialize, pid, entry)
+        if timings is not None:
+            timings['cache_hit'] = True
+            timings['total'] = round(time.time() - t0, 4)
+        print(f"[Cache] ✅ 命中缓存: {pid} ({time.time() - t0:.3f}秒)")
+        return f'{pid}.png', image_info
+
+    result = run()
+    # 产物仍在后台编码写入，缓存条目在其完成后由缓存的后台线程池采集，不推迟本次返回
+    cache.store_later(key, pid, result[1])
+    return result
@@ -0,0 +1,161 @@
+"""
+结果图像编码
+预览图、mask、轮廓图、热力图的编码格式分别由系统设置 system_encoding_<产物类型> 配置，取值形如：
+- png:<0-9>        无损 PNG，数字为压缩级别
+- png:1bit         1 位二值 PNG（仅用于 mask）
+- webp:lossless    无损 WebP
+- webp:<1-100>     有损 WebP，数字为质量
+- jpeg:<1-100>     JPEG，数字为质量
+mask 参与特征计算与缓存回读，只允许无损格式。
+编码与写盘交给 core.writebehind 在后台原生线程池中执行，提交后立即返回；
+文件先写入临时文件再原子替换，写入完成前的读取由内存中的数据提供。
+"""
+import cv2
+import numpy as np
+
+from core import workspace
+from core.writebehind import writer
+
+# 设置键前缀：system_encoding_image / _mask / _draw / _heatmap
+SETTING_PREFIX = 'system_encoding_'
+
+DEFAULTS = {
+    'image': 'png:6',
+    'mask': 'png:1bit',
+    'draw': 'webp:lossless',
+    'heatmap': 'webp:90',
+}
+
+DESCRIPTIONS = {
+    'image': 'CT预览图编码格式（png:0-9 / webp:lossless / webp:1-100 / jpeg:1-100）',
+    'mask': '分割掩码编码格式（png:1bit / png:0-9 / webp:lossless）',
+    'draw': '轮廓叠加图编码格式（png:0-9 / webp:lossless / webp:1-100 / jpeg:1-100）',
+    'heatmap': '热力图编码格式（png:0-9 / webp:lossless / webp:1-100 / jpeg:1-100）',
+}
+
+_EXTENSIONS = {'png': '.png', 'webp': '.webp', 'jpeg': '.jpg'}
+
+_profile = {}  # 产物类型 -> (格式, 参数, cv2 编码参数)，整体替换，读写无需加锁
+
+
+class EncodingError(ValueError):
+    pass
+
+
+def parse(kind, value):
+    """
+    解析编码设置
+    :return: (格式, 参数, cv2 编码参数)；不合法时抛出 EncodingError
+    """
+    fmt, _, arg = str(value).strip().lower().partition(':')
+    if fmt == 'jpg':
+        fmt = 'jpeg'
+    if fmt not in _EXTENSIONS:
+        raise EncodingError(f'不支持的编码格式: {value}')
+    if fmt != 'png' and not cv2.haveImageWriter(_EXTENSIONS[fmt]):
+        raise EncodingError(f'当前 OpenCV 不支持写入 {fmt}')
+
+    if fmt == 'png':
+        if arg == '1bit':
+            if kind != 'mask':
+                raise EncodingError('png:1bit 仅用于 mask')
+            return fmt, arg, [cv2.IMWRITE_PNG_BILEVEL, 1]
+        level = _int_arg(arg or '6', 0, 9, value)
+        return fmt, level, [cv2.IMWRITE_PNG_COMPRESSION, level]
+
+    if fmt == 'webp' and arg == 'lossless':
+        # OpenCV 中 WebP 质量大于 100 即为无损
+        return fmt, arg, [cv2.IMWRITE_WEBP_QUALITY, 101]
+
+    if kind == 'mask':
+        raise EncodingError('mask 只能使用无损格式')
+    quality = _int_arg(arg or '90', 1, 100, value)
+    if fmt == 'webp':
+        return fmt, quality, [cv2.IMWRITE_WEBP_QUALITY, quality]
+    return fmt, quality, [cv2.IMWRITE_JPEG_QUALITY, quality]
+
+
+def _int_arg(arg, low, high, value):
+    try:
+        number = int(arg)
+    except ValueError:
+        raise EncodingError(f'无效的编码参数: {value}')
+    if not low <= number <= high:
+        raise EncodingError(f'编码参数应在 {low}-{high} 之间: {value}')
+    return number
+
+
+def configure(kind, value):
+    """应用单个产物的编码设置，不合法时回退为默认值"""
+    try:
+        profile = parse(kind, value)
+    except EncodingError as e:
+        print(f"[Encoding] ⚠️ {kind} 编码设置无效，使用默认值 {DEFAULTS[kind]}: {e}")
+        profile = parse(kind, DEFAULTS[kind])
+    _profile[kind] = profile
+    workspace.extensions[kind] = _EXTENSIONS[profile[0]]
+
+
+def load_settings():
+    """从系统设置读取编码配置（需在应用上下文中调用），未配置的产物使用默认值"""
+    from models import SystemSetting
+
+    rows = SystemSetting.query.filter(SystemSetting.key.like(f'{SETTING_PREFIX}%')).all()
+    values = {row.key[len(SETTING_PREFIX):]: row.value for row in rows}
+    for kind in DEFAULTS:
+        configure(kind, values.get(kind) or DEFAULTS[kind])
+    print(f"[Encoding] 产物编码: {signature()}")
+
+
+def signature():
+    """当前编码配置的标识，参与结果缓存键，修改编码设置后旧缓存不再命中"""
+    return ','.join(f'{kind}={_profile[kind][0]}:{_profile[kind][1]}' for kind in sorted(_profile))
+
+
+# ==================== 编码与写入 ====================
+
+def to_8bit(array):
+    """转为 8 位（WebP / JPEG 只支持 8 位，PNG 只支持 8/16 位）：与 PNG 回读规则一致，16 位右移 8 位，其余类型饱和截断"""
+    array = np.asarray(array)
+    if array.dtype == np.uint16:
+        return (array >> 8).astype(np.uint8)
+    if array.dtype != np.uint8:
+        return np.clip(array, 0, 255).astype(np.uint8)
+    return array
+
+
+def encode(kind, array, profile=None):
+    """
+    按编码设置编码图像
+    :param profile: parse() 的结果，默认使用当前设置
+    :return: bytes
+    """
+    fmt, _, params = profile or _profile[kind]
+    if fmt != 'png' or np.asarray(array).dtype not in (np.uint8, np.uint16):
+        array = to_8bit(array)
+    ok, buf = cv2.imencode(_EXTENSIONS[fmt], np.ascontiguousarray(array), params)
+    if not ok:
+        raise RuntimeError(f'{kind} 图像编码失败 ({fmt})')
+    return buf.tobytes()
+
+
+def write(kind, pid, array):
+    """
+    提交产物的编码与写入，立即返回目标路径（扩展名由提交时的编码设置决定）
+    调用方之后不应再修改 array
+    """
+    profile = _profile[kind]
+    path = workspace.artifact_path(kind, pid, ext=_EXTENSIONS[profile[0]])
+    return writer.submit(path, lambda: encode(kind, array, profile))
+
+
+def imread(path, flags=cv2.IMREAD_COLOR):
+    """读取图像产物，尚未落盘时从内存解码（原生线程中调用）"""
+    data = writer.read(path)
+    if data is not None:
+        return cv2.imdecode(np.frombuffer(data, np.uint8), flags)
+    return cv2.imread(str(path), flags)
+
+
+for _kind, _value in DEFAULTS.items():
+    configure(_kind, _value)
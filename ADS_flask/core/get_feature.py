@@ -3,6 +3,8 @@ import cv2
 import numpy as np
 import os
 
+from core import encoding, workspace
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 np.set_printoptions(suppress=True)
@@ -17,10 +19,11 @@ FEATURE_LABELS = {
 }
 
 
-def _get_geometry_feature(mask_array):
+def _get_geometry_feature(mask_array, contours=None):
     """从分割 mask 中提取形态特征：面积、周长、似圆度"""
-    result = cv2.findContours(mask_array.copy(), cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
-    contours = result[0] if len(result) == 2 else result[1]
+    if contours is None:
+        result = cv2.findContours(mask_array.copy(), cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+        contours = result[0] if len(result) == 2 else result[1]
 
     best_area = 0
     best_perimeter = 0
@@ -48,23 +51,32 @@ def _get_gray_feature(image_array, mask_array):
     return round(float(np.mean(roi_values)), 4), round(float(np.std(roi_values)), 4)
 
 
-def get_feature(ct_path, mask_path):
+def get_feature(ct_path, mask_path, image_array=None, mask_array=None, contours=None):
     """
     提取肿瘤核心特征（精简版）
 
+    Args:
+        image_array: 已解码的HU数组，传入时不再读取 ct_path
+        mask_array: 内存中的二值mask，传入时不再读取 mask_path
+        contours: 已查找到的全部轮廓，传入时不再重复查找
+
     Returns:
         dict | None: 特征字典，未检测到肿瘤时返回 None
     """
-    mask_array = cv2.imread(mask_path, 0)
-    image = sitk.ReadImage(ct_path)
-    image_array = sitk.GetArrayFromImage(image)[0, :, :]
+    if mask_array is None:
+        mask_array = encoding.imread(mask_path, 0)
+    if image_array is None:
+        image = sitk.ReadImage(ct_path)
+        image_array = sitk.GetArrayFromImage(image)
+    if image_array.ndim == 3:
+        image_array = image_array[0, :, :]
 
     index = np.nonzero(mask_array)
     if not index[0].any():
         return None
 
     # 形态特征
-    area, perimeter, ellipse = _get_geometry_feature(mask_array)
+    area, perimeter, ellipse = _get_geometry_feature(mask_array, contours)
 
     # 灰度特征
     gray_mean, gray_std = _get_gray_feature(image_array, mask_array)
@@ -78,14 +90,15 @@ def get_feature(ct_path, mask_path):
     }
 
 
-def main(pid):
+def main(pid, image_array=None, mask_array=None, contours=None):
     """
     主入口：根据 pid 提取特征并返回带中文标签的结果
+    内存模式下传入 image_array / mask_array / contours，跳过磁盘读取
     """
-    ct_path = os.path.join(BASE_DIR, 'tmp', 'ct', f'{pid}.dcm')
-    mask_path = os.path.join(BASE_DIR, 'tmp', 'mask', f'{pid}_mask.png')
+    ct_path = str(workspace.artifact_path('ct', pid))
+    mask_path = str(workspace.find_artifact('mask', pid))
 
-    features = get_feature(ct_path, mask_path)
+    features = get_feature(ct_path, mask_path, image_array, mask_array, contours)
 
     if features is None:
         print(f"⚠️ 未检测到肿瘤: {pid}")
@@ -0,0 +1,86 @@
+"""
+热力图按需渲染
+推理后只保存 float16 概率图（tmp/prob/<pid>.npz，压缩存储），不再为每次诊断生成热力图；
+首次请求 /tmp/heatmap/... 时由概率图渲染 JET 伪彩色图并按编码设置写入工作区，之后作为普通文件访问。
+同一 pid 重新诊断（换模型等）会写入新的概率图，早于概率图的热力图视为过期，下次请求时重新渲染。
+"""
+import io
+
+import cv2
+import numpy as np
+
+from core import encoding, offload, workspace
+from core.singleflight import SingleFlight
+from core.writebehind import writer
+
+# 同一热力图的并发首次请求只渲染一次
+_renders = SingleFlight()
+
+
+def _compress(prob):
+    buf = io.BytesIO()
+    np.savez_compressed(buf, prob=prob)
+    return buf.getvalue()
+
+
+def save_prob(pid, prob):
+    """以 float16 压缩保存概率图（延迟写入）"""
+    prob = np.asarray(prob, dtype=np.float16)
+    return writer.submit(workspace.artifact_path('prob', pid), lambda: _compress(prob))
+
+
+def load_prob(pid):
+    """读取概率图（float32），不存在时返回 None"""
+    path = workspace.artifact_path('prob', pid)
+    if not writer.exists(path):
+        return None
+    with np.load(io.BytesIO(writer.read_bytes(path))) as data:
+        return data['prob'].astype(np.float32)
+
+
+def current(pid):
+    """已渲染且不早于概率图的热力图路径，没有或已过期时返回 None"""
+    path = workspace.find_artifact('heatmap', pid)
+    rendered = workspace.mtime_ns(path)
+    if rendered is None:
+        return None
+    prob = workspace.mtime_ns(workspace.artifact_path('prob', pid))
+    return path if prob is None or rendered >= prob else None
+
+
+def render(pid):
+    """
+    渲染热力图（原生线程中调用）
+    :return: 热力图路径；已渲染且未过期时直接返回，没有概率图时返回 None
+    """
+    path = current(pid)
+    if path is not None:
+        return path
+    prob = load_prob(pid)
+    if prob is None:
+        return None
+    # 将概率图映射到 0-255，应用伪彩色 (JET colormap: 蓝色=低概率, 红色=高概率)
+    heatmap_norm = (np.clip(prob, 0, 1) * 255).astype(np.uint8)
+    heatmap_color = cv2.applyColorMap(heatmap_norm, cv2.COLORMAP_JET)
+    path = encoding.write('heatmap', pid, heatmap_color)
+    print(f"[Heatmap] 🔥 热力图已生成: {path}")
+    return path
+
+
+def render_file(name):
+    """
+    按请求的热力图文件名（相对 tmp/heatmap/）渲染
+    :return: 当前的热力图路径（已渲染且未过期时直接返回），无法渲染时返回 None
+    """
+    pid = workspace.stem_of('heatmap', name)
+    if pid is None:
+        return None
+    try:
+        workspace.parse_pid(pid)
+    except ValueError:
+        return None
+    path = current(pid)
+    if path is not None:
+        return path
+    path, _ = _renders.do(('heatmap', pid), lambda progress: offload.run_blocking(render, pid))
+    return path
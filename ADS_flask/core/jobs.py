@@ -0,0 +1,176 @@
+"""
+异步任务队列
+提交后立即返回任务ID，由有界线程池执行，调用方通过轮询或 Socket.IO 获取结果
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobQueueFull(RuntimeError):
+    """等待中的任务数已达上限"""
+
+
+class Job:
+    """任务记录：状态、进度、各阶段耗时与结果"""
+
+    def __init__(self, kind, key=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.key = key
+        self.status = 'queued'  # queued/running/done/failed/cancelled
+        self.progress = 0
+        self.message = '排队中'
+        self.timings = {}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._done = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed', 'cancelled')
+
+    def wait(self, timeout=None):
+        """等待任务结束，返回是否已结束"""
+        return self._done.wait(timeout)
+
+    def to_dict(self, include_result=True):
+        """转换为字典"""
+        data = {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': self.progress,
+            'message': self.message,
+            'timings': self.timings,
+            'error': self.error,
+            'queue_time': round((self.started_at or time.time()) - self.created_at, 4),
+            'created_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.created_at)),
+        }
+        if include_result and self.status == 'done':
+            data['result'] = self.result
+        return data
+
+
+class JobManager:
+    """
+    有界任务管理器
+    :param max_workers: 同时执行的任务数
+    :param max_pending: 排队+执行中的任务上限，超出时 submit 抛出 JobQueueFull
+    :param history: 保留的已结束任务数量
+    :param on_update: 任务状态/进度变化回调 callback(job)
+    """
+
+    def __init__(self, max_workers=2, max_pending=32, history=200, on_update=None):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.history = history
+        self.on_update = on_update
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = OrderedDict()
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, kind='predict', key=None, **kwargs):
+        """
+        提交任务，fn(job, *args, **kwargs) 的返回值作为任务结果
+        :return: Job
+        """
+        with self._lock:
+            if self._active >= self.max_pending:
+                raise JobQueueFull(f'任务队列已满 ({self.max_pending})，请稍后重试')
+            job = Job(kind, key)
+            self._jobs[job.id] = job
+            self._active += 1
+            self._trim()
+
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        self._notify(job)
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def find(self, key, kind=None):
+        """按 key 查找最近提交的任务（可限定类型），未找到返回 None"""
+        with self._lock:
+            for job in reversed(self._jobs.values()):
+                if job.key == key and (kind is None or job.kind == kind):
+                    return job
+        return None
+
+    def cancel(self, job):
+        """取消尚未开始执行的任务，返回是否取消成功"""
+        with self._lock:
+            if job.status != 'queued':
+                return False
+            job.status = 'cancelled'
+            job.message = '已取消'
+        return True
+
+    def update(self, job, progress=None, message=None):
+        """更新任务进度并通知"""
+        if progress is not None:
+            job.progress = progress
+        if message is not None:
+            job.message = message
+        self._notify(job)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'active': self._active,
+                'max_workers': self.max_workers,
+                'max_pending': self.max_pending,
+                'tracked': len(self._jobs),
+            }
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    # ==================== 内部方法 ====================
+
+    def _run(self, job, fn, args, kwargs):
+        with self._lock:
+            if job.status == 'cancelled':
+                self._active -= 1
+                job.finished_at = time.time()
+                job._done.set()
+                return
+            job.status = 'running'
+        job.started_at = time.time()
+        self.update(job, message='处理中')
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.status = 'done'
+            job.progress = 100
+            job.message = '完成'
+        except Exception as e:
+            print(f"[Job] ❌ 任务 {job.id} 失败: {e}")
+            job.status = 'failed'
+            job.error = str(e)
+            job.message = '失败'
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._active -= 1
+            job._done.set()
+            self._notify(job)
+
+    def _trim(self):
+        """仅保留最近 history 个已结束任务"""
+        finished = [jid for jid, j in self._jobs.items() if j.finished]
+        for jid in finished[:max(0, len(finished) - self.history)]:
+            del self._jobs[jid]
+
+    def _notify(self, job):
+        if self.on_update:
+            try:
+                self.on_update(job)
+            except Exception as e:
+                print(f"[Job] 状态通知失败: {e}")
@@ -0,0 +1,149 @@
+"""
+模型加载
+统一启动加载、切换模型与上传校验时的模型构建逻辑
+"""
+from pathlib import Path
+
+import torch
+
+import config
+import core.net.unet as net
+from core import weights
+
+# 启动时加载的默认模型与上传模型的存放目录
+DEFAULT_MODEL_PATH = Path(config.BASE_DIR) / 'core' / 'net' / 'model.pth'
+MODELS_DIR = Path(config.BASE_DIR) / 'core' / 'net' / 'models'
+
+
+def get_device():
+    return torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+
+def model_file(name):
+    """模型名称对应的权重文件（default 为启动时加载的 model.pth）"""
+    if name == 'default':
+        return DEFAULT_MODEL_PATH
+    if not name or name.startswith('.') or '/' in name or '\\' in name:
+        raise ValueError(f'无效的模型名称: {name}')
+    return MODELS_DIR / f'{name}.pth'
+
+
+def load_model(model_path):
+    """
+    从 .pth 权重构建 Unet 并切换到推理模式
+    MMAP_WEIGHTS 开启时使用同名 .safetensors 映射权重（不存在或早于 .pth 时先转换），
+    参数直接引用映射的页面；模型的 weights_file 属性记录映射的文件，供多进程推理池共享
+    """
+    model_path = Path(model_path)
+    if not model_path.exists():
+        raise FileNotFoundError(f"模型文件不存在: {model_path}")
+
+    device = get_device()
+    model = net.Unet(1, 1)
+    mapped = _mapped_weights(model_path) if config.MMAP_WEIGHTS else None
+    if mapped is not None:
+        weights.bind(model, weights.load(mapped))
+        model.weights_file = str(mapped)
+    elif torch.cuda.is_available():
+        model.load_state_dict(torch.load(str(model_path)))
+    else:
+        model.load_state_dict(torch.load(str(model_path), map_location='cpu'))
+    model = model.to(device)
+    model.eval()
+    return model
+
+
+def _mapped_weights(model_path):
+    """返回可用的映射权重文件，无法转换（如目录只读）时返回 None 并回退到 torch.load"""
+    if not weights.is_current(model_path):
+        try:
+            weights.convert(model_path)
+        except OSError as e:
+            print(f"[Weights] ⚠️ 无法生成映射权重，使用 torch.load: {e}")
+            return None
+    return weights.weights_path(model_path)
+
+
+def quantized_path(model_path):
+    """INT8 模型与 .pth 同目录同名，后缀为 .int8.pt"""
+    return Path(model_path).with_suffix('.int8.pt')
+
+
+def load_quantized(model_path):
+    """加载 ADS_model/net/quantize.py 生成的 INT8 TorchScript 模型"""
+    path = quantized_path(model_path)
+    if not path.exists():
+        raise FileNotFoundError(
+            f"INT8 模型不存在: {path}，请先运行 ADS_model/net/quantize.py --output {path.name}"
+        )
+    if 'fbgemm' in torch.backends.quantized.supported_engines:
+        torch.backends.quantized.engine = 'fbgemm'
+    model = torch.jit.load(str(path), map_location='cpu')
+    model.eval()
+    return model
+
+
+def load_serving_model(model_path):
+    """
+    按 INFERENCE_BACKEND 加载在线服务使用的模型
+    torch: PyTorch Unet；onnx: ONNX Runtime 会话（首次使用时导出并缓存）；
+    int8: 训练端量化得到的 INT8 TorchScript 模型（仅 CPU）
+    torch 后端在 MODEL_OPTIMIZE 开启时加载优化构建（多进程推理池需要原始权重，此时不使用）
+    加载完成后按 MODEL_WARMUP_RUNS 预热
+    """
+    from core import optimize
+
+    if config.INFERENCE_BACKEND == 'onnx':
+        from core.onnx_backend import load_onnx_model
+        model = load_onnx_model(model_path, num_threads=config.TORCH_NUM_THREADS)
+    elif config.INFERENCE_BACKEND == 'int8':
+        model = load_quantized(model_path)
+    elif config.MODEL_OPTIMIZE and not _use_worker_pool():
+        model = optimize.load_optimized(model_path)
+    else:
+        model = prepare_for_serving(load_model(model_path))
+    optimize.warm_up(model, runs=config.MODEL_WARMUP_RUNS)
+    return model
+
+
+def backend_tag():
+    """
+    实际使用的推理配置标识，参与模型ID计算
+    优化构建与 ROI 裁剪推理的输出均与原模型全图推理存在差异，需与其缓存结果区分
+    """
+    tag = config.INFERENCE_BACKEND
+    if tag == 'torch' and config.MODEL_OPTIMIZE and not _use_worker_pool():
+        tag = 'torch-opt'
+    if config.ROI_INFERENCE:
+        tag += f'+roi{config.ROI_MARGIN}'
+    return tag
+
+
+def _use_worker_pool():
+    return config.INFERENCE_WORKERS > 0 and not torch.cuda.is_available()
+
+
+def prepare_for_serving(model):
+    """
+    按配置包装用于在线服务的模型
+    INFERENCE_WORKERS > 0 且运行在 CPU 上时，使用共享权重的多进程推理池
+    """
+    if not isinstance(model, net.Unet):
+        return model
+    if _use_worker_pool():
+        from core.worker_pool import ProcessInferencePool
+        return ProcessInferencePool(
+            model,
+            num_workers=config.INFERENCE_WORKERS,
+            threads_per_worker=config.INFERENCE_WORKER_THREADS or None,
+            max_batch=config.BATCH_MAX_SIZE,
+            pin_cpus=config.INFERENCE_PIN_CPUS,
+        ).start()
+    return model
+
+
+def release(model):
+    """释放服务模型占用的资源（如推理进程）"""
+    stop = getattr(model, 'stop', None)
+    if callable(stop):
+        stop()
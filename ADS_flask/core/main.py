@@ -1,4 +1,5 @@
-from core import process, predict, get_feature
+from core import process, predict, get_feature, offload, encoding, heatmap, workspace
+import config
 import time
 import os
 import cv2
@@ -7,43 +8,61 @@ import numpy as np
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 
-def c_main(path, model, progress_callback=None):
+def c_main(path, model, progress_callback=None, in_memory=None, timings=None, pid=None):
     """
     主处理函数
     :param path: DCM文件路径
     :param model: 模型对象
     :param progress_callback: 进度回调函数 callback(percentage, message)
+    :param in_memory: 是否在内存中传递各阶段数据，默认取 config.PIPELINE_IN_MEMORY
+    :param timings: 可选字典，用于回传各阶段耗时（秒）
+    :param pid: 诊断标识 "<工作区ID>/<文件名>"，决定各产物的存放位置，默认取DCM文件名
     """
+    if in_memory is None:
+        in_memory = config.PIPELINE_IN_MEMORY
+    if timings is None:
+        timings = {}
+    
     print(f"\n{'='*60}")
-    print(f"[Main] 开始处理: {path}")
+    print(f"[Main] 开始处理: {path} ({'内存模式' if in_memory else '磁盘模式'})")
     start_time = time.time()
     
     def emit(pct, msg):
         if progress_callback:
             progress_callback(pct, msg)
         print(f"[Progress] {pct}% - {msg}")
+        # 各阶段之间让出 hub，使进度事件及时发出
+        offload.cooperative_yield()
     
     try:
         # 1. 预处理
         emit(20, '预处理图像...')
         print(f"[Main] Step 1/4: 预处理图像...")
         t1 = time.time()
-        image_data = process.pre_process(path)
-        print(f"[Main] ✅ 预处理完成 ({time.time()-t1:.2f}秒)")
+        # CPU 密集阶段均通过 offload.run_blocking 在原生线程执行，不阻塞 eventlet hub
+        image_array = offload.run_blocking(process.read_dicom, path) if in_memory else None
+        image_data = offload.run_blocking(process.pre_process, path, image_array, pid)
+        timings['pre_process'] = round(time.time() - t1, 4)
+        print(f"[Main] ✅ 预处理完成 ({timings['pre_process']:.2f}秒)")
         
         # 2. 模型预测
         emit(40, '模型推理中...')
         print(f"[Main] Step 2/4: 模型预测...")
         
         heatmap_generated = False
+        predict_result = None
         pid = image_data[1]
         
         if model is not None:
             t2 = time.time()
             predict_result = predict.predict(image_data, model)
-            if isinstance(predict_result, dict) and 'heatmap_path' in predict_result:
+            if isinstance(predict_result, dict) and 'prob_path' in predict_result:
                 heatmap_generated = True
-            print(f"[Main] ✅ 预测完成 ({time.time()-t2:.2f}秒)")
+            timings['predict'] = round(time.time() - t2, 4)
+            if isinstance(predict_result, dict) and 'inference_time' in predict_result:
+                # 仅 ROI 定位与模型前向，不含二值化与产物写入
+                timings['inference'] = round(predict_result['inference_time'], 4)
+            print(f"[Main] ✅ 预测完成 ({timings['predict']:.2f}秒)")
         else:
             # 强制使用不需要模拟数据
              raise RuntimeError("系统错误: AI诊断模型未加载，无法进行预测。")
@@ -53,8 +72,16 @@ def c_main(path, model, progress_callback=None):
         emit(70, '后处理生成轮廓...')
         print(f"[Main] Step 3/4: 后处理...")
         t3 = time.time()
-        process.last_process(image_data[1])
-        print(f"[Main] ✅ 后处理完成 ({time.time()-t3:.2f}秒)")
+        contours = external = None
+        if in_memory:
+            mask_array = predict_result['mask_array']
+            contours, external = offload.run_blocking(process.find_contours, mask_array)
+            offload.run_blocking(process.last_process, pid, image=process.to_preview(image_array),
+                                 mask=mask_array, contours=external)
+        else:
+            offload.run_blocking(process.last_process, image_data[1])
+        timings['last_process'] = round(time.time() - t3, 4)
+        print(f"[Main] ✅ 后处理完成 ({timings['last_process']:.2f}秒)")
         
         # 4. 特征提取
         emit(90, '提取特征数据...')
@@ -65,14 +92,21 @@ def c_main(path, model, progress_callback=None):
         if model is None:
              raise RuntimeError("AI模型未就绪")
              
-        image_info = get_feature.main(image_data[1])
-        print(f"[Main] ✅ 特征提取完成 ({time.time()-t4:.2f}秒)")
+        if in_memory:
+            image_info = offload.run_blocking(get_feature.main, pid, image_array=image_array,
+                                              mask_array=predict_result['mask_array'],
+                                              contours=contours)
+        else:
+            image_info = offload.run_blocking(get_feature.main, image_data[1])
+        timings['feature'] = round(time.time() - t4, 4)
+        print(f"[Main] ✅ 特征提取完成 ({timings['feature']:.2f}秒)")
         
         # 添加热力图标记
         if heatmap_generated:
             image_info['has_heatmap'] = True
         
         total_time = time.time() - start_time
+        timings['total'] = round(total_time, 4)
         print(f"[Main] 🎉 全部完成! 总耗时: {total_time:.2f}秒")
         print(f"{'='*60}\n")
         
@@ -85,5 +119,42 @@ def c_main(path, model, progress_callback=None):
         raise
 
 
+def threshold_pid(pid, threshold):
+    """重新二值化结果的标识：产物写入新文件名，不覆盖已按 immutable 缓存的旧图"""
+    return f'{pid}@{threshold:.2f}'
+
+
+def c_rethreshold(pid, threshold, timings=None):
+    """
+    使用已保存的概率图重新二值化，重新生成 mask、轮廓图与特征，不执行模型
+    :param pid: 诊断标识
+    :param threshold: 二值化阈值，按两位小数取整
+    :return: (结果 pid + '.png', image_info)，结果 pid 见 threshold_pid
+    """
+    threshold = round(threshold, 2)
+    t0 = time.time()
+    result_pid, image_info = offload.run_blocking(_rethreshold, pid, threshold)
+    if timings is not None:
+        timings['total'] = round(time.time() - t0, 4)
+    print(f"[Main] 重新二值化完成: {result_pid} (阈值 {threshold}, {time.time() - t0:.3f}秒)")
+    return result_pid + '.png', image_info
+
+
+def _rethreshold(pid, threshold):
+    prob = heatmap.load_prob(pid)
+    if prob is None:
+        raise FileNotFoundError('概率图不存在，请重新诊断')
+    result_pid = threshold_pid(pid, threshold)
+    mask_array = predict.binarize(prob, threshold)
+    encoding.write('mask', result_pid, mask_array)
+
+    image_array = process.read_dicom(str(workspace.artifact_path('ct', pid)))
+    contours, external = process.find_contours(mask_array)
+    process.last_process(result_pid, image=process.to_preview(image_array), mask=mask_array, contours=external)
+    image_info = get_feature.main(pid, image_array=image_array, mask_array=mask_array, contours=contours)
+    image_info['has_heatmap'] = True
+    return result_pid, image_info
+
+
 if __name__ == '__main__':
     pass
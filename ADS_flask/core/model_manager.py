@@ -0,0 +1,348 @@
+"""
+在线模型管理（热切换与多模型常驻）
+切换模型时在后台线程中加载并预热新模型，完成后在请求之间原子替换当前模型，请求不再因加载而停顿。
+每次诊断通过 acquire() 固定使用的模型与模型ID，替换前已开始的请求继续在旧模型上完成；
+上一个模型保留在内存中，可立即回滚；被挤出的更早模型在其请求全部结束后释放。
+
+除当前模型外，诊断请求可以按器官（系统设置 model_route_<器官>）或显式指定模型名称使用其他模型：
+这些模型在首次使用时加载，常驻内存的模型总大小受 MODEL_MEMORY_BUDGET_MB 限制，
+超出时按最近最少使用释放空闲的模型；当前模型与上一个模型始终常驻。
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import config
+from core import loader, offload
+from core.cache import model_fingerprint
+from core.singleflight import SingleFlight
+
+# 器官路由设置键前缀：model_route_<器官> = 模型名称
+ROUTE_PREFIX = 'model_route_'
+
+# 未配置路由时由当前模型处理的器官（用户权限的默认值）
+DEFAULT_ORGAN = 'rectum'
+
+
+class ModelSlot:
+    """一个已加载的模型"""
+
+    def __init__(self, name, path, model, model_id):
+        self.name = name
+        self.path = str(path)
+        self.model = model
+        self.model_id = model_id
+        self.active = 0  # 正在使用该模型的请求数
+        self.size = _model_bytes(model, path)
+        self.loaded_at = time.strftime('%Y-%m-%d %H:%M:%S')
+        self.last_used = None
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'path': self.path,
+            'model_id': self.model_id,
+            'active_requests': self.active,
+            'size_mb': round(self.size / (1024 * 1024), 2),
+            'loaded_at': self.loaded_at,
+            'last_used': self.last_used,
+        }
+
+
+def _model_bytes(model, path):
+    """模型占用内存估算：PyTorch 模型按参数与缓冲区大小，其他后端按权重文件大小"""
+    state_dict = getattr(model, 'state_dict', None)
+    if callable(state_dict):
+        try:
+            return sum(t.numel() * t.element_size() for t in state_dict().values())
+        except Exception:
+            pass
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class ModelSwitchInProgress(RuntimeError):
+    pass
+
+
+class ModelNotFound(LookupError):
+    pass
+
+
+class ModelManager:
+    """
+    :param app: Flask 应用，替换模型时同步更新 app.model / app.model_id
+    :param drain_timeout: 释放旧模型前等待其请求结束的最长时间（秒）
+    :param budget_mb: 常驻模型总大小上限（MB）
+    """
+
+    def __init__(self, app, drain_timeout=300, budget_mb=config.MODEL_MEMORY_BUDGET_MB):
+        self.app = app
+        self.drain_timeout = drain_timeout
+        self.budget = budget_mb * 1024 * 1024
+        self.current = None
+        self.previous = None
+        self.resident = OrderedDict()  # 按需加载的模型：名称 -> ModelSlot，按最近使用排序
+        self.routes = {}  # 器官 -> 模型名称
+        self._loads = SingleFlight()  # 同一模型的并发首次使用只加载一次
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self.status = {'state': 'idle', 'target': None, 'error': None, 'started_at': None, 'finished_at': None}
+        self.stats = {'hits': 0, 'loads': 0, 'evictions': 0}
+
+    # ==================== 使用 ====================
+
+    def install(self, name, path, model, model_id):
+        """启动时直接安装已加载的模型"""
+        self._swap(ModelSlot(name, path, model, model_id))
+
+    def resolve(self, model=None, organ=None):
+        """
+        确定请求使用的模型名称
+        :param model: 显式指定的模型名称，优先于器官路由
+        :param organ: 诊断器官，按 model_route_<器官> 设置选择模型
+        :return: 模型名称，None 表示使用当前模型
+        """
+        if model:
+            name = model
+        elif not organ or organ == DEFAULT_ORGAN:
+            name = self.routes.get(organ) if organ else None
+        else:
+            name = self.routes.get(organ)
+            if name is None:
+                raise ModelNotFound(f'未配置 {organ} 的诊断模型')
+        if name is not None:
+            with self._lock:
+                if self._lookup(name) is not None:
+                    return name
+            try:
+                exists = loader.model_file(name).exists()
+            except ValueError:
+                exists = False
+            if not exists:
+                raise ModelNotFound(f'模型不存在: {name}')
+        return name
+
+    @contextmanager
+    def acquire(self, name=None):
+        """
+        固定本次请求使用的模型，期间发生的切换不影响本请求
+        :param name: 模型名称，None 表示当前模型；未常驻的模型在此加载（阻塞本请求）
+        :return: ModelSlot，没有加载模型时为 None
+        """
+        slot = self._pin(name)
+        try:
+            yield slot
+        finally:
+            if slot is not None:
+                with self._lock:
+                    slot.active -= 1
+                    self._idle.notify_all()
+                    # 超出预算时因仍在使用而被跳过的常驻模型，在其最后一个请求结束后释放
+                    retired = self._evict() if slot.active == 0 and self._used() > self.budget else []
+                for old in retired:
+                    threading.Thread(target=self._retire, args=(old,),
+                                     name=f'model-release-{old.name}', daemon=True).start()
+
+    # ==================== 切换与回滚 ====================
+
+    def switch(self, name, path, on_ready=None):
+        """
+        在后台加载、预热并切换到新模型，立即返回
+        已常驻的模型直接切换，无需重新加载
+        :param on_ready: 切换完成后在应用上下文中调用 on_ready(slot)，如保存当前模型设置
+        """
+        with self._lock:
+            if self.status['state'] == 'loading':
+                raise ModelSwitchInProgress(f"模型 {self.status['target']} 正在加载，请稍后再试")
+            self.status = {'state': 'loading', 'target': name, 'error': None,
+                           'started_at': time.strftime('%Y-%m-%d %H:%M:%S'), 'finished_at': None}
+        threading.Thread(target=self._load, args=(name, path, on_ready),
+                         name=f'model-switch-{name}', daemon=True).start()
+        print(f"[Model] 开始后台加载模型: {name}")
+
+    def rollback(self):
+        """立即切回上一个模型，返回切换后的当前模型"""
+        with self._lock:
+            if self.previous is None:
+                raise ValueError('没有可回滚的模型')
+            self.current, self.previous = self.previous, self.current
+            self._publish(self.current)
+            slot = self.current
+        print(f"[Model] 已回滚到模型: {slot.name}")
+        return slot
+
+    def unload(self, name):
+        """释放按需加载的常驻模型（如删除模型文件前），返回是否释放"""
+        with self._lock:
+            slot = self.resident.pop(name, None)
+        if slot is None:
+            return False
+        self._retire(slot)
+        return True
+
+    def in_use(self, name):
+        """模型是否为当前模型或上一个模型"""
+        with self._lock:
+            return any(slot is not None and slot.name == name for slot in (self.current, self.previous))
+
+    def load_settings(self):
+        """从系统设置读取器官路由（需在应用上下文中调用）"""
+        from models import SystemSetting
+
+        rows = SystemSetting.query.filter(SystemSetting.key.like(f'{ROUTE_PREFIX}%')).all()
+        self.routes = {row.key[len(ROUTE_PREFIX):]: row.value for row in rows if row.value}
+        print(f"[Model] 器官模型路由: {self.routes or '无'}")
+
+    def info(self):
+        with self._lock:
+            return {
+                'current': self.current.to_dict() if self.current else None,
+                'previous': self.previous.to_dict() if self.previous else None,
+                'resident': [slot.to_dict() for slot in self.resident.values()],
+                'routes': dict(self.routes),
+                'budget_mb': round(self.budget / (1024 * 1024), 2),
+                'used_mb': round(self._used() / (1024 * 1024), 2),
+                'stats': dict(self.stats),
+                'switch': dict(self.status),
+            }
+
+    # ==================== 内部方法 ====================
+
+    def _lookup(self, name):
+        """已加载的模型，需持有锁"""
+        if name is None:
+            return self.current
+        for slot in (self.current, self.previous):
+            if slot is not None and slot.name == name:
+                return slot
+        slot = self.resident.get(name)
+        if slot is not None:
+            self.resident.move_to_end(name)
+        return slot
+
+    def _pin(self, name):
+        """取得模型并增加其请求计数，未加载时按需加载"""
+        with self._lock:
+            slot = self._lookup(name)
+            if slot is not None:
+                slot.active += 1
+                slot.last_used = time.strftime('%Y-%m-%d %H:%M:%S')
+                if name is not None:
+                    self.stats['hits'] += 1
+                return slot
+            if name is None:
+                return None
+
+        slot, _ = self._loads.do(('model', name), lambda progress: self._load_resident(name))
+        with self._lock:
+            # 加载期间可能已被淘汰或切换为当前模型，以最新状态为准
+            pinned = self._lookup(name) or slot
+            pinned.active += 1
+            pinned.last_used = time.strftime('%Y-%m-%d %H:%M:%S')
+            if pinned is slot and name not in self.resident and not self._is_primary(slot):
+                self.resident[name] = slot
+            retired = self._evict()
+        for old in retired:
+            self._retire(old)
+        return pinned
+
+    def _load_resident(self, name):
+        path = loader.model_file(name)
+        if not path.exists():
+            raise ModelNotFound(f'模型不存在: {name}')
+        t0 = time.time()
+        model = offload.run_blocking(loader.load_serving_model, path)
+        slot = ModelSlot(name, path, model, model_fingerprint(name, path, loader.backend_tag()))
+        with self._lock:
+            self.stats['loads'] += 1
+        print(f"[Model] 按需加载模型: {name} ({slot.size / 1024 / 1024:.1f}MB, {time.time() - t0:.2f}秒)")
+        return slot
+
+    def _is_primary(self, slot):
+        return slot is self.current or slot is self.previous
+
+    def _used(self):
+        slots = [self.current, self.previous, *self.resident.values()]
+        return sum(slot.size for slot in slots if slot is not None)
+
+    def _evict(self):
+        """超出预算时按 LRU 移出空闲的常驻模型，需持有锁，返回待释放的模型"""
+        retired = []
+        for name in list(self.resident):
+            if self._used() <= self.budget:
+                break
+            slot = self.resident[name]
+            if slot.active > 0:
+                continue
+            del self.resident[name]
+            self.stats['evictions'] += 1
+            retired.append(slot)
+            print(f"[Model] 超出内存预算，释放模型: {name}")
+        return retired
+
+    def _load(self, name, path, on_ready):
+        t0 = time.time()
+        with self._lock:
+            # 已常驻（含上一个模型）时直接切换
+            slot = self.resident.pop(name, None)
+            if slot is None and self.previous is not None and self.previous.name == name:
+                slot = self.previous
+        try:
+            if slot is None:
+                # 加载与预热是 CPU 密集操作，在原生线程中执行
+                model = offload.run_blocking(loader.load_serving_model, path)
+                slot = ModelSlot(name, path, model, model_fingerprint(name, path, loader.backend_tag()))
+        except Exception as e:
+            with self._lock:
+                self.status.update(state='failed', error=str(e), finished_at=time.strftime('%Y-%m-%d %H:%M:%S'))
+            print(f"[Model] ❌ 模型加载失败: {name} ({e})")
+            return
+
+        self._swap(slot)
+        with self._lock:
+            self.status.update(state='ready', finished_at=time.strftime('%Y-%m-%d %H:%M:%S'),
+                               elapsed=round(time.time() - t0, 2))
+        print(f"[Model] ✅ 已切换到模型: {name} (加载预热 {time.time() - t0:.2f}秒)")
+
+        if on_ready is not None:
+            try:
+                with self.app.app_context():
+                    on_ready(slot)
+            except Exception as e:
+                print(f"[Model] 切换后回调失败: {e}")
+
+    def _swap(self, slot):
+        with self._lock:
+            demoted = self.previous
+            self.previous = self.current
+            self.current = slot
+            self._publish(slot)
+            retired = []
+            if demoted is not None and demoted is not slot:
+                # 被挤出的模型预算允许时继续常驻，供按名称或器官路由的请求使用
+                self.resident[demoted.name] = demoted
+                retired = self._evict()
+        for old in retired:
+            self._retire(old)
+
+    def _publish(self, slot):
+        # 兼容直接读取 app.model / app.model_id 的代码（健康检查等）
+        self.app.model = slot.model
+        self.app.model_id = slot.model_id
+
+    def _retire(self, slot):
+        """等待旧模型上的请求结束后释放其资源"""
+        deadline = time.time() + self.drain_timeout
+        with self._lock:
+            while slot.active > 0 and time.time() < deadline:
+                self._idle.wait(1.0)
+            remaining = slot.active
+        if remaining:
+            print(f"[Model] ⚠️ 模型 {slot.name} 仍有 {remaining} 个请求未结束，强制释放")
+        loader.release(slot.model)
+        print(f"[Model] 已释放模型: {slot.name}")
@@ -0,0 +1,301 @@
+"""
+模型分块上传与后台校验
+- 上传会话：客户端按偏移量逐块 PUT，数据直接追加写入暂存文件并增量计算 SHA-256，内存中只保留一个读缓冲区；
+  中断后查询会话得到已接收的字节数，从该偏移继续上传（服务重启后由暂存文件恢复进度）
+- 全部接收后核对大小与校验和，提交后台任务：在独立进程（python -m core.model_upload <文件>）中构建 UNet 并加载权重，
+  服务进程不加载上传的权重；校验通过后移入模型目录（连同生成的映射权重），结果通过任务状态返回
+"""
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import config
+from core import weights
+from core.loader import MODELS_DIR
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# 暂存目录（模型目录下，校验通过后同盘 rename）
+STAGING_DIR = MODELS_DIR / '.uploads'
+
+_READ_SIZE = 1024 * 1024
+
+
+class UploadError(ValueError):
+    """上传请求不合法"""
+
+
+class OffsetMismatch(UploadError):
+    """分块偏移与已接收的字节数不一致，客户端应从 received 处继续"""
+
+    def __init__(self, received):
+        super().__init__(f'分块偏移不正确，应从 {received} 字节处继续上传')
+        self.received = received
+
+
+class UploadSession:
+    """一次分块上传"""
+
+    def __init__(self, upload_id, model_name, size, sha256=None, username=None):
+        self.id = upload_id
+        self.model_name = model_name
+        self.size = size
+        self.sha256 = sha256.lower() if sha256 else None
+        self.username = username
+        self.received = 0
+        self.status = 'uploading'  # uploading/validating/done/failed
+        self.job_id = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self._hasher = hashlib.sha256()
+        self._lock = threading.Lock()
+
+    @property
+    def part_path(self):
+        return STAGING_DIR / f'{self.id}.part'
+
+    @property
+    def meta_path(self):
+        return STAGING_DIR / f'{self.id}.json'
+
+    def to_dict(self):
+        return {
+            'upload_id': self.id,
+            'model_name': self.model_name,
+            'size': self.size,
+            'received': self.received,
+            'sha256': self.sha256,
+            'status': self.status,
+            'job_id': self.job_id,
+            'chunk_size': config.MODEL_UPLOAD_CHUNK_MB * 1024 * 1024,
+            'created_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.created_at)),
+        }
+
+    def save_meta(self):
+        meta = {'model_name': self.model_name, 'size': self.size, 'sha256': self.sha256,
+                'username': self.username, 'created_at': self.created_at}
+        self.meta_path.write_text(json.dumps(meta), encoding='utf-8')
+
+    @classmethod
+    def restore(cls, upload_id):
+        """由暂存文件恢复会话（服务重启后继续上传），重新计算已接收部分的校验和"""
+        meta = json.loads((STAGING_DIR / f'{upload_id}.json').read_text(encoding='utf-8'))
+        session = cls(upload_id, meta['model_name'], meta['size'], meta['sha256'], meta['username'])
+        session.created_at = meta['created_at']
+        session.rehash()
+        return session
+
+    def rehash(self):
+        """按暂存文件重新计算已接收的字节数与校验和"""
+        self._hasher = hashlib.sha256()
+        self.received = 0
+        if self.part_path.exists():
+            with open(self.part_path, 'rb') as f:
+                for block in iter(lambda: f.read(_READ_SIZE), b''):
+                    self._hasher.update(block)
+                    self.received += len(block)
+            self.updated_at = self.part_path.stat().st_mtime
+
+    def write(self, offset, stream, length=None):
+        """
+        从 stream 追加写入一块数据
+        :param offset: 本块在文件中的起始偏移，必须等于已接收的字节数
+        :param length: 本块长度（Content-Length），None 表示读到流结束
+        :return: 写入后已接收的字节数
+        """
+        with self._lock:
+            if self.status != 'uploading':
+                raise UploadError('上传已完成，不能继续写入')
+            if offset != self.received:
+                raise OffsetMismatch(self.received)
+            limit = config.MODEL_UPLOAD_CHUNK_MB * 1024 * 1024
+            if length is not None and length > limit:
+                raise UploadError(f'分块过大，单块不能超过 {config.MODEL_UPLOAD_CHUNK_MB}MB')
+
+            # 连接中断时已写入的部分仍计入进度，客户端从 received 处继续
+            written = 0
+            try:
+                with open(self.part_path, 'ab') as f:
+                    while True:
+                        want = _READ_SIZE if length is None else min(_READ_SIZE, length - written)
+                        if want <= 0:
+                            break
+                        block = stream.read(want)
+                        if not block:
+                            break
+                        if self.received + written + len(block) > self.size or written + len(block) > limit:
+                            raise UploadError('上传数据超过声明的文件大小或单块上限')
+                        f.write(block)
+                        self._hasher.update(block)
+                        written += len(block)
+            finally:
+                self.received += written
+                self.updated_at = time.time()
+            return self.received
+
+    def finish(self):
+        """核对大小与校验和，返回实际的 SHA-256"""
+        with self._lock:
+            if self.received != self.size:
+                raise UploadError(f'文件尚未上传完整 ({self.received}/{self.size})')
+            digest = self._hasher.hexdigest()
+            if self.sha256 and digest != self.sha256:
+                # 清空已接收的数据，客户端从 0 重新上传
+                open(self.part_path, 'wb').close()
+                self.rehash()
+                raise UploadError('校验和不一致，文件在传输中损坏，请重新上传')
+            self.status = 'validating'
+            return digest
+
+
+class ModelUploads:
+    """上传会话管理，过期未完成的会话由 sweep() 清理"""
+
+    def __init__(self, max_age=24 * 3600):
+        self.max_age = max_age
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def create(self, model_name, size, sha256=None, username=None):
+        model_name = (model_name or '').strip()
+        if not re.fullmatch(r'[\w\-]+', model_name or ''):
+            raise UploadError('模型名称只能包含字母、数字、下划线和连字符')
+        if not isinstance(size, int) or size <= 0:
+            raise UploadError('请提供文件大小')
+        if size > config.MODEL_UPLOAD_MAX_MB * 1024 * 1024:
+            raise UploadError(f'模型文件不能超过 {config.MODEL_UPLOAD_MAX_MB}MB')
+        if sha256 and not re.fullmatch(r'[0-9a-fA-F]{64}', sha256):
+            raise UploadError('无效的 SHA-256 校验和')
+
+        STAGING_DIR.mkdir(parents=True, exist_ok=True)
+        session = UploadSession(uuid.uuid4().hex, model_name, size, sha256, username)
+        session.part_path.touch()
+        session.save_meta()
+        with self._lock:
+            self._sessions[session.id] = session
+        self.sweep()
+        return session
+
+    def create_from_file(self, model_name, path, username=None):
+        """以已完整保存的文件创建会话（整文件上传接口使用），文件移入暂存目录"""
+        session = self.create(model_name, os.path.getsize(path), None, username)
+        os.replace(path, session.part_path)
+        session.rehash()
+        return session
+
+    def install(self, session):
+        """
+        校验通过后把暂存文件移入模型目录，同名模型已存在时添加时间戳
+        :return: 模型文件路径
+        """
+        MODELS_DIR.mkdir(parents=True, exist_ok=True)
+        target = MODELS_DIR / f'{session.model_name}.pth'
+        if target.exists():
+            target = MODELS_DIR / f"{session.model_name}_{time.strftime('%Y%m%d_%H%M%S')}.pth"
+        os.replace(session.part_path, target)
+        # 校验进程同时生成的映射权重随模型一起移入（晚于 .pth 写入，仍视为最新）
+        mapped = weights.weights_path(session.part_path)
+        if mapped.exists():
+            os.replace(mapped, weights.weights_path(target))
+        session.meta_path.unlink()
+        session.status = 'done'
+        session.updated_at = time.time()
+        return target
+
+    def get(self, upload_id):
+        """查找会话，内存中没有时从暂存文件恢复；不存在返回 None"""
+        if not re.fullmatch(r'[0-9a-f]{32}', upload_id or ''):
+            return None
+        with self._lock:
+            session = self._sessions.get(upload_id)
+            if session is None and (STAGING_DIR / f'{upload_id}.json').exists():
+                session = self._sessions[upload_id] = UploadSession.restore(upload_id)
+            return session
+
+    def discard(self, session, forget=True):
+        """
+        删除会话的暂存文件
+        :param forget: 同时移除会话；校验失败时保留会话，供查询失败原因
+        """
+        if forget:
+            with self._lock:
+                self._sessions.pop(session.id, None)
+        for path in (session.part_path, session.meta_path, weights.weights_path(session.part_path)):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def sweep(self):
+        """清理超过 max_age 仍未完成的上传"""
+        deadline = time.time() - self.max_age
+        with self._lock:
+            for upload_id, session in list(self._sessions.items()):
+                if session.status in ('done', 'failed') and session.updated_at < deadline:
+                    del self._sessions[upload_id]
+        if not STAGING_DIR.exists():
+            return
+        for meta_path in STAGING_DIR.glob('*.json'):
+            try:
+                if meta_path.stat().st_mtime >= deadline:
+                    continue
+            except FileNotFoundError:
+                continue
+            session = self.get(meta_path.stem)
+            if session is not None and session.status == 'uploading' and session.updated_at < deadline:
+                print(f"[ModelUpload] 清理过期的上传: {session.id} ({session.model_name})")
+                self.discard(session)
+
+
+def validate_in_subprocess(path, timeout=None):
+    """
+    在独立进程中加载模型权重进行校验（不占用服务进程的内存与 GIL）
+    :return: 校验结果 dict，失败时抛出 ValueError
+    """
+    timeout = timeout or config.MODEL_VALIDATE_TIMEOUT
+    try:
+        proc = subprocess.run(
+            [sys.executable, '-m', 'core.model_upload', str(path)],
+            cwd=str(BASE_DIR), stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout
+        )
+    except subprocess.TimeoutExpired:
+        raise ValueError(f'模型校验超时 ({timeout}秒)')
+    lines = proc.stdout.decode('utf-8', 'replace').strip().splitlines()
+    try:
+        result = json.loads(lines[-1])
+    except (IndexError, ValueError):
+        err = proc.stderr.decode('utf-8', 'replace').strip().splitlines()
+        raise ValueError(f"模型校验进程异常退出: {err[-1] if err else proc.returncode}")
+    if not result.get('ok'):
+        raise ValueError(result.get('error') or '模型文件无效')
+    return result
+
+
+def _check_main(path):
+    """校验进程：构建 UNet 并严格加载权重，MMAP_WEIGHTS 开启时同时生成映射权重，输出一行 JSON 结果"""
+    try:
+        import torch
+        import core.net.unet as net
+
+        torch.set_num_threads(1)
+        model = net.Unet(1, 1)
+        state_dict = torch.load(path, map_location='cpu')
+        model.load_state_dict(state_dict)
+        params = sum(t.numel() for t in model.state_dict().values())
+        if config.MMAP_WEIGHTS:
+            weights.save(state_dict, weights.weights_path(path), metadata={'format': 'pt'})
+        result = {'ok': True, 'tensors': len(state_dict), 'parameters': params}
+    except Exception as e:
+        result = {'ok': False, 'error': str(e).strip().splitlines()[0] if str(e).strip() else type(e).__name__}
+    print(json.dumps(result), flush=True)
+
+
+if __name__ == '__main__':
+    _check_main(sys.argv[1])
@@ -106,5 +106,5 @@ class Unet(nn.Module):
         merge9=torch.cat([up_9, c1_att],dim=1)
         c9=self.conv9(merge9)
         c10=self.conv10(c9)
-        out = nn.Sigmoid()(c10)
+        out = torch.sigmoid(c10)
         return out
@@ -0,0 +1,139 @@
+"""
+CPU 密集任务卸载
+app.py 调用了 eventlet.monkey_patch()，任务线程都是协程，直接在其中运行 OpenCV / SimpleITK / torch
+会阻塞 eventlet hub，导致其他请求与 Socket.IO 心跳停顿。
+这里把这类调用放到 eventlet 原生线程池 (tpool) 中执行，前后主动让出 hub。
+未启用 eventlet（如命令行或测试环境）时直接在当前线程调用。
+"""
+import os
+
+import torch
+
+try:
+    import eventlet
+    from eventlet import patcher, tpool
+except ImportError:
+    eventlet = None
+
+
+def hub_patched():
+    """是否运行在 monkey_patch 后的 eventlet 环境中"""
+    return eventlet is not None and patcher.is_monkey_patched('thread')
+
+
+def cooperative_yield():
+    """主动让出 eventlet hub，使其他协程得以运行"""
+    if hub_patched():
+        eventlet.sleep(0)
+
+
+def run_blocking(fn, *args, **kwargs):
+    """
+    在原生线程中执行 CPU 密集函数并等待结果
+    注意：fn 内部不能使用协程同步原语（被 patch 的 Lock/Queue/Future 等），
+    这类调用应保持在协程中，由其内部自行卸载计算部分
+    """
+    if not hub_patched():
+        return fn(*args, **kwargs)
+    eventlet.sleep(0)
+    try:
+        return tpool.execute(fn, *args, **kwargs)
+    finally:
+        eventlet.sleep(0)
+
+
+def call_model(model, x):
+    """
+    执行模型前向
+    微批服务、多进程推理池等自身不阻塞 hub 的包装器带有 cooperative = True，直接在协程中调用
+    """
+    if getattr(model, 'cooperative', False):
+        return model(x)
+    return run_blocking(_forward, model, x)
+
+
+def _forward(model, x):
+    # no_grad 是线程局部状态，需要在执行前向的线程内设置
+    with torch.no_grad():
+        return model(x)
+
+
+# ==================== 原生线程池 ====================
+
+# 未被 monkey_patch 的 threading / queue 模块，供原生线程之间同步使用
+if eventlet is not None:
+    native_threading = patcher.original('threading')
+    native_queue = patcher.original('queue')
+else:
+    import threading as native_threading
+    import queue as native_queue
+
+
+class NativeTask:
+    """NativePool 任务句柄，result() 在原生线程中阻塞等待"""
+
+    def __init__(self, fn, args, kwargs):
+        self._call = (fn, args, kwargs)
+        self._done = native_threading.Event()
+        self._value = None
+        self._error = None
+
+    def _run(self):
+        fn, args, kwargs = self._call
+        try:
+            self._value = fn(*args, **kwargs)
+        except BaseException as e:
+            self._error = e
+        finally:
+            self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise TimeoutError('任务未在限定时间内完成')
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+
+class NativePool:
+    """
+    由原生线程组成的后台线程池
+    monkey_patch 后 concurrent.futures 的线程与 Future 都变成协程对象，不能在 tpool 线程中等待，
+    这里与 tpool 相同，直接使用未被 patch 的 threading / queue。
+    在协程中等待任务应通过 run_blocking(task.result)
+    """
+
+    def __init__(self, workers, name='native', nice=0):
+        self.workers = max(1, workers)
+        self.name = name
+        self.nice = nice  # 工作线程的 nice 增量（Linux 下按线程生效），用于低优先级的后台计算
+        self._tasks = native_queue.Queue()
+        self._threads = []
+        self._lock = native_threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        self._ensure_started()
+        task = NativeTask(fn, args, kwargs)
+        self._tasks.put(task)
+        return task
+
+    def _ensure_started(self):
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = native_threading.Thread(target=self._worker, name=f'{self.name}-{len(self._threads)}',
+                                           daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _worker(self):
+        if self.nice and hasattr(os, 'setpriority'):
+            try:
+                os.setpriority(os.PRIO_PROCESS, native_threading.get_native_id(),
+                               os.getpriority(os.PRIO_PROCESS, 0) + self.nice)
+            except OSError as e:
+                print(f"[Offload] 无法降低线程优先级: {e}")
+        while True:
+            self._tasks.get()._run()
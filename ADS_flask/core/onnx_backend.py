@@ -0,0 +1,149 @@
+"""
+ONNX Runtime 推理后端
+把 .pth 权重导出为 ONNX（与 ADS_tensorRT/to_oonx.py 相同的网络），由 ONNX Runtime 执行；
+图优化后的模型缓存到磁盘，下次启动直接加载，无需再 torch.load 权重。
+优化结果可能包含与当前 CPU 相关的算子布局，缓存目录不应在不同机器间共享。
+
+命令行导出并做一致性校验：
+    python -m core.onnx_backend core/net/model.pth
+"""
+import hashlib
+import inspect
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+import torch
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None  # 未安装 onnxruntime 时只能使用 PyTorch 后端
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+ONNX_CACHE_DIR = BASE_DIR / 'core' / 'net' / 'onnx'
+
+# 与 PyTorch 输出允许的最大绝对误差（sigmoid 概率）
+PARITY_ATOL = 1e-3
+
+
+def _cache_paths(model_path):
+    """按权重文件的 路径+大小+修改时间 生成缓存文件名，权重变化后自动重新导出"""
+    model_path = Path(model_path)
+    stat = model_path.stat()
+    tag = hashlib.sha1(f'{model_path.resolve()}|{stat.st_size}|{stat.st_mtime_ns}'.encode()).hexdigest()[:10]
+    base = f'{model_path.stem}.{tag}'
+    return ONNX_CACHE_DIR / f'{base}.onnx', ONNX_CACHE_DIR / f'{base}.opt.onnx'
+
+
+def export_onnx(model, onnx_path, image_size=512):
+    """导出 ONNX，batch 与空间尺寸均为动态维度"""
+    onnx_path = Path(onnx_path)
+    onnx_path.parent.mkdir(parents=True, exist_ok=True)
+    model = model.to('cpu').eval()
+    dummy = torch.zeros(1, 1, image_size, image_size)
+    kwargs = {}
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        kwargs['dynamo'] = False
+    tmp_path = onnx_path.with_suffix('.tmp')
+    torch.onnx.export(
+        model, dummy, str(tmp_path),
+        input_names=['input'], output_names=['output'],
+        dynamic_axes={'input': {0: 'batch', 2: 'height', 3: 'width'},
+                      'output': {0: 'batch', 2: 'height', 3: 'width'}},
+        opset_version=13, **kwargs
+    )
+    os.replace(tmp_path, onnx_path)
+    print(f"[ONNX] 已导出: {onnx_path}")
+    return onnx_path
+
+
+class OnnxModel:
+    """
+    ONNX Runtime 会话包装，调用方式与 PyTorch 模型一致：y = model(x)
+    :param onnx_path: 原始 ONNX 文件
+    :param optimized_path: 图优化后模型的缓存路径，存在时直接加载
+    :param num_threads: intra-op 线程数
+    """
+
+    def __init__(self, onnx_path, optimized_path=None, num_threads=None):
+        if ort is None:
+            raise RuntimeError('未安装 onnxruntime，无法使用 ONNX 推理后端')
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+
+        if optimized_path and Path(optimized_path).exists():
+            # 已缓存的模型已经完成图优化，跳过重复优化以加快启动
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+            source = optimized_path
+        else:
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            if optimized_path:
+                options.optimized_model_filepath = str(optimized_path)
+            source = onnx_path
+
+        self.path = str(source)
+        self.session = ort.InferenceSession(self.path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        print(f"[ONNX] 会话已创建: {self.path}")
+
+    def eval(self):
+        return self
+
+    def __call__(self, x):
+        array = x.detach().cpu().numpy().astype(np.float32, copy=False)
+        y = self.session.run(None, {self.input_name: array})[0]
+        return torch.from_numpy(y)
+
+
+def check_parity(torch_model, onnx_model, image_size=512, atol=PARITY_ATOL, seed=0):
+    """
+    用同一随机输入比较 PyTorch 与 ONNX Runtime 输出
+    :return: 最大绝对误差，超过 atol 时抛出 RuntimeError
+    """
+    generator = torch.Generator().manual_seed(seed)
+    x = torch.rand(1, 1, image_size, image_size, generator=generator)
+    with torch.no_grad():
+        expected = torch_model.to('cpu').eval()(x)
+    actual = onnx_model(x)
+    max_diff = float((expected - actual).abs().max())
+    print(f"[ONNX] 一致性校验: 最大误差 {max_diff:.2e} (阈值 {atol:.0e})")
+    if max_diff > atol:
+        raise RuntimeError(f'ONNX 输出与 PyTorch 不一致: 最大误差 {max_diff:.2e}')
+    return max_diff
+
+
+def load_onnx_model(model_path, num_threads=None):
+    """
+    加载 .pth 对应的 ONNX 模型：缓存不存在时先导出并校验一致性
+    导出与图优化先写入临时文件，一致性校验通过后才改为缓存文件名，
+    进程在校验前中断时不会留下未经校验的缓存
+    """
+    onnx_path, optimized_path = _cache_paths(model_path)
+    if onnx_path.exists():
+        return OnnxModel(onnx_path, optimized_path, num_threads)
+
+    from core import loader
+    torch_model = loader.load_model(model_path)
+    staging = [path.with_name(f'{path.stem}.{os.getpid()}.tmp.onnx') for path in (onnx_path, optimized_path)]
+    try:
+        export_onnx(torch_model, staging[0])
+        onnx_model = OnnxModel(staging[0], staging[1], num_threads)
+        check_parity(torch_model, onnx_model)
+        # 原始 ONNX 是缓存是否存在的标志，最后改名
+        os.replace(staging[1], optimized_path)
+        os.replace(staging[0], onnx_path)
+    finally:
+        for path in staging:
+            if path.exists():
+                path.unlink()
+    onnx_model.path = str(optimized_path)
+    return onnx_model
+
+
+if __name__ == '__main__':
+    target = sys.argv[1] if len(sys.argv) > 1 else str(BASE_DIR / 'core' / 'net' / 'model.pth')
+    load_onnx_model(target)
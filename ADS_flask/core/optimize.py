@@ -0,0 +1,122 @@
+"""
+推理优化模型构建
+- 将 DoubleConv / AttentionGate 中的 Conv+BatchNorm 折叠为单个卷积
+- 使用 channels-last 内存布局
+- 导出为冻结的 TorchScript，缓存为 <model>.opt.pt，权重更新后自动重建
+
+命令行构建：
+    python -m core.optimize core/net/model.pth
+"""
+import copy
+import os
+import sys
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+import core.net.unet as net
+
+# 优化模型与原模型输出允许的最大绝对误差
+PARITY_ATOL = 1e-4
+
+
+def optimized_path(model_path):
+    return Path(model_path).with_suffix('.opt.pt')
+
+
+def _fuse_sequential(seq):
+    """把 Sequential 中相邻的 Conv2d + BatchNorm2d 折叠，BN 位置替换为 Identity"""
+    for i in range(len(seq) - 1):
+        if isinstance(seq[i], nn.Conv2d) and isinstance(seq[i + 1], nn.BatchNorm2d):
+            seq[i] = fuse_conv_bn_eval(seq[i], seq[i + 1])
+            seq[i + 1] = nn.Identity()
+
+
+def fuse_conv_bn(model):
+    """返回折叠了全部 Conv+BN 的模型副本（需处于 eval 模式）"""
+    model = copy.deepcopy(model).eval()
+    for module in model.modules():
+        if isinstance(module, net.DoubleConv):
+            _fuse_sequential(module.conv)
+        elif isinstance(module, net.AttentionGate):
+            for seq in (module.W_g, module.W_x, module.psi):
+                _fuse_sequential(seq)
+    return model
+
+
+class _ChannelsLast(nn.Module):
+    """在入口处把输入转换为 channels-last，使整个网络都在该布局下计算"""
+
+    def __init__(self, model):
+        super(_ChannelsLast, self).__init__()
+        self.model = model
+
+    def forward(self, x):
+        return self.model(x.contiguous(memory_format=torch.channels_last)).contiguous()
+
+
+def build_optimized(model, image_size=512):
+    """构建冻结的 TorchScript 推理模型"""
+    device = next(model.parameters()).device
+    fused = fuse_conv_bn(model).to(memory_format=torch.channels_last)
+    example = torch.zeros(1, 1, image_size, image_size, device=device)
+    with torch.no_grad():
+        traced = torch.jit.trace(_ChannelsLast(fused).eval(), example)
+    return torch.jit.freeze(traced.eval())
+
+
+def check_parity(reference, optimized, image_size=512, atol=PARITY_ATOL, seed=0):
+    """比较优化前后的输出，误差超过 atol 时抛出 RuntimeError"""
+    device = next(reference.parameters()).device
+    generator = torch.Generator().manual_seed(seed)
+    x = torch.rand(1, 1, image_size, image_size, generator=generator).to(device)
+    with torch.no_grad():
+        max_diff = float((reference(x) - optimized(x)).abs().max())
+    print(f"[Optimize] 一致性校验: 最大误差 {max_diff:.2e} (阈值 {atol:.0e})")
+    if max_diff > atol:
+        raise RuntimeError(f'优化模型输出与原模型不一致: 最大误差 {max_diff:.2e}')
+    return max_diff
+
+
+def load_optimized(model_path):
+    """
+    加载优化模型：缓存存在且不早于 .pth 时直接加载，否则重新构建并校验
+    """
+    from core import loader
+
+    model_path = Path(model_path)
+    opt_path = optimized_path(model_path)
+    device = loader.get_device()
+
+    if opt_path.exists() and opt_path.stat().st_mtime >= model_path.stat().st_mtime:
+        model = torch.jit.load(str(opt_path), map_location=device)
+        print(f"[Optimize] 已加载优化模型: {opt_path}")
+        return model.eval()
+
+    reference = loader.load_model(model_path)
+    model = build_optimized(reference)
+    check_parity(reference, model)
+    tmp_path = opt_path.with_suffix('.tmp')
+    torch.jit.save(model, str(tmp_path))
+    os.replace(tmp_path, opt_path)
+    print(f"[Optimize] 已构建优化模型: {opt_path}")
+    return model
+
+
+def warm_up(model, runs=1, image_size=512):
+    """启动预热：触发 TorchScript 图优化与内存分配，避免首个请求变慢"""
+    if runs <= 0:
+        return
+    from core import loader
+    x = torch.zeros(1, 1, image_size, image_size, device=loader.get_device())
+    with torch.no_grad():
+        for _ in range(runs):
+            model(x)
+    print(f"[Optimize] 模型预热完成 ({runs} 次)")
+
+
+if __name__ == '__main__':
+    target = sys.argv[1] if len(sys.argv) > 1 else str(Path(__file__).resolve().parent / 'net' / 'model.pth')
+    load_optimized(target)
@@ -2,22 +2,96 @@
 CT图像预测模块
 纯函数设计，避免全局变量，确保线程安全
 """
+import time
 from pathlib import Path
-import cv2
 import torch
 import numpy as np
 
+import config
+from core import encoding, heatmap, offload, roi
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 # CUDA 和线程配置
 import os
 os.environ["CUDA_VISIBLE_DEVICES"] = "0"
-torch.set_num_threads(4)
+torch.set_num_threads(config.TORCH_NUM_THREADS)
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 torch.cuda.empty_cache()
 
-# 二值化阈值
+# 二值化阈值：默认值，启动及修改设置后由系统设置 analysis_confidence_threshold 覆盖
 THRESHOLD = 0.5
+THRESHOLD_SETTING = 'analysis_confidence_threshold'
+threshold = THRESHOLD
+
+
+def parse_threshold(value):
+    """解析阈值，不在 (0, 1) 内时抛出 ValueError"""
+    value = float(value)
+    if not 0 < value < 1:
+        raise ValueError(f'阈值应在 0-1 之间: {value}')
+    return value
+
+
+def load_settings():
+    """从系统设置读取二值化阈值（需在应用上下文中调用）"""
+    global threshold
+    from models import SystemSetting
+
+    setting = SystemSetting.query.filter_by(key=THRESHOLD_SETTING).first()
+    try:
+        threshold = parse_threshold(setting.value) if setting and setting.value else THRESHOLD
+    except ValueError as e:
+        print(f"[Predict] ⚠️ 阈值设置无效，使用默认值 {THRESHOLD}: {e}")
+        threshold = THRESHOLD
+    print(f"[Predict] 二值化阈值: {threshold}")
+
+
+def binarize(img_y, value=None):
+    """
+    概率图二值化，返回 0/255 的 uint8 mask
+    :param value: 阈值，默认使用当前设置
+    """
+    if value is None:
+        value = threshold
+    # 根据输出范围选择二值化方式
+    if float(img_y.max()) <= 1.0:
+        bin_mask = (img_y >= value).astype('uint8')
+    else:
+        bin_mask = (img_y != 0).astype('uint8')
+    # 将二值掩码扩展到0-255
+    return (bin_mask * 255).astype('uint8')
+
+
+def _post_process(y, file_name):
+    """概率图二值化，写出 mask 与概率图（热力图在首次访问时由概率图渲染）"""
+    # 打印输出统计信息
+    y_min = float(y.min().cpu().numpy())
+    y_max = float(y.max().cpu().numpy())
+    print(f"[Predict] 输出范围: min={y_min}, max={y_max}")
+
+    print(f"[Predict] 后处理中...")
+    img_y = torch.squeeze(y).cpu().numpy()
+    mask_array = binarize(img_y)
+
+    # 打印唯一值以确认是否有正例
+    unique_vals = np.unique(mask_array)
+    print(f"[Predict] mask 唯一值: {unique_vals}")
+
+    # 保存 mask 与概率图（延迟写入，不等待编码与写盘）
+    mask_path = encoding.write('mask', file_name, mask_array)
+    prob_path = heatmap.save_prob(file_name, img_y)
+
+    print(f"[Predict] ✅ 预测完成，mask保存至: {mask_path}")
+    
+    # 返回结果字典
+    return {
+        'mask_path': str(mask_path),
+        'prob_path': str(prob_path),
+        'mask_array': mask_array,
+        'img_y': img_y,
+        'file_name': file_name
+    }
 
 
 def predict(dataset, model):
@@ -29,7 +103,7 @@ def predict(dataset, model):
         model: PyTorch 模型
         
     Returns:
-        dict: 包含 mask_path, mask_array, img_y 的结果字典
+        dict: 包含 mask_path, mask_array, img_y 的结果字典，inference_time 为 ROI 定位与模型前向的耗时（秒）
     """
     print(f"[Predict] 开始预测...")
     
@@ -46,62 +120,16 @@ def predict(dataset, model):
             print(f"[Predict] 输入范围: min={x_min}, max={x_max}")
 
             print(f"[Predict] 开始模型推理...")
-            y = model(x)
+            forward = lambda t: offload.call_model(model, t)
+            t0 = time.time()
+            y = roi.infer(forward, x) if config.ROI_INFERENCE else forward(x)
+            inference_time = time.time() - t0
             print(f"[Predict] 推理完成，输出shape: {y.shape}")
 
-            # 打印输出统计信息
-            y_min = float(y.min().cpu().numpy())
-            y_max = float(y.max().cpu().numpy())
-            print(f"[Predict] 输出范围: min={y_min}, max={y_max}")
-
-            print(f"[Predict] 后处理中...")
-            img_y = torch.squeeze(y).cpu().numpy()
-            
-            # 根据输出范围选择二值化方式
-            if y_max <= 1.0:
-                bin_mask = (img_y >= THRESHOLD).astype('uint8')
-            else:
-                bin_mask = (img_y != 0).astype('uint8')
-
-            # 将二值掩码扩展到0-255
-            mask_array = (bin_mask * 255).astype('uint8')
-
-            # 打印唯一值以确认是否有正例
-            unique_vals = np.unique(mask_array)
-            print(f"[Predict] mask 唯一值: {unique_vals}")
-
-            # 保存 mask 文件
-            tmp_mask_dir = BASE_DIR / 'tmp' / 'mask'
-            tmp_mask_dir.mkdir(parents=True, exist_ok=True)
-            mask_path = tmp_mask_dir / f'{file_name}_mask.png'
-            
-            cv2.imwrite(str(mask_path), mask_array, [cv2.IMWRITE_PNG_COMPRESSION, 0])
-            
-            # ========== 新增：生成热力图 (Heatmap) ==========
-            # 将概率图映射到 0-255
-            heatmap_norm = (img_y * 255).astype(np.uint8)
-            # 应用伪彩色 (JET colormap: 蓝色=低概率, 红色=高概率)
-            heatmap_color = cv2.applyColorMap(heatmap_norm, cv2.COLORMAP_JET)
-            
-            # 保存热力图
-            tmp_heatmap_dir = BASE_DIR / 'tmp' / 'heatmap'
-            tmp_heatmap_dir.mkdir(parents=True, exist_ok=True)
-            heatmap_path = tmp_heatmap_dir / f'{file_name}_heatmap.png'
-            
-            cv2.imwrite(str(heatmap_path), heatmap_color)
-            print(f"[Predict] 🔥 热力图已生成: {heatmap_path}")
-            # ===============================================
-
-            print(f"[Predict] ✅ 预测完成，mask保存至: {mask_path}")
-            
-            # 返回结果字典
-            return {
-                'mask_path': str(mask_path),
-                'heatmap_path': str(heatmap_path),
-                'mask_array': mask_array,
-                'img_y': img_y,
-                'file_name': file_name
-            }
+            # 二值化与结果文件写入同样是 CPU 密集操作，放到原生线程中执行
+            result = offload.run_blocking(_post_process, y, file_name)
+            result['inference_time'] = inference_time
+            return result
             
     except Exception as e:
         print(f"[Predict] ❌ 预测失败: {e}")
@@ -5,6 +5,8 @@ import cv2
 import numpy as np
 import torch
 
+from core import encoding, workspace
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 def data_in_one(inputdata):
@@ -14,15 +16,63 @@ def data_in_one(inputdata):
     return inputdata
 
 
-def pre_process(data_path):
+def read_dicom(data_path):
+    """读取DICOM文件，返回原始HU数组，shape: (1, H, W)"""
+    image = sitk.ReadImage(data_path)
+    return sitk.GetArrayFromImage(image)
+
+
+def to_preview(image_array):
+    """
+    生成与预览PNG回读结果一致的BGR图像（内存模式下替代 cv2.imread）
+    cv2.imwrite 会把非 8/16 位数据饱和转换为 uint8，16 位 PNG 以彩色读取时右移 8 位
+    """
+    image = np.asarray(image_array).squeeze()
+    if image.dtype == np.uint16:
+        image = (image >> 8).astype(np.uint8)
+    elif image.dtype != np.uint8:
+        image = np.clip(image, 0, 255).astype(np.uint8)
+    return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+
+
+def find_contours(mask_array):
+    """
+    一次性查找轮廓，同时得到全部轮廓和最外层轮廓
+    :return: (contours, external) 全部轮廓等价于 RETR_LIST，最外层轮廓等价于 RETR_EXTERNAL
+    """
+    result = cv2.findContours(mask_array, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+    if len(result) == 2:
+        contours, hierarchy = result
+    else:
+        _, contours, hierarchy = result
+    if hierarchy is None:
+        return [], []
+    external = [c for c, h in zip(contours, hierarchy[0]) if h[3] == -1]
+    return list(contours), external
+
+
+def normalize(image_array):
+    """模型输入：全图 CT 窗位截断 (-200, 300) 后归一化"""
+    img_np = image_array[0].astype(np.float32)
+    img_np = np.clip(img_np, -200, 300)
+    return data_in_one(img_np)
+
+
+def pre_process(data_path, image_array=None, pid=None):
+    """
+    预处理DICOM图像
+    :param data_path: DCM文件路径
+    :param image_array: 已解码的HU数组，传入时不再重复读取DICOM
+    :param pid: 诊断标识 "<工作区ID>/<文件名>"，默认取DCM文件名
+    """
     print(f"[PreProcess] 处理文件: {data_path}")
     
     global test_image, test_mask
     image_list, mask_list, image_data, mask_data = [], [], [], []
 
-    print(f"[PreProcess] 读取DICOM图像...")
-    image = sitk.ReadImage(data_path)
-    image_array = sitk.GetArrayFromImage(image)
+    if image_array is None:
+        print(f"[PreProcess] 读取DICOM图像...")
+        image_array = read_dicom(data_path)
     print(f"[PreProcess] 图像shape: {image_array.shape}")
 
     print(f"[PreProcess] 提取ROI区域...")
@@ -33,9 +83,7 @@ def pre_process(data_path):
     # ROI_mask[0][270:430, 200:300] = ROI_mask_mini[0]
     
     # 修改为全图输入，并进行CT窗位截断
-    img_np = image_array[0].astype(np.float32)
-    img_np = np.clip(img_np, -200, 300)
-    image_norm = data_in_one(img_np)
+    image_norm = normalize(image_array)
     
     # test_image用于后续可视化或其他用途，这里保持一致
     test_image = np.expand_dims(image_norm, axis=0) 
@@ -45,7 +93,7 @@ def pre_process(data_path):
     # shape: (1, 1, 512, 512)
     
     image_data.append(image_tensor)
-    file_name = os.path.split(data_path)[1].replace('.dcm', '')
+    file_name = pid or os.path.split(data_path)[1].replace('.dcm', '')
 
     # 转为图片写入image文件夹
     print(f"[PreProcess] 保存原始图像...")
@@ -53,42 +101,44 @@ def pre_process(data_path):
     image_array = np.rot90(image_array, -1)
     image_array = np.fliplr(image_array).squeeze()
     
-    tmp_image_dir = os.path.join(BASE_DIR, 'tmp', 'image')
-    if not os.path.exists(tmp_image_dir):
-        os.makedirs(tmp_image_dir)
-    cv2.imwrite(os.path.join(tmp_image_dir, f'{file_name}.png'), image_array, (cv2.IMWRITE_PNG_COMPRESSION, 0))
-    print(f"[PreProcess] 预处理完成")
+    image_path = encoding.write('image', file_name, image_array)
+    print(f"[PreProcess] 预处理完成: {image_path.name}")
 
     return image_data, file_name
 
 
-def last_process(file_name):
+def last_process(file_name, image=None, mask=None, contours=None):
+    """
+    后处理：在预览图上绘制肿瘤轮廓
+    :param file_name: 诊断标识 pid
+    :param image: 内存中的BGR预览图，为空时从 tmp/image 读取
+    :param mask: 内存中的二值mask，为空时从 tmp/mask 读取
+    :param contours: 已查找到的最外层轮廓，为空时重新查找
+    """
     print(f"[LastProcess] 处理文件: {file_name}")
     
-    image_path = os.path.join(BASE_DIR, 'tmp', 'image', f'{file_name}.png')
-    mask_path = os.path.join(BASE_DIR, 'tmp', 'mask', f'{file_name}_mask.png')
-    
-    image = cv2.imread(image_path)
-    mask = cv2.imread(mask_path, 0)
-    
-    print(f"[LastProcess] 查找轮廓...")
-    # 兼容不同版本的OpenCV
-    # OpenCV 4.x 返回 (contours, hierarchy)
-    # OpenCV 3.x 返回 (image, contours, hierarchy)
-    result = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    if len(result) == 2:
-        contours, hierarchy = result
+    if image is None:
+        image = encoding.imread(workspace.find_artifact('image', file_name))
     else:
-        _, contours, hierarchy = result
+        image = image.copy()
+    
+    if contours is None:
+        if mask is None:
+            mask = encoding.imread(workspace.find_artifact('mask', file_name), 0)
+        
+        print(f"[LastProcess] 查找轮廓...")
+        # 兼容不同版本的OpenCV
+        # OpenCV 4.x 返回 (contours, hierarchy)
+        # OpenCV 3.x 返回 (image, contours, hierarchy)
+        result = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if len(result) == 2:
+            contours, hierarchy = result
+        else:
+            _, contours, hierarchy = result
     
     print(f"[LastProcess] 绘制轮廓 (找到{len(contours)}个)...")
     draw = cv2.drawContours(image, contours, -1, (0, 255, 0), 2)
     
-    tmp_draw_dir = os.path.join(BASE_DIR, 'tmp', 'draw')
-    if not os.path.exists(tmp_draw_dir):
-        os.makedirs(tmp_draw_dir)
-    output_path = os.path.join(tmp_draw_dir, f'{file_name}.png')
-    
-    cv2.imwrite(output_path, draw)
-    print(f"[LastProcess] 轮廓图保存至: {output_path}")
+    output_path = encoding.write('draw', file_name, draw)
+    print(f"[LastProcess] 轮廓图已提交写入: {output_path}")
 
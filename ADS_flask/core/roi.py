@@ -0,0 +1,81 @@
+"""
+盆腔 ROI 裁剪推理
+肿瘤位于固定的盆腔区域（训练端 get_ROI 与早期固定裁剪 [270:430, 200:300]），
+只对该区域外扩后的裁剪块运行 Unet，再把概率图贴回 512x512 全图，可显著减少计算量。
+"""
+import torch
+
+import config
+
+# 先验窗口 (行起, 行止, 列起, 列止)，与 process.pre_process 中注释掉的固定裁剪一致
+PRIOR_WINDOW = (270, 430, 200, 300)
+
+# Unet 四次下采样，输入边长需为 16 的倍数
+SIZE_MULTIPLE = 16
+
+# 归一化后高于该值视为人体（窗位截断后空气为 0）
+BODY_THRESHOLD = 0.05
+
+
+def _body_bbox(image):
+    """人体区域外接框，找不到时返回 None"""
+    body = image > BODY_THRESHOLD
+    rows = torch.nonzero(body.any(dim=1)).flatten()
+    cols = torch.nonzero(body.any(dim=0)).flatten()
+    if rows.numel() == 0 or cols.numel() == 0:
+        return None
+    return int(rows[0]), int(rows[-1]) + 1, int(cols[0]), int(cols[-1]) + 1
+
+
+def _grow(start, stop, size, multiple):
+    """把区间向两侧扩展到 multiple 的倍数，并平移到图像范围内"""
+    length = -(-(stop - start) // multiple) * multiple
+    length = min(length, size)
+    start -= (length - (stop - start)) // 2
+    start = max(0, min(start, size - length))
+    return start, start + length
+
+
+def find_roi(image, margin=None, multiple=SIZE_MULTIPLE):
+    """
+    计算裁剪框
+    :param image: 归一化后的二维切片 (H, W) tensor
+    :param margin: 先验窗口外扩像素，默认取 config.ROI_MARGIN
+    :return: (y0, y1, x0, x1)；无法确定或裁剪无收益时返回 None
+    """
+    margin = config.ROI_MARGIN if margin is None else margin
+    height, width = image.shape[-2:]
+    y0, y1, x0, x1 = PRIOR_WINDOW
+    y0, y1 = max(0, y0 - margin), min(height, y1 + margin)
+    x0, x1 = max(0, x0 - margin), min(width, x1 + margin)
+
+    body = _body_bbox(image)
+    if body is not None:
+        y0, y1 = max(y0, body[0]), min(y1, body[1])
+        x0, x1 = max(x0, body[2]), min(x1, body[3])
+    if y0 >= y1 or x0 >= x1:
+        return None
+
+    y0, y1 = _grow(y0, y1, height, multiple)
+    x0, x1 = _grow(x0, x1, width, multiple)
+    if (y1 - y0) * (x1 - x0) >= height * width:
+        return None
+    return y0, y1, x0, x1
+
+
+def infer(model, x):
+    """
+    ROI 裁剪推理，输入输出与 model(x) 相同 (N, 1, H, W)；ROI 外的概率为 0
+    找不到有效 ROI 时退回全图推理
+    """
+    box = find_roi(x[0, 0])
+    if box is None:
+        print("[ROI] 未找到有效ROI，使用全图推理")
+        return model(x)
+
+    y0, y1, x0, x1 = box
+    print(f"[ROI] 裁剪推理: [{y0}:{y1}, {x0}:{x1}] ({y1 - y0}x{x1 - x0})")
+    y_crop = model(x[:, :, y0:y1, x0:x1].contiguous())
+    y = torch.zeros(x.shape[0], y_crop.shape[1], *x.shape[2:], dtype=y_crop.dtype, device=y_crop.device)
+    y[:, :, y0:y1, x0:x1] = y_crop
+    return y
@@ -0,0 +1,176 @@
+"""
+tmp/ 产物文件服务
+- 强 ETag（内容 SHA-256），支持 If-None-Match 304、Last-Modified 与 Range
+- 带内容版本（?v=，见 workspace.artifact_url）且版本与当前内容一致的请求使用长缓存 + immutable；
+  同一路径的产物会被重新写入（换模型重新诊断等），不带版本或版本已过期的请求每次校验 ETag
+- 小文件放入按字节数限制的 LRU 内存缓存，热点图片不再读盘；其余文件交给 WSGI file_wrapper 发送，
+  开启 USE_X_SENDFILE 时由前置 Web 服务器直接发送文件（Range 请求也由其处理）
+- 延迟写入中尚未落盘的产物直接发送内存中的内容
+"""
+import hashlib
+import mimetypes
+import threading
+from collections import OrderedDict
+
+from flask import Response, current_app, request
+from werkzeug.wsgi import wrap_file
+
+from core import heatmap, offload, workspace
+from core.cache import file_sha256
+from core.writebehind import writer
+
+mimetypes.add_type('application/dicom', '.dcm')
+mimetypes.add_type('image/webp', '.webp')
+
+# 可以通过 /tmp/ 访问的子目录（概率图只在服务端使用）
+SERVABLE_DIRS = {subdir for kind, (subdir, _) in workspace.LAYOUT.items() if kind != 'prob'}
+
+# 按需生成的子目录：子目录 -> 渲染函数(相对文件名) -> 当前产物的路径或 None（文件已存在时也经由渲染函数，过期时重新生成）
+RENDERERS = {
+    'heatmap': heatmap.render_file,
+}
+
+
+class HotCache:
+    """按字节数限制的 LRU 缓存：键 -> (bytes, etag)"""
+
+    def __init__(self, max_bytes, max_item_bytes):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self._items = OrderedDict()
+        self._used = 0
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0}
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.stats['misses'] += 1
+                return None
+            self._items.move_to_end(key)
+            self.stats['hits'] += 1
+            return item
+
+    def put(self, key, data, etag):
+        if len(data) > self.max_item_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._used -= len(old[0])
+            self._items[key] = (data, etag)
+            self._used += len(data)
+            while self._used > self.max_bytes:
+                _, (evicted, _) = self._items.popitem(last=False)
+                self._used -= len(evicted)
+
+    def info(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._items), bytes=self._used)
+
+
+class ArtifactServer:
+    """
+    :param hot_cache_bytes: 内存缓存总大小
+    :param hot_item_bytes: 可进入内存缓存的单个文件上限
+    :param max_age: 工作区产物的缓存时间（秒）
+    """
+
+    def __init__(self, hot_cache_bytes=32 * 1024 * 1024, hot_item_bytes=2 * 1024 * 1024, max_age=31536000):
+        self.hot = HotCache(hot_cache_bytes, hot_item_bytes)
+        self.max_age = max_age
+        self._etags = OrderedDict()  # (路径, mtime_ns, size) -> etag，用于不进入内存缓存的大文件
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def resolve(relpath):
+        """校验请求路径，返回 tmp/ 下的文件路径；不允许访问的路径返回 None，可按需生成的产物在此生成"""
+        parts = relpath.replace('\\', '/').split('/')
+        if parts[0] not in SERVABLE_DIRS or any(p in ('', '.', '..') for p in parts):
+            return None
+        render = RENDERERS.get(parts[0])
+        if render is not None:
+            return render('/'.join(parts[1:]))
+        path = workspace.TMP_DIR.joinpath(*parts)
+        if not path.is_file() and not writer.pending(path):
+            return None
+        return path
+
+    def serve(self, relpath, path):
+        """发送文件并处理条件请求"""
+        if writer.pending(path):
+            data = offload.run_blocking(writer.read, path)
+            if data is not None:
+                return self._memory_response(relpath, path, data)
+        st = path.stat()
+        key = (str(path), st.st_mtime_ns, st.st_size)
+        mimetype = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+
+        item = self.hot.get(key)
+        if item is None and st.st_size <= self.hot.max_item_bytes:
+            data = offload.run_blocking(path.read_bytes)
+            item = (data, hashlib.sha256(data).hexdigest())
+            self.hot.put(key, *item)
+
+        if item is not None:
+            data, etag = item
+            response = Response(data, mimetype=mimetype)
+            response.set_etag(etag)
+            response.last_modified = int(st.st_mtime)
+        else:
+            response = self._file_response(path, mimetype)
+            response.set_etag(self._etag(key, path))
+            response.last_modified = int(st.st_mtime)
+
+        self._cache_headers(response, relpath)
+        if 'X-Sendfile' in response.headers:
+            # 响应体由前置服务器填充，Range 也交给它处理；这里只处理 ETag / Last-Modified 条件请求
+            return response.make_conditional(request)
+        return response.make_conditional(request, accept_ranges=True, complete_length=st.st_size)
+
+    def info(self):
+        return self.hot.info()
+
+    def _memory_response(self, relpath, path, data):
+        """尚未落盘的产物：直接发送内存中的内容，ETag 与落盘后一致"""
+        mimetype = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+        response = Response(data, mimetype=mimetype)
+        response.set_etag(hashlib.sha256(data).hexdigest())
+        self._cache_headers(response, relpath)
+        return response.make_conditional(request, accept_ranges=True, complete_length=len(data))
+
+    @staticmethod
+    def _file_response(path, mimetype):
+        """大文件：交给 WSGI 服务器的 file_wrapper（可用时走 sendfile）或前置服务器的 X-Sendfile"""
+        if current_app.config.get('USE_X_SENDFILE'):
+            response = Response(mimetype=mimetype, headers={'X-Sendfile': str(path)})
+            response.content_length = path.stat().st_size
+            return response
+        data = wrap_file(request.environ, open(path, 'rb'))
+        response = Response(data, mimetype=mimetype, direct_passthrough=True)
+        response.content_length = path.stat().st_size
+        return response
+
+    def _cache_headers(self, response, relpath):
+        version = request.args.get('v')
+        parsed = workspace.parse_path(relpath) if version else None
+        if parsed and version == workspace.artifact_version(*parsed):
+            # URL 中的版本对应当前内容：内容改变后会生成新的URL，此URL可以永久缓存
+            response.headers['Cache-Control'] = f'private, max-age={self.max_age}, immutable'
+        else:
+            response.headers['Cache-Control'] = 'no-cache'
+
+    def _etag(self, key, path):
+        with self._lock:
+            etag = self._etags.get(key)
+            if etag is not None:
+                self._etags.move_to_end(key)
+                return etag
+        etag = offload.run_blocking(file_sha256, path)
+        with self._lock:
+            self._etags[key] = etag
+            while len(self._etags) > 4096:
+                self._etags.popitem(last=False)
+        return etag
+
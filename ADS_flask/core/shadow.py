@@ -0,0 +1,295 @@
+"""
+候选模型影子推理
+按系统设置 model_shadow_rate 的比例抽取 /predict 请求，在响应返回后于后台用候选模型（model_shadow_candidate）
+对同一图像再推理一次，与线上模型的结果比较：
+- mask 的 Dice 一致性、是否检出肿瘤的一致性
+- 各项特征的差值（候选 - 线上）
+- 两个模型推理耗时（只计 ROI 定位与模型前向，不含排队等待）的分位数；
+  候选模型在降低优先级的影子线程中执行前向时，其耗时单独统计为 candidate_niced，不与线上耗时直接比较
+影子推理不写任何产物、不影响响应；计算在单个降低优先级的原生线程中进行，进行中的任务达到上限时直接丢弃样本。
+"""
+import json
+import random
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+import torch
+
+import config
+from core import get_feature, offload, process, predict, roi, workspace
+from core.writebehind import writer
+
+# 设置键
+CANDIDATE_SETTING = 'model_shadow_candidate'
+RATE_SETTING = 'model_shadow_rate'
+
+# 每个模型对保留的最近样本数（用于分位数）
+_WINDOW = 1000
+
+
+def parse_rate(value):
+    """解析抽样比例，不在 [0, 1] 内时抛出 ValueError"""
+    value = float(value)
+    if not 0 <= value <= 1:
+        raise ValueError(f'抽样比例应在 0-1 之间: {value}')
+    return value
+
+
+def dice(a, b):
+    """两个二值 mask 的 Dice 系数，均为空时为 1"""
+    a, b = a > 0, b > 0
+    total = int(a.sum()) + int(b.sum())
+    if total == 0:
+        return 1.0
+    return 2.0 * int(np.logical_and(a, b).sum()) / total
+
+
+def _forward(model, x):
+    with torch.no_grad():
+        return model(x)
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    arr = np.asarray(values, dtype=np.float64) * 1000
+    return {
+        'p50': round(float(np.percentile(arr, 50)), 2),
+        'p90': round(float(np.percentile(arr, 90)), 2),
+        'p99': round(float(np.percentile(arr, 99)), 2),
+        'mean': round(float(arr.mean()), 2),
+    }
+
+
+def _features(image_info):
+    """从 {key: [中文名, 数值]} 格式的诊断结果提取数值特征，未检出肿瘤时为 None"""
+    if not image_info or image_info.get('status') == 'no_tumor':
+        return None
+    values = {}
+    for key in get_feature.FEATURE_LABELS:
+        value = image_info.get(key)
+        if isinstance(value, list):
+            value = value[1]
+        if isinstance(value, (int, float)):
+            values[key] = float(value)
+    return values
+
+
+class PairStats:
+    """一个 (线上模型, 候选模型) 组合的累计比较结果"""
+
+    def __init__(self, primary, candidate):
+        self.primary = primary
+        self.candidate = candidate
+        self.samples = 0
+        self.detection_agree = 0
+        self.dice = deque(maxlen=_WINDOW)
+        self.primary_latency = deque(maxlen=_WINDOW)
+        self.candidate_latency = deque(maxlen=_WINDOW)
+        self.candidate_niced_latency = deque(maxlen=_WINDOW)  # 在低优先级线程中前向的样本
+        self.deltas = {}  # 特征 -> deque[(差值, 相对差值)]
+        self.first_at = time.time()
+        self.last_at = None
+
+    def add(self, dice_score, detected, primary_features, candidate_features, primary_latency, candidate_latency,
+            niced=False):
+        self.samples += 1
+        self.last_at = time.time()
+        self.detection_agree += int(detected[0] == detected[1])
+        self.dice.append(dice_score)
+        if primary_latency is not None:
+            self.primary_latency.append(primary_latency)
+        (self.candidate_niced_latency if niced else self.candidate_latency).append(candidate_latency)
+        if primary_features and candidate_features:
+            for key, base in primary_features.items():
+                if key not in candidate_features:
+                    continue
+                delta = candidate_features[key] - base
+                self.deltas.setdefault(key, deque(maxlen=_WINDOW)).append(
+                    (delta, abs(delta) / max(abs(base), 1e-6)))
+
+    def to_dict(self):
+        dice_values = np.asarray(self.dice, dtype=np.float64)
+        return {
+            'primary': self.primary,
+            'candidate': self.candidate,
+            'samples': self.samples,
+            'detection_agreement': round(self.detection_agree / self.samples, 4) if self.samples else None,
+            'dice': {
+                'mean': round(float(dice_values.mean()), 4),
+                'p10': round(float(np.percentile(dice_values, 10)), 4),
+                'min': round(float(dice_values.min()), 4),
+            } if len(dice_values) else None,
+            'features': {
+                key: {
+                    'label': get_feature.FEATURE_LABELS[key],
+                    'mean_delta': round(float(np.mean([d for d, _ in values])), 4),
+                    'mean_abs_delta': round(float(np.mean([abs(d) for d, _ in values])), 4),
+                    'mean_rel_delta': round(float(np.mean([r for _, r in values])), 4),
+                }
+                for key, values in self.deltas.items() if values
+            },
+            'latency_ms': {
+                'primary': _percentiles(list(self.primary_latency)),
+                'candidate': _percentiles(list(self.candidate_latency)),
+                'candidate_niced': _percentiles(list(self.candidate_niced_latency)),
+            },
+            'first_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.first_at)),
+            'last_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.last_at)) if self.last_at else None,
+        }
+
+
+class ShadowRunner:
+    """
+    :param app: Flask 应用（通过 app.model_manager 获取候选模型）
+    :param max_pending: 同时进行的影子推理上限，超出时丢弃样本
+    """
+
+    def __init__(self, app, max_pending=2):
+        self.app = app
+        self.max_pending = max_pending
+        self.candidate = None
+        self.rate = 0.0
+        self._pool = offload.NativePool(1, name='shadow', nice=10)
+        self._pairs = {}  # (线上模型, 候选模型) -> PairStats
+        self._pending = 0
+        self._lock = threading.Lock()
+        self.stats = {'sampled': 0, 'completed': 0, 'dropped': 0, 'failed': 0}
+
+    def configure(self, candidate, rate):
+        self.candidate = candidate or None
+        self.rate = rate if self.candidate else 0.0
+        print(f"[Shadow] 候选模型: {self.candidate or '未启用'}，抽样比例: {self.rate}")
+
+    def load_settings(self):
+        """从系统设置读取候选模型与抽样比例（需在应用上下文中调用）"""
+        from models import SystemSetting
+
+        values = {row.key: row.value for row in SystemSetting.query.filter(
+            SystemSetting.key.in_([CANDIDATE_SETTING, RATE_SETTING])).all()}
+        try:
+            rate = parse_rate(values.get(RATE_SETTING) or 0)
+        except ValueError as e:
+            print(f"[Shadow] ⚠️ 抽样比例设置无效，不启用影子推理: {e}")
+            rate = 0.0
+        self.configure(values.get(CANDIDATE_SETTING), rate)
+
+    def maybe_submit(self, primary, dcm_path, result_pid, image_info, timings=None):
+        """
+        按抽样比例提交影子推理，立即返回
+        :param primary: 本次诊断使用的模型名称
+        :param result_pid: 诊断结果标识（"<pid>.png"），提交时即读取线上模型的 mask，之后重新诊断或重新二值化不影响比较
+        :param timings: 本次诊断的各阶段耗时，含 inference 时记录线上模型推理耗时（命中缓存时没有）
+        """
+        candidate = self.candidate
+        if not candidate or primary == candidate or random.random() >= self.rate:
+            return False
+        with self._lock:
+            self.stats['sampled'] += 1
+            if self._pending >= self.max_pending:
+                self.stats['dropped'] += 1
+                return False
+            self._pending += 1
+        try:
+            pid = result_pid[:-len('.png')] if result_pid.endswith('.png') else result_pid
+            primary_mask = offload.run_blocking(writer.read_bytes, workspace.find_artifact('mask', pid))
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+                self.stats['failed'] += 1
+            raise
+        primary_latency = (timings or {}).get('inference')
+        # 结果复制一份，后台线程读取时不受调用方修改影响
+        image_info = json.loads(json.dumps(image_info))
+        threading.Thread(target=self._run, args=(primary, candidate, str(dcm_path), pid, primary_mask,
+                                                 image_info, primary_latency),
+                         name='shadow', daemon=True).start()
+        return True
+
+    def summary(self):
+        with self._lock:
+            pairs = [stats.to_dict() for stats in self._pairs.values()]
+            return {
+                'candidate': self.candidate,
+                'rate': self.rate,
+                'pending': self._pending,
+                'stats': dict(self.stats),
+                'pairs': pairs,
+            }
+
+    def reset(self):
+        with self._lock:
+            self._pairs.clear()
+            self.stats = dict.fromkeys(self.stats, 0)
+
+    # ==================== 内部方法 ====================
+
+    def _run(self, primary, candidate, dcm_path, pid, primary_mask, image_info, primary_latency):
+        try:
+            with self.app.model_manager.acquire(candidate) as slot:
+                mask, features, latency, niced = self._infer(slot.model, dcm_path)
+            primary_mask = self._native(cv2.imdecode, np.frombuffer(primary_mask, np.uint8), cv2.IMREAD_GRAYSCALE)
+            if primary_mask is None:
+                raise ValueError(f'线上模型 mask 无法解码: {pid}')
+            primary_features = _features(image_info)
+            score = dice(primary_mask, mask)
+            with self._lock:
+                stats = self._pairs.get((primary, candidate))
+                if stats is None:
+                    stats = self._pairs[(primary, candidate)] = PairStats(primary, candidate)
+                stats.add(score, (primary_features is not None, features is not None),
+                          primary_features, features, primary_latency, latency, niced)
+                self.stats['completed'] += 1
+            print(f"[Shadow] {primary} vs {candidate}: Dice {score:.4f}, 候选推理 {latency * 1000:.0f}ms ({pid})")
+        except Exception as e:
+            with self._lock:
+                self.stats['failed'] += 1
+            print(f"[Shadow] ❌ 影子推理失败: {e}")
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _infer(self, model, dcm_path):
+        """
+        候选模型推理：预处理、前向、二值化与特征提取均在内存中完成，不写产物
+        计时只包含 ROI 定位与模型前向（不含影子线程的排队等待），与线上模型的 timings['inference'] 口径一致
+        :return: (mask, 特征, 耗时, 是否在降低优先级的线程中前向)
+        """
+        image_array = self._native(process.read_dicom, dcm_path)
+        x = torch.from_numpy(process.normalize(image_array)).float().unsqueeze(0).unsqueeze(0).to(predict.device)
+
+        if getattr(model, 'cooperative', False):
+            forward = lambda t: offload.call_model(model, t)
+            run = lambda: roi.infer(forward, x) if config.ROI_INFERENCE else forward(x)
+            t0 = time.time()
+            y = run()
+            latency = time.time() - t0
+            niced = False
+        else:
+            forward = lambda t: _forward(model, t)
+
+            def timed():
+                # 在工作线程内计时，排除在影子线程队列中的等待
+                t0 = time.time()
+                y = roi.infer(forward, x) if config.ROI_INFERENCE else forward(x)
+                return y, time.time() - t0
+
+            y, latency = self._native(timed)
+            niced = bool(self._pool.nice)
+
+        def post(y):
+            mask = predict.binarize(torch.squeeze(y).cpu().numpy())
+            contours, _ = process.find_contours(mask)
+            return mask, get_feature.get_feature(None, None, image_array, mask, contours)
+
+        mask, features = self._native(post, y)
+        return mask, features, latency, niced
+
+    def _native(self, fn, *args):
+        """在低优先级的影子线程中执行并等待结果"""
+        task = self._pool.submit(fn, *args)
+        return offload.run_blocking(task.result)
+
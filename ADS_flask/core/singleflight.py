@@ -0,0 +1,81 @@
+"""
+同键请求合并（single-flight）
+同一图像的诊断正在进行时，后到的调用方不再重复执行流水线，而是等待首个调用的结果，
+并同时收到它的进度事件。避免重复计算以及多个流水线同时写同一组 tmp 文件。
+"""
+import threading
+
+
+class _Call:
+    """一次进行中的计算"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.listeners = []
+        self.last_progress = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """按键合并并发调用"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {'executed': 0, 'coalesced': 0}
+
+    def do(self, key, fn, progress_callback=None):
+        """
+        执行 fn(progress)，同键调用进行中时等待其结果
+        :param fn: 接收进度回调 progress(pct, msg) 的函数
+        :param progress_callback: 本调用方的进度回调，会收到共享计算的全部进度
+        :return: (result, shared)，shared 表示结果来自其他调用方发起的计算
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.stats['executed'] += 1
+            else:
+                call.waiters += 1
+                self.stats['coalesced'] += 1
+            if progress_callback is not None and progress_callback not in call.listeners:
+                call.listeners.append(progress_callback)
+            last_progress = call.last_progress
+
+        if not leader:
+            print(f"[SingleFlight] 合并到进行中的计算: {key}")
+            if last_progress is not None and progress_callback is not None:
+                progress_callback(*last_progress)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        def progress(pct, msg):
+            with self._lock:
+                call.last_progress = (pct, msg)
+                listeners = list(call.listeners)
+            for listener in listeners:
+                try:
+                    listener(pct, msg)
+                except Exception as e:
+                    print(f"[SingleFlight] 进度回调失败: {e}")
+
+        try:
+            call.result = fn(progress)
+            return call.result, False
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self):
+        with self._lock:
+            return {key: call.waiters for key, call in self._calls.items()}
@@ -0,0 +1,189 @@
+"""
+上传文件存储
+请求体中的文件在解析 multipart 时直接流式写入暂存目录并同时计算 SHA-256，
+随后按内容哈希归档到 uploads/objects/<前两位>/<哈希>.dcm（相同内容只保留一份），
+工作区中的 DICOM 通过硬链接引用该对象，不再“先保存再复制”。
+内容哈希会被记住，结果缓存无需再次读取文件计算。
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from flask import Request
+
+import config
+from core import offload
+from core.cache import file_sha256
+
+
+class HashingFile:
+    """
+    边写边计算 SHA-256 的暂存文件
+    未被 UploadStore 归档的暂存文件在关闭时删除（例如模型上传等其他 multipart 文件）
+    """
+
+    def __init__(self, staging_dir):
+        staging_dir.mkdir(parents=True, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=staging_dir, prefix='upload-', delete=False)
+        self.name = self._file.name
+        self.size = 0
+        self.committed = False
+        self._digest = hashlib.sha256()
+
+    def write(self, data):
+        self._digest.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+    def commit(self, path):
+        """
+        关闭暂存文件并移动到 path
+        Windows 下无法重命名仍处于打开状态的文件，因此先关闭再移动
+        """
+        self._file.flush()
+        self._file.close()
+        os.replace(self.name, path)
+        self.committed = True
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+        if not self.committed:
+            try:
+                os.unlink(self.name)
+            except FileNotFoundError:
+                pass
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class UploadRequest(Request):
+    """multipart 文件直接写入上传暂存目录并计算哈希"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingFile(UploadStore.staging_dir())
+
+
+class StoredObject:
+    """已归档的上传对象"""
+
+    def __init__(self, sha256, path, size, deduplicated):
+        self.sha256 = sha256
+        self.path = path
+        self.size = size
+        self.deduplicated = deduplicated
+
+
+class UploadStore:
+    """
+    内容寻址的上传存储
+    :param root: 存储根目录，默认 config.UPLOAD_FOLDER
+    :param remember: 记住的 路径->哈希 条数
+    """
+
+    def __init__(self, root=None, remember=4096):
+        self.root = Path(root or config.UPLOAD_FOLDER)
+        self.objects_dir = self.root / 'objects'
+        self.remember = remember
+        self._hashes = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'stored': 0, 'deduplicated': 0, 'bytes_written': 0, 'bytes_saved': 0}
+
+    @staticmethod
+    def staging_dir():
+        return Path(config.UPLOAD_FOLDER) / '.staging'
+
+    def object_path(self, sha256):
+        return self.objects_dir / sha256[:2] / f'{sha256}.dcm'
+
+    def put(self, file_storage):
+        """
+        归档上传文件
+        :param file_storage: request.files 中的 FileStorage
+        :return: StoredObject
+        """
+        stream = file_storage.stream
+        if not isinstance(stream, HashingFile):
+            # 请求未使用 UploadRequest 时回退为一次边拷贝边哈希
+            stream.seek(0)
+            staged = HashingFile(self.staging_dir())
+            shutil.copyfileobj(stream, staged)
+            stream = staged
+        stream.flush()
+
+        sha256 = stream.hexdigest()
+        path = self.object_path(sha256)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        deduplicated = path.exists()
+        if deduplicated:
+            # 刷新修改时间，避免链接前被无引用对象清理删除
+            os.utime(path, None)
+            stream.close()
+        else:
+            try:
+                stream.commit(path)
+            finally:
+                stream.close()
+
+        with self._lock:
+            if deduplicated:
+                self.stats['deduplicated'] += 1
+                self.stats['bytes_saved'] += stream.size
+            else:
+                self.stats['stored'] += 1
+                self.stats['bytes_written'] += stream.size
+        print(f"[Storage] {'复用已有对象' if deduplicated else '已保存对象'}: {sha256[:12]} ({stream.size} 字节)")
+        return StoredObject(sha256, path, stream.size, deduplicated)
+
+    def link(self, stored, dest):
+        """在 dest 创建指向对象的硬链接，跨文件系统等无法链接时复制"""
+        dest = Path(dest)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if dest.exists():
+            dest.unlink()
+        try:
+            os.link(stored.path, dest)
+        except OSError:
+            shutil.copyfile(stored.path, dest)
+        self._remember(dest, stored.sha256)
+        return dest
+
+    def hash_of(self, path):
+        """文件内容哈希：由本存储链接出的文件直接返回已知哈希，否则读取文件计算"""
+        key = str(Path(path))
+        with self._lock:
+            sha256 = self._hashes.get(key)
+            if sha256 is not None:
+                self._hashes.move_to_end(key)
+                return sha256
+        sha256 = offload.run_blocking(file_sha256, path)
+        self._remember(path, sha256)
+        return sha256
+
+    def info(self):
+        with self._lock:
+            return dict(self.stats)
+
+    def _remember(self, path, sha256):
+        with self._lock:
+            self._hashes[str(Path(path))] = sha256
+            self._hashes.move_to_end(str(Path(path)))
+            while len(self._hashes) > self.remember:
+                self._hashes.popitem(last=False)
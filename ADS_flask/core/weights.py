@@ -0,0 +1,162 @@
+"""
+内存映射权重格式
+模型权重另存为 safetensors 格式（8 字节头长度 + JSON 索引 + 连续的原始张量数据，与 safetensors 库互通，无需安装该库），
+加载时以写时复制方式映射文件，张量直接引用映射的页面：不经过 pickle 反序列化，也不把权重复制到进程私有内存，
+多个进程加载同一文件时共享页缓存中的同一份物理页。
+
+.pth 转换：
+    python -m core.weights core/net/model.pth core/net/models/*.pth
+"""
+import json
+import os
+import struct
+import sys
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+import torch
+
+# safetensors dtype 标识 -> (torch 类型, numpy 视图类型)；numpy 没有 bfloat16，按 int16 映射后再转换
+_DTYPES = {
+    'F64': (torch.float64, np.float64),
+    'F32': (torch.float32, np.float32),
+    'F16': (torch.float16, np.float16),
+    'BF16': (torch.bfloat16, np.int16),
+    'I64': (torch.int64, np.int64),
+    'I32': (torch.int32, np.int32),
+    'I16': (torch.int16, np.int16),
+    'I8': (torch.int8, np.int8),
+    'U8': (torch.uint8, np.uint8),
+    'BOOL': (torch.bool, np.bool_),
+}
+_CODES = {torch_dtype: code for code, (torch_dtype, _) in _DTYPES.items()}
+
+# 头部过大说明文件不是权重文件
+_MAX_HEADER = 100 * 1024 * 1024
+
+
+def weights_path(model_path):
+    """映射权重与 .pth 同目录同名，后缀为 .safetensors"""
+    return Path(model_path).with_suffix('.safetensors')
+
+
+def is_current(model_path):
+    """映射权重存在且不早于 .pth"""
+    path = weights_path(model_path)
+    try:
+        return path.stat().st_mtime >= Path(model_path).stat().st_mtime
+    except FileNotFoundError:
+        return False
+
+
+def save(state_dict, path, metadata=None):
+    """
+    写入权重文件（先写临时文件再原子替换）
+    张量按元素大小从大到小连续排列，头部补齐到 8 字节，映射后每个张量都按其元素大小对齐
+    """
+    tensors = [(name, t.detach().cpu().contiguous()) for name, t in state_dict.items()]
+    tensors.sort(key=lambda item: -item[1].element_size())
+
+    header, offset = {}, 0
+    for name, tensor in tensors:
+        if tensor.dtype not in _CODES:
+            raise ValueError(f'不支持的张量类型: {name} ({tensor.dtype})')
+        size = tensor.numel() * tensor.element_size()
+        header[name] = {'dtype': _CODES[tensor.dtype], 'shape': list(tensor.shape),
+                        'data_offsets': [offset, offset + size]}
+        offset += size
+    if metadata:
+        header['__metadata__'] = {k: str(v) for k, v in metadata.items()}
+
+    raw = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    raw += b' ' * (-len(raw) % 8)
+
+    path = Path(path)
+    tmp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(struct.pack('<Q', len(raw)))
+        f.write(raw)
+        for _, tensor in tensors:
+            if tensor.dtype == torch.bfloat16:
+                tensor = tensor.view(torch.int16)
+            f.write(tensor.numpy().tobytes())
+    os.replace(tmp_path, path)
+    return path
+
+
+def load(path):
+    """
+    映射权重文件（写时复制：只读访问共享页缓存，写入时才复制该页）
+    :return: OrderedDict 名称 -> 张量，张量直接引用映射的内存
+    """
+    path = str(path)
+    with open(path, 'rb') as f:
+        head = f.read(8)
+        if len(head) != 8:
+            raise ValueError(f'权重文件损坏: {path}')
+        (header_len,) = struct.unpack('<Q', head)
+        if header_len > _MAX_HEADER:
+            raise ValueError(f'权重文件头部无效: {path}')
+        header = json.loads(f.read(header_len))
+    header.pop('__metadata__', None)
+
+    data_start = 8 + header_len
+    mapped = np.memmap(path, dtype=np.uint8, mode='c')
+    state_dict = OrderedDict()
+    # 按数据在文件中的顺序映射
+    for name, info in sorted(header.items(), key=lambda item: item[1]['data_offsets'][0]):
+        torch_dtype, np_dtype = _DTYPES[info['dtype']]
+        start, end = (data_start + o for o in info['data_offsets'])
+        if end > len(mapped):
+            raise ValueError(f'权重文件不完整: {path}')
+        raw = mapped[start:end]
+        if start % np.dtype(np_dtype).itemsize:
+            raw = raw.copy()  # 其他工具写入的未对齐张量只能复制
+        array = raw.view(np_dtype).reshape(info['shape'])
+        tensor = torch.from_numpy(array)
+        if torch_dtype == torch.bfloat16:
+            tensor = tensor.view(torch.bfloat16)
+        state_dict[name] = tensor
+    return state_dict
+
+
+def bind(model, state_dict):
+    """
+    用映射的张量直接替换模型参数与缓冲区（零拷贝，相当于严格模式的 load_state_dict）
+    键或形状不一致时抛出 RuntimeError
+    """
+    expected = model.state_dict()
+    missing = [k for k in expected if k not in state_dict]
+    unexpected = [k for k in state_dict if k not in expected]
+    if missing or unexpected:
+        raise RuntimeError(f'权重与模型结构不匹配: 缺少 {missing[:5]}，多余 {unexpected[:5]}')
+    for name, tensor in state_dict.items():
+        if tuple(expected[name].shape) != tuple(tensor.shape):
+            raise RuntimeError(f'权重形状不匹配: {name} {list(tensor.shape)} != {list(expected[name].shape)}')
+        if tensor.dtype != expected[name].dtype:
+            tensor = tensor.to(expected[name].dtype)  # 类型不同时只能复制
+        module_path, _, leaf = name.rpartition('.')
+        module = model.get_submodule(module_path) if module_path else model
+        if leaf in module._parameters:
+            module._parameters[leaf] = torch.nn.Parameter(tensor, requires_grad=False)
+        else:
+            module._buffers[leaf] = tensor
+    return model
+
+
+def convert(model_path, target=None):
+    """把 .pth（pickle 的 state_dict）转换为映射权重，返回输出路径"""
+    model_path = Path(model_path)
+    state_dict = torch.load(str(model_path), map_location='cpu')
+    if not isinstance(state_dict, dict):
+        raise ValueError(f'不是 state_dict: {model_path}')
+    target = save(state_dict, target or weights_path(model_path),
+                  metadata={'format': 'pt', 'source': model_path.name})
+    print(f"[Weights] 已转换: {model_path} -> {target}")
+    return target
+
+
+if __name__ == '__main__':
+    for arg in sys.argv[1:] or [str(Path(__file__).resolve().parent / 'net' / 'model.pth')]:
+        convert(arg)
@@ -0,0 +1,333 @@
+"""
+多进程 CPU 推理工作池
+模型权重只在共享内存中保存一份（来自映射权重文件时各进程直接映射该文件），各工作进程直接映射使用，不复制到进程私有内存；
+输入输出张量通过每个进程独占的共享内存缓冲区传递，控制消息只有一行 JSON，避免 pickle 大张量。
+工作进程以 `python -m core.worker_pool` 独立启动，不导入 Flask/eventlet。
+"""
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import uuid
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import torch
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+_ALIGN = 64
+
+
+def _untrack(shm):
+    """工作进程只是附加到共享内存，退出时不应由 resource_tracker 删除它"""
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    except Exception:
+        pass
+
+
+def pack_state_dict(state_dict):
+    """
+    把 state_dict 打包进一块共享内存
+    :return: (SharedMemory, index)，index 为 [(name, dtype, shape, offset), ...]
+    """
+    index, offset = [], 0
+    for name, tensor in state_dict.items():
+        offset = (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+        index.append((name, str(tensor.dtype).replace('torch.', ''), list(tensor.shape), offset))
+        offset += tensor.numel() * tensor.element_size()
+
+    shm = shared_memory.SharedMemory(create=True, size=max(offset, 1),
+                                     name=f'ads_w_{uuid.uuid4().hex[:12]}')
+    for (name, dtype, shape, off), tensor in zip(index, state_dict.values()):
+        tensor = tensor.detach().cpu().contiguous()
+        if tensor.numel():
+            view = torch.frombuffer(shm.buf, dtype=tensor.dtype, count=tensor.numel(), offset=off)
+            view.copy_(tensor.view(-1))
+    return shm, index
+
+
+def bind_shared_state(model, buffer, index):
+    """用共享内存中的张量视图直接替换模型参数与缓冲区（零拷贝）"""
+    for name, dtype, shape, offset in index:
+        count = 1
+        for dim in shape:
+            count *= dim
+        tensor = torch.frombuffer(buffer, dtype=getattr(torch, dtype), count=count,
+                                  offset=offset).view(shape) if count else torch.empty(shape)
+        module_path, _, leaf = name.rpartition('.')
+        module = model.get_submodule(module_path) if module_path else model
+        if leaf in module._parameters:
+            module._parameters[leaf] = torch.nn.Parameter(tensor, requires_grad=False)
+        else:
+            module._buffers[leaf] = tensor
+    return model
+
+
+class _Worker:
+    """主进程侧的工作进程句柄"""
+
+    def __init__(self, rank, spec, slot_bytes):
+        self.rank = rank
+        self.input = shared_memory.SharedMemory(create=True, size=slot_bytes,
+                                                name=f'ads_i_{uuid.uuid4().hex[:12]}')
+        self.output = shared_memory.SharedMemory(create=True, size=slot_bytes,
+                                                 name=f'ads_o_{uuid.uuid4().hex[:12]}')
+        spec = dict(spec, input=self.input.name, output=self.output.name)
+        self.proc = subprocess.Popen(
+            [sys.executable, '-m', 'core.worker_pool'],
+            cwd=str(BASE_DIR), stdin=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+        self._send(spec)
+        reply = self._recv()
+        if not reply.get('ready'):
+            raise RuntimeError(f'推理工作进程 {rank} 启动失败: {reply.get("error")}')
+
+    def _send(self, message):
+        self.proc.stdin.write((json.dumps(message) + '\n').encode('utf-8'))
+        self.proc.stdin.flush()
+
+    def _recv(self):
+        line = self.proc.stdout.readline()
+        if not line:
+            raise RuntimeError(f'推理工作进程 {self.rank} 已退出')
+        return json.loads(line)
+
+    def infer(self, x):
+        n = x.numel()
+        torch.frombuffer(self.input.buf, dtype=torch.float32, count=n).copy_(x.view(-1))
+        self._send({'shape': list(x.shape)})
+        reply = self._recv()
+        if 'error' in reply:
+            raise RuntimeError(reply['error'])
+        shape = reply['shape']
+        count = 1
+        for dim in shape:
+            count *= dim
+        return torch.frombuffer(self.output.buf, dtype=torch.float32, count=count).view(shape).clone()
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=5)
+        except Exception:
+            self.proc.kill()
+        for shm in (self.input, self.output):
+            shm.close()
+            shm.unlink()
+
+
+class ProcessInferencePool:
+    """
+    多进程推理池，调用方式与模型一致：y = pool(x)
+    :param model: 已加载权重的 Unet（仅用于导出 state_dict，可随后释放）
+    :param num_workers: 工作进程数
+    :param threads_per_worker: 每个进程的 torch 线程数，默认按 CPU 核数均分
+    :param max_batch: 单次调用的最大 batch，决定输入/输出缓冲区大小
+    :param image_size: 输入切片边长
+    :param pin_cpus: 是否为每个进程绑定互不重叠的 CPU 核（此时进程数不超过可用核数）
+    """
+
+    # 计算在子进程中进行，等待结果的管道读写可被 eventlet 协程化，无需卸载到原生线程
+    cooperative = True
+    # 并发调用各自占用一个空闲进程，不经过微批服务（合并后只有一个进程在计算）
+    parallel = True
+
+    def __init__(self, model, num_workers=2, threads_per_worker=None, max_batch=8,
+                 image_size=512, pin_cpus=True, builder=('core.net.unet', 'Unet', [1, 1])):
+        cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') \
+            else list(range(os.cpu_count() or 1))
+        self.num_workers = max(1, min(int(num_workers), len(cpus)) if pin_cpus else int(num_workers))
+        self.threads_per_worker = threads_per_worker or max(1, len(cpus) // self.num_workers)
+        self.slot_elems = max_batch * image_size * image_size
+        self._spec = {'builder': list(builder), 'threads': self.threads_per_worker}
+        weights_file = getattr(model, 'weights_file', None)
+        if weights_file:
+            # 权重来自映射文件：各进程直接映射同一文件，共享页缓存中的物理页
+            self._weights = None
+            self._weights_bytes = os.path.getsize(weights_file)
+            self._spec['weights_file'] = weights_file
+        else:
+            self._weights, index = pack_state_dict(model.state_dict())
+            self._weights_bytes = self._weights.size
+            self._spec.update(weights=self._weights.name, index=index)
+        self._cpus = cpus if pin_cpus else None
+        self._free = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self._open = 0  # 尚未关闭的工作进程数
+        self._all_closed = threading.Event()
+        self.stats = {'workers': self.num_workers, 'busy': 0, 'max_busy': 0, 'calls': 0}
+
+    def start(self):
+        """启动全部工作进程"""
+        k = self.threads_per_worker
+        for rank in range(self.num_workers):
+            spec = dict(self._spec)
+            if self._cpus:
+                spec['cpus'] = self._cpus[rank * k:(rank + 1) * k] or self._cpus
+            worker = _Worker(rank, spec, self.slot_elems * 4)
+            self._workers.append(worker)
+            self._open += 1
+            self._free.put(worker)
+        print(f"[WorkerPool] 已启动 {self.num_workers} 个推理进程 "
+              f"(每进程 {k} 线程, 共享权重 {self._weights_bytes / 1024 / 1024:.1f}MB)")
+        return self
+
+    def __call__(self, x):
+        if self._closed:
+            raise RuntimeError('推理工作池已关闭')
+        x = x.detach().to('cpu', torch.float32).contiguous()
+        if x.numel() > self.slot_elems:
+            per_chunk = max(1, self.slot_elems // max(1, x[0].numel()))
+            return self._map(x.split(per_chunk))
+
+        worker = self._free.get()
+        if worker is None:
+            # 关闭标记：放回以唤醒其他等待者
+            self._free.put(None)
+            raise RuntimeError('推理工作池已关闭')
+        with self._lock:
+            self.stats['calls'] += 1
+            self.stats['busy'] += 1
+            self.stats['max_busy'] = max(self.stats['max_busy'], self.stats['busy'])
+        try:
+            return worker.infer(x)
+        finally:
+            with self._lock:
+                self.stats['busy'] -= 1
+                closing = self._closed
+                if not closing:
+                    self._free.put(worker)
+            if closing:
+                # 关闭期间仍在推理的进程，在本次请求结束后关闭
+                self._retire(worker)
+
+    def _map(self, chunks):
+        """
+        超过缓冲区的输入分块后并发执行
+        最多 num_workers 个线程依次领取分块，并发度受空闲进程数限制（其他请求占用的进程需等待其归还）
+        """
+        results, errors = [None] * len(chunks), []
+        pending = iter(enumerate(chunks))
+
+        def run():
+            for i, chunk in pending:
+                try:
+                    results[i] = self(chunk)
+                except Exception as e:
+                    errors.append(e)
+                    return
+
+        threads = [threading.Thread(target=run, daemon=True)
+                   for _ in range(min(len(chunks), self.num_workers))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        return torch.cat(results, dim=0)
+
+    def stop(self, timeout=60):
+        """
+        关闭工作池：空闲进程立即关闭，进行中的推理结束后再关闭其进程（不中断请求），
+        全部进程关闭后释放共享权重
+        :return: 是否在 timeout 秒内全部关闭
+        """
+        with self._lock:
+            if self._closed:
+                return self._all_closed.is_set()
+            self._closed = True
+            if not self._open:
+                self._all_closed.set()
+            idle = []
+            while True:
+                try:
+                    worker = self._free.get_nowait()
+                except queue.Empty:
+                    break
+                if worker is not None:
+                    idle.append(worker)
+            self._free.put(None)
+        for worker in idle:
+            self._retire(worker)
+        if not self._all_closed.wait(timeout):
+            with self._lock:
+                busy = self._open
+            print(f"[WorkerPool] ⚠️ {busy} 个推理进程仍在处理请求，将在请求结束后关闭")
+            return False
+        print(f"[WorkerPool] 推理进程已关闭")
+        return True
+
+    def _retire(self, worker):
+        """关闭一个工作进程，最后一个进程关闭后释放共享权重"""
+        worker.close()
+        with self._lock:
+            self._open -= 1
+            last = self._open == 0
+        if last:
+            if self._weights is not None:
+                self._weights.close()
+                self._weights.unlink()
+            self._all_closed.set()
+
+
+# ==================== 工作进程入口 ====================
+
+def _worker_main():
+    """工作进程：stdout 仅用于协议消息，其余输出重定向到 stderr"""
+    protocol = os.fdopen(os.dup(sys.stdout.fileno()), 'w', buffering=1)
+    sys.stdout = sys.stderr
+
+    def reply(message):
+        protocol.write(json.dumps(message) + '\n')
+
+    try:
+        spec = json.loads(sys.stdin.readline())
+        if spec.get('cpus') and hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, spec['cpus'])
+        torch.set_num_threads(spec['threads'])
+
+        import importlib
+        module_name, class_name, args = spec['builder']
+        model = getattr(importlib.import_module(module_name), class_name)(*args)
+
+        shms = [shared_memory.SharedMemory(name=spec[k]) for k in ('input', 'output')]
+        if 'weights_file' in spec:
+            from core import weights
+            weights.bind(model, weights.load(spec['weights_file']))
+        else:
+            shms.append(shared_memory.SharedMemory(name=spec['weights']))
+            bind_shared_state(model, shms[-1].buf, spec['index'])
+        for shm in shms:
+            _untrack(shm)
+        inp, out = shms[:2]
+        model.eval()
+    except Exception as e:
+        reply({'ready': False, 'error': str(e)})
+        return
+    reply({'ready': True})
+
+    for line in sys.stdin:
+        try:
+            shape = json.loads(line)['shape']
+            count = 1
+            for dim in shape:
+                count *= dim
+            x = torch.frombuffer(inp.buf, dtype=torch.float32, count=count).view(shape)
+            with torch.no_grad():
+                y = model(x).contiguous().float()
+            torch.frombuffer(out.buf, dtype=torch.float32, count=y.numel()).copy_(y.view(-1))
+            reply({'shape': list(y.shape)})
+        except Exception as e:
+            reply({'error': str(e)})
+
+
+if __name__ == '__main__':
+    _worker_main()
@@ -0,0 +1,177 @@
+"""
+诊断工作区
+每次上传分配唯一的工作区ID，该次诊断的全部文件位于各 tmp 子目录下的 <工作区ID>/ 中，
+诊断标识 pid = "<工作区ID>/<文件名>"，贯穿 pre_process、predict、last_process、get_feature 与访问URL。
+不同患者的同名文件（如 IM0001.dcm）互不覆盖，诊断可以安全地并行执行。
+"""
+import os
+import re
+import uuid
+from pathlib import Path
+from urllib.parse import unquote
+
+import config
+from core.writebehind import writer
+
+TMP_DIR = Path(config.BASE_DIR) / 'tmp'
+
+# 产物类型 -> (tmp 子目录, 文件名模板)
+LAYOUT = {
+    'ct': ('ct', '{pid}.dcm'),
+    'image': ('image', '{pid}{ext}'),
+    'mask': ('mask', '{pid}_mask{ext}'),
+    'draw': ('draw', '{pid}{ext}'),
+    'heatmap': ('heatmap', '{pid}_heatmap{ext}'),
+    'prob': ('prob', '{pid}.npz'),
+}
+
+# 图像产物可能的扩展名（编码格式可在系统设置中修改，已有文件保留写入时的格式）
+IMAGE_EXTENSIONS = ('.png', '.webp', '.jpg')
+
+# 图像产物当前的扩展名，由 core.encoding 按编码设置更新
+extensions = {kind: '.png' for kind, (_, pattern) in LAYOUT.items() if '{ext}' in pattern}
+
+_WORKSPACE_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+def new_id():
+    return uuid.uuid4().hex
+
+
+def make_pid(workspace_id, stem):
+    return f'{workspace_id}/{stem}'
+
+
+def parse_pid(pid):
+    """
+    校验 pid，返回 (工作区ID, 文件名)；不合法时抛出 ValueError
+    兼容引入工作区之前不带工作区ID的 pid，此时工作区ID为 None
+    """
+    parts = pid.split('/')
+    if len(parts) == 1:
+        workspace_id, stem = None, parts[0]
+    elif len(parts) == 2 and _WORKSPACE_ID.match(parts[0]):
+        workspace_id, stem = parts
+    else:
+        raise ValueError(f'无效的诊断标识: {pid}')
+    if not stem or stem in ('.', '..') or '\\' in stem:
+        raise ValueError(f'无效的诊断标识: {pid}')
+    return workspace_id, stem
+
+
+def artifact_path(kind, pid, create=False, ext=None):
+    """产物的磁盘路径（默认使用当前编码格式的扩展名），create=True 时创建所在目录"""
+    subdir, pattern = LAYOUT[kind]
+    path = TMP_DIR / subdir / pattern.format(pid=pid, ext=ext or extensions.get(kind, ''))
+    if create:
+        path.parent.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def find_artifact(kind, pid):
+    """
+    已写入（或正在延迟写入）的产物路径：优先当前格式，其次为修改编码设置前写入的其他格式；
+    都不存在时返回当前格式的路径
+    """
+    path = artifact_path(kind, pid)
+    if writer.exists(path) or kind not in extensions:
+        return path
+    for ext in IMAGE_EXTENSIONS:
+        other = artifact_path(kind, pid, ext=ext)
+        if writer.exists(other):
+            return other
+    return path
+
+
+def artifact_url(kind, pid):
+    """
+    产物的访问URL，附带内容版本 ?v=：同一路径的产物被重新写入（换模型重新诊断等）后URL随之改变，
+    浏览器可以长期缓存带版本的URL
+    """
+    subdir, _ = LAYOUT[kind]
+    name = find_artifact(kind, pid).relative_to(TMP_DIR / subdir).as_posix()
+    url = f'{config.SERVER_URL}/tmp/{subdir}/{name}'
+    version = artifact_version(kind, pid)
+    return f'{url}?v={version}' if version else url
+
+
+def artifact_version(kind, pid):
+    """
+    产物内容的版本标记：待写入时为提交时间，已落盘时为修改时间（延迟写入的产物以提交时间为修改时间）；
+    不存在时返回 None
+    热力图由概率图按需渲染，使用概率图的版本
+    """
+    path = artifact_path('prob', pid) if kind == 'heatmap' else find_artifact(kind, pid)
+    mtime = mtime_ns(path)
+    return None if mtime is None else f'{mtime:x}'
+
+
+def mtime_ns(path):
+    """产物的修改时间（纳秒）：待写入时为提交时间；不存在时返回 None"""
+    version = writer.version(path)
+    if version is not None:
+        return int(version, 16)
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def stem_of(kind, name):
+    """按文件名模板从产物文件名（相对子目录）还原 pid，不匹配时返回 None"""
+    _, pattern = LAYOUT[kind]
+    prefix, suffix = pattern.split('{pid}')
+    for ext in (IMAGE_EXTENSIONS if '{ext}' in suffix else ('',)):
+        tail = suffix.format(ext=ext)
+        if name.startswith(prefix) and name.endswith(tail) and len(name) > len(prefix) + len(tail):
+            return name[len(prefix):len(name) - len(tail)]
+    return None
+
+
+def parse_path(relpath):
+    """从 tmp/ 下的相对路径（"<子目录>/[<工作区ID>/]<文件名>"）还原 (产物类型, pid)，无法识别时返回 None"""
+    subdir, _, name = relpath.partition('/')
+    for kind, (kind_dir, _) in LAYOUT.items():
+        if kind_dir == subdir:
+            head, _, tail = name.rpartition('/')
+            stem = stem_of(kind, tail)
+            if stem is None:
+                return None
+            return kind, (make_pid(head, stem) if head else stem)
+    return None
+
+
+def pid_of(relpath):
+    """从 tmp/ 下的相对路径还原 pid，无法识别时返回 None"""
+    parsed = parse_path(relpath)
+    return parsed[1] if parsed else None
+
+
+def pid_from_url(url, kind='image'):
+    """从产物URL解析 pid，无法解析时返回 None"""
+    subdir, _ = LAYOUT[kind]
+    marker = f'/tmp/{subdir}/'
+    if marker not in url:
+        return None
+    name = unquote(url.split(marker, 1)[-1].split('?', 1)[0])
+    pid = stem_of(kind, name)
+    if pid is None:
+        return None
+    try:
+        parse_pid(pid)
+    except ValueError:
+        return None
+    return pid
+
+
+def create(filename):
+    """
+    为上传文件创建工作区
+    :return: (pid, DICOM 在工作区中的路径)
+    """
+    stem = Path(filename.replace('\\', '/')).name
+    if stem.lower().endswith('.dcm'):
+        stem = stem[:-4]
+    pid = make_pid(new_id(), stem)
+    parse_pid(pid)
+    return pid, artifact_path('ct', pid, create=True)
@@ -0,0 +1,163 @@
+"""
+产物延迟写入（write-behind）
+流水线提交产物后立即继续执行，编码与写盘在后台原生线程池中完成，诊断结果无需等待磁盘写入即可返回。
+尚未落盘的产物保留在内存中：/tmp/ 访问、缓存采集与流水线内部回读都会优先读取内存中的数据。
+同一路径在上一次写入完成前再次提交时，新条目等待旧条目结束后再写盘（旧条目尚未写盘则跳过），磁盘上总是最新内容。
+进程退出前 flush() 写完队列中的全部产物。
+"""
+import os
+import time
+
+import config
+from core import offload
+from core.offload import native_threading as _threading
+
+
+class _Pending:
+    """一个待写入的产物"""
+
+    def __init__(self, path):
+        self.path = path
+        self.submitted_ns = time.time_ns()
+        self.previous = None  # 同一路径尚未完成的上一个条目
+        self.superseded = False  # 已有同一路径的新条目，不再写盘
+        self.data = None
+        self.error = None
+        self.encoded = _threading.Event()
+        self.written = _threading.Event()
+
+
+class WriteBehind:
+    """
+    :param workers: 后台编码/写入线程数
+    :param max_pending: 待写入产物数上限，超出时提交方等待写入完成（背压，限制内存占用）
+    """
+
+    def __init__(self, workers=2, max_pending=256):
+        self.max_pending = max_pending
+        self._pool = offload.NativePool(workers, name='write-behind')
+        self._pending = {}  # 路径 -> _Pending
+        self._cond = _threading.Condition(_threading.Lock())
+        self.stats = {'submitted': 0, 'written': 0, 'superseded': 0, 'failed': 0,
+                      'bytes_written': 0, 'memory_reads': 0}
+
+    def submit(self, path, produce):
+        """
+        提交产物，立即返回
+        :param path: 目标路径
+        :param produce: 返回文件内容 bytes 的函数（编码等），在后台线程中执行
+        队列已满时阻塞等待（原生锁），协程中应通过 offload.run_blocking 调用
+        """
+        item = _Pending(path)
+        with self._cond:
+            while len(self._pending) >= self.max_pending:
+                self._cond.wait(1.0)
+            previous = self._pending.get(str(path))
+            if previous is not None:
+                previous.superseded = True
+                item.previous = previous
+            self._pending[str(path)] = item
+            self.stats['submitted'] += 1
+        self._pool.submit(self._run, item, produce)
+        return path
+
+    def pending(self, path):
+        with self._cond:
+            return str(path) in self._pending
+
+    def version(self, path):
+        """待写入产物的版本标记（提交时间），不在队列中时返回 None"""
+        with self._cond:
+            item = self._pending.get(str(path))
+        return None if item is None else f'{item.submitted_ns:x}'
+
+    def exists(self, path):
+        """产物已写入磁盘或正在等待写入"""
+        return self.pending(path) or os.path.exists(path)
+
+    def read(self, path):
+        """
+        读取尚未落盘的产物内容，等待其编码完成；不在队列中或生成失败时返回 None
+        会阻塞原生线程，协程中应通过 offload.run_blocking 调用
+        """
+        with self._cond:
+            item = self._pending.get(str(path))
+        if item is None:
+            return None
+        item.encoded.wait()
+        if item.data is not None:
+            with self._cond:
+                self.stats['memory_reads'] += 1
+        return item.data
+
+    def read_bytes(self, path):
+        """读取产物内容：优先内存中的待写入数据，否则读取文件"""
+        data = self.read(path)
+        if data is not None:
+            return data
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def flush(self, timeout=None):
+        """等待当前队列中的产物全部写入，返回是否在超时前完成"""
+        with self._cond:
+            items = list(self._pending.values())
+        deadline = None if timeout is None else time.time() + timeout
+        for item in items:
+            remaining = None if deadline is None else max(0.0, deadline - time.time())
+            if not item.written.wait(remaining):
+                return False
+        return True
+
+    def info(self):
+        with self._cond:
+            return dict(self.stats, pending=len(self._pending))
+
+    def _run(self, item, produce):
+        try:
+            item.data = produce()
+        except Exception as e:
+            item.error = e
+            print(f"[WriteBehind] ❌ 产物生成失败: {item.path} ({e})")
+        finally:
+            item.encoded.set()
+
+        if item.previous is not None:
+            # 任务按提交顺序取出，上一个条目已在执行或已完成，等待其结束避免旧内容后落盘
+            item.previous.written.wait()
+            item.previous = None
+
+        if item.data is not None and not item.superseded:
+            try:
+                self._write(item.path, item.data, item.submitted_ns)
+            except OSError as e:
+                item.error = e
+                print(f"[WriteBehind] ❌ 写入失败: {item.path} ({e})")
+
+        with self._cond:
+            # 同一路径可能已被重新提交，只移除本次的条目
+            if self._pending.get(str(item.path)) is item:
+                del self._pending[str(item.path)]
+            if item.error is not None:
+                self.stats['failed'] += 1
+            elif item.superseded:
+                self.stats['superseded'] += 1
+            else:
+                self.stats['written'] += 1
+                self.stats['bytes_written'] += len(item.data)
+            self._cond.notify_all()
+        item.written.set()
+
+    @staticmethod
+    def _write(path, data, mtime_ns=None):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{_threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        if mtime_ns is not None:
+            # 修改时间取提交时间，落盘前后的内容版本（workspace.artifact_version）一致
+            os.utime(tmp_path, ns=(mtime_ns, mtime_ns))
+        os.replace(tmp_path, path)
+
+
+writer = WriteBehind(config.ENCODE_WORKERS, config.WRITE_BEHIND_MAX_PENDING)
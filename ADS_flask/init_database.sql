@@ -159,7 +159,11 @@ INSERT IGNORE INTO system_settings (`key`, value, description, category, updated
 ('report.template', '{"format": "standard", "includeImages": true, "includeFeatures": true}', '报告模板设置', 'report', 'system'),
 ('system.sessionTimeout', '3600', '会话超时时间（秒）', 'system', 'system'),
 ('system.maxUploadSize', '50', '最大上传文件大小（MB）', 'system', 'system'),
-('system.autoBackup', '{"enabled": false, "interval": "daily", "retention": 30}', '自动备份设置', 'system', 'system');
+('system.autoBackup', '{"enabled": false, "interval": "daily", "retention": 30}', '自动备份设置', 'system', 'system'),
+('system_encoding_image', 'png:6', 'CT预览图编码格式（png:0-9 / webp:lossless / webp:1-100 / jpeg:1-100）', 'system', 'system'),
+('system_encoding_mask', 'png:1bit', '分割掩码编码格式（png:1bit / png:0-9 / webp:lossless）', 'system', 'system'),
+('system_encoding_draw', 'webp:lossless', '轮廓叠加图编码格式（png:0-9 / webp:lossless / webp:1-100 / jpeg:1-100）', 'system', 'system'),
+('system_encoding_heatmap', 'webp:90', '热力图编码格式（png:0-9 / webp:lossless / webp:1-100 / jpeg:1-100）', 'system', 'system');
 
 -- 初始公告
 INSERT IGNORE INTO announcements (title, content, type, priority, status, created_by, published_at) VALUES 
@@ -0,0 +1,153 @@
+"""
+服务响应性压测脚本
+在后台持续请求 /api/health，同时并发提交诊断，对比诊断前后健康检查的延迟分布。
+推理阻塞 eventlet hub 时，诊断期间的健康检查延迟会随推理耗时同步上涨。
+每个并发诊断使用单独上传的图像（同一图像的并发诊断会被合并为一次计算）；
+启用多进程推理池（INFERENCE_WORKERS）时同时统计诊断期间同时忙碌的推理进程数。
+
+用法（服务已启动，建议设置 RESULT_CACHE=false 以免重复诊断命中缓存）:
+    python load_test.py --dcm path/to/image.dcm --username admin --password admin123 --concurrency 4
+"""
+import argparse
+import json
+import mimetypes
+import statistics
+import threading
+import time
+import urllib.request
+import uuid
+
+import config
+
+
+def _request(url, data=None, headers=None, method=None):
+    req = urllib.request.Request(url, data=data, headers=headers or {}, method=method)
+    with urllib.request.urlopen(req, timeout=600) as resp:
+        return json.loads(resp.read().decode('utf-8'))
+
+
+def _post_json(url, payload, token=None):
+    headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    return _request(url, json.dumps(payload).encode('utf-8'), headers, 'POST')
+
+
+def login(base, username, password):
+    resp = _post_json(f'{base}/api/login', {'username': username, 'password': password})
+    if resp.get('status') != 1:
+        raise SystemExit(f"登录失败: {resp.get('error')}")
+    return resp['data']['token']
+
+
+def upload(base, token, dcm_path):
+    """以 multipart/form-data 上传 DICOM，返回预览图URL"""
+    boundary = uuid.uuid4().hex
+    filename = dcm_path.replace('\\', '/').split('/')[-1]
+    with open(dcm_path, 'rb') as f:
+        content = f.read()
+    body = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        f'Content-Type: {mimetypes.guess_type(filename)[0] or "application/octet-stream"}\r\n\r\n'
+    ).encode('utf-8') + content + f'\r\n--{boundary}--\r\n'.encode('utf-8')
+    headers = {'Content-Type': f'multipart/form-data; boundary={boundary}',
+               'Authorization': f'Bearer {token}'}
+    resp = _request(f'{base}/api/upload', body, headers, 'POST')
+    if resp.get('status') != 1:
+        raise SystemExit(f"上传失败: {resp.get('error')}")
+    return resp['data']['image_url']
+
+
+class HealthProbe(threading.Thread):
+    """按固定间隔请求 /api/health，记录 (发起时间, 延迟秒)"""
+
+    def __init__(self, base, interval):
+        super().__init__(daemon=True)
+        self.url = f'{base}/api/health'
+        self.interval = interval
+        self.samples = []
+        self.pool = []  # (发起时间, 推理池状态)
+        self._halt = threading.Event()
+
+    def run(self):
+        while not self._halt.is_set():
+            t = time.perf_counter()
+            try:
+                resp = _request(self.url)
+                self.samples.append((t, time.perf_counter() - t))
+                pool = (resp.get('data') or {}).get('inference_pool')
+                if pool:
+                    self.pool.append((t, pool))
+            except Exception as e:
+                print(f"[LoadTest] 健康检查失败: {e}")
+            self._halt.wait(self.interval)
+
+    def stop(self):
+        self._halt.set()
+        self.join()
+
+
+def _summary(name, latencies):
+    if not latencies:
+        print(f"{name}: 无样本")
+        return
+    ms = sorted(v * 1000 for v in latencies)
+    p95 = ms[min(len(ms) - 1, int(len(ms) * 0.95))]
+    print(f"{name}: n={len(ms)}, p50={statistics.median(ms):.1f}ms, "
+          f"p95={p95:.1f}ms, max={ms[-1]:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='诊断期间服务响应性压测')
+    parser.add_argument('--base', default=config.SERVER_URL, help='服务地址')
+    parser.add_argument('--dcm', required=True, help='用于诊断的 DICOM 文件')
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin123')
+    parser.add_argument('--concurrency', type=int, default=4, help='同时提交的诊断数')
+    parser.add_argument('--rounds', type=int, default=2, help='诊断轮数')
+    parser.add_argument('--interval', type=float, default=0.05, help='健康检查间隔（秒）')
+    parser.add_argument('--baseline', type=float, default=2.0, help='诊断前基线采样时长（秒）')
+    args = parser.parse_args()
+
+    token = login(args.base, args.username, args.password)
+    image_urls = [upload(args.base, token, args.dcm) for _ in range(args.concurrency)]
+    print(f"[LoadTest] 已上传 {len(image_urls)} 份图像")
+
+    probe = HealthProbe(args.base, args.interval)
+    probe.start()
+    time.sleep(args.baseline)
+    busy_start = time.perf_counter()
+
+    durations = []
+
+    def diagnose(image_url):
+        t = time.perf_counter()
+        resp = _post_json(f'{args.base}/api/predict', {'imageUrl': image_url}, token)
+        durations.append(time.perf_counter() - t)
+        if resp.get('status') != 1:
+            print(f"[LoadTest] 诊断失败: {resp.get('error')}")
+
+    for _ in range(args.rounds):
+        workers = [threading.Thread(target=diagnose, args=(url,)) for url in image_urls]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+    busy_end = time.perf_counter()
+    probe.stop()
+
+    print(f"\n{'='*60}")
+    _summary('健康检查(空闲)', [d for t, d in probe.samples if t < busy_start])
+    _summary('健康检查(诊断中)', [d for t, d in probe.samples if busy_start <= t < busy_end])
+    _summary('诊断请求', durations)
+    pool = [p for t, p in probe.pool if busy_start <= t < busy_end]
+    if pool:
+        busy = [p['busy'] for p in pool]
+        print(f"推理进程: 共 {pool[-1]['workers']} 个, 诊断中平均忙碌 {statistics.mean(busy):.2f} 个, "
+              f"采样最大 {max(busy)} 个, 累计峰值 {pool[-1]['max_busy']} 个")
+    print(f"{'='*60}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,8 @@
 """
 诊断相关路由
 """
-import os
 import json
-import shutil
 import datetime
-from pathlib import Path
 from flask import Blueprint, request, jsonify, current_app
 
 from extensions import db, socketio, emit_progress
@@ -16,6 +13,11 @@ from utils import (
 )
 import config
 import core.main
+import core.predict
+from core import workspace
+from core.jobs import JobQueueFull
+from core.cache import cached_run
+from core.model_manager import ModelNotFound
 
 diagnosis_bp = Blueprint('diagnosis', __name__)
 
@@ -40,27 +42,33 @@ def upload_file():
         print(f"[Upload] 时间: {datetime.datetime.now()}")
         
         if file and allowed_file(file.filename, config.ALLOWED_EXTENSIONS):
-            # 保存文件
-            src_path = os.path.join(config.UPLOAD_FOLDER, file.filename)
-            print(f"[Upload] 保存到: {src_path}")
-            file.save(src_path)
+            # 为本次上传分配独立工作区，同名文件互不覆盖
+            pid, image_path = workspace.create(file.filename)
+            workspace_id = workspace.parse_pid(pid)[0]
             
-            # 复制到临时目录
-            tmp_ct_dir = os.path.join(config.BASE_DIR, 'tmp', 'ct')
-            shutil.copy(src_path, tmp_ct_dir)
-            image_path = os.path.join(tmp_ct_dir, file.filename)
+            # 归档上传内容（解析请求时已写盘并计算哈希），工作区通过硬链接引用
+            store = current_app.upload_store
+            stored = store.put(file)
+            store.link(stored, image_path)
+            print(f"[Upload] 保存到: {image_path}")
             
             # 仅进行预处理，生成预览图
             print(f"[Upload] 预处理图像...")
-            from core import process
-            image_data = process.pre_process(image_path)
-            pid = image_data[1]
+            from core import process, offload
+            offload.run_blocking(process.pre_process, str(image_path), None, pid)
             
             result = {
-                'image_url': f'{config.SERVER_URL}/tmp/image/{pid}.png',
+                'image_url': workspace.artifact_url('image', pid),
+                'workspace_id': workspace_id,
                 'message': '上传成功，请点击开始诊断'
             }
             
+            # 预推理：医生查看预览图期间模型已在后台运行
+            if config.SPECULATIVE_INFERENCE:
+                job_id = _start_speculative(pid, image_path)
+                if job_id:
+                    result['speculative_job_id'] = job_id
+            
             # 记录审计日志
             log_audit('upload', 'diagnosis', target=file.filename)
             
@@ -78,6 +86,206 @@ def upload_file():
         return error_response(str(e))
 
 
+# ==================== 预测公共逻辑 ====================
+
+def _val(info, key):
+    """从新格式 {key: [中文名, 数值]} 中提取数值"""
+    v = info.get(key, 0)
+    return v[1] if isinstance(v, list) else v
+
+
+def _resolve_image(image_url):
+    """
+    从预览图URL解析诊断标识并定位工作区中的原始DICOM
+    :return: (pid, dcm_path)，URL无效时 pid 为 None
+    """
+    pid = workspace.pid_from_url(image_url, 'image')
+    if pid is None:
+        return None, None
+    current_app.artifact_store.touch(pid)
+    return pid, workspace.artifact_path('ct', pid)
+
+
+def _select_model(data):
+    """
+    按请求中的 model（模型名称）或 organ（器官）确定使用的模型
+    :return: 模型名称，None 表示当前模型；器官不在用户诊断权限内时抛出 PermissionError
+    """
+    organ = data.get('organ')
+    user = getattr(request, 'current_user', None)
+    if organ and user is not None and user.role != 'admin' and organ not in user.get_permissions():
+        raise PermissionError(f'没有 {organ} 诊断权限')
+    return current_app.model_manager.resolve(model=data.get('model'), organ=organ)
+
+
+def _run_pipeline(pid, dcm_path, progress_callback, timings=None, model_name=None):
+    """
+    执行诊断流水线（优先查询结果缓存），返回 (pid, image_info)
+    同一图像、同一模型的并发调用合并为一次计算，后到者共享结果与进度
+    整个流水线固定使用开始时的模型，期间切换模型不影响本次诊断
+    :param model_name: 使用的模型名称，None 表示当前模型；未常驻的模型在此加载
+    """
+    app = current_app._get_current_object()
+    with app.model_manager.acquire(model_name) as slot:
+        model, model_id = (slot.model, slot.model_id) if slot else (None, None)
+        return _run_with_model(app, model, model_id, pid, dcm_path, progress_callback, timings)
+
+
+def _run_with_model(app, model, model_id, pid, dcm_path, progress_callback, timings):
+    """使用指定模型执行诊断流水线"""
+    if model is not None and app.inference_server is not None:
+        model = app.inference_server.bind(model)
+    
+    def run(progress):
+        run_timings = {}
+        content_hash = app.upload_store.hash_of(dcm_path) if app.result_cache is not None else None
+        result_pid, image_info = cached_run(
+            app.result_cache, dcm_path, pid, model_id,
+            lambda: core.main.c_main(str(dcm_path), model, progress, timings=run_timings, pid=pid),
+            run_timings, content_hash
+        )
+        return result_pid, image_info, run_timings
+    
+    (result_pid, image_info, run_timings), shared = app.singleflight.do(
+        (pid, model_id), run, progress_callback
+    )
+    if timings is not None:
+        timings.update(run_timings)
+        if shared:
+            timings['coalesced'] = True
+    if shared:
+        image_info = json.loads(json.dumps(image_info))
+    return result_pid, image_info
+
+
+def _speculative_job(job, app, pid, dcm_path):
+    """上传后预推理：只执行流水线，不保存诊断记录"""
+    manager = app.job_manager
+    
+    def progress(pct, msg):
+        manager.update(job, pct, msg)
+    
+    with app.app_context():
+        model_id = app.model_id
+        result_pid, image_info = _run_pipeline(pid, dcm_path, progress, timings=job.timings)
+        return {'pid': result_pid, 'image_info': image_info, 'model_id': model_id}
+
+
+def _start_speculative(pid, dcm_path):
+    """提交预推理任务，队列已满或模型未加载时跳过"""
+    app = current_app._get_current_object()
+    if app.model is None:
+        return None
+    try:
+        job = app.job_manager.submit(_speculative_job, app, pid, dcm_path,
+                                     kind='speculative', key=pid)
+    except JobQueueFull:
+        print(f"[Upload] 任务队列已满，跳过预推理: {pid}")
+        return None
+    print(f"[Upload] 已启动预推理任务: {job.id}")
+    return job.id
+
+
+def _compute(pid, dcm_path, progress_callback, timings=None, model_name=None):
+    """
+    获取诊断结果：存在同一文件的预推理任务时等待并复用其结果，否则执行流水线
+    预推理仍在排队时直接取消并自行计算（避免工作线程互相等待）；
+    预推理使用的模型已被切换时结果作废，重新计算；预推理只使用当前模型，指定其他模型时不复用
+    """
+    if model_name is not None:
+        return _run_pipeline(pid, dcm_path, progress_callback, timings, model_name)
+    manager = current_app.job_manager
+    job = manager.find(pid, kind='speculative')
+    if job is not None and manager.cancel(job):
+        job = None
+    if job is not None and job.status in ('running', 'done'):
+        progress_callback(40, '等待预推理结果...')
+        job.wait()
+        result = job.result
+        if job.status == 'done' and result['model_id'] == current_app.model_id:
+            print(f"[Predict] 复用预推理任务结果: {job.id}")
+            if timings is not None:
+                timings.update(job.timings)
+                timings['speculative'] = True
+            return result['pid'], json.loads(json.dumps(result['image_info']))
+    return _run_pipeline(pid, dcm_path, progress_callback, timings)
+
+
+def _shadow(app, model_name, dcm_path, result_pid, image_info, timings):
+    """按抽样比例在后台用候选模型对同一图像影子推理（不影响本次响应）"""
+    try:
+        slot = app.model_manager.current
+        primary = model_name or (slot.name if slot is not None else None)
+        if primary is not None:
+            app.shadow.maybe_submit(primary, dcm_path, result_pid, image_info, timings)
+    except Exception as e:
+        print(f"[Shadow] 提交影子推理失败: {e}")
+
+
+def _build_result(result_pid, image_info, source_pid=None):
+    """
+    根据流水线输出构造返回给前端的结果（result_pid 形如 "<工作区ID>/<文件名>.png"）
+    :param source_pid: 原始诊断标识，重新二值化的结果中预览图与热力图仍取自原始诊断
+    """
+    pid = result_pid[:-len('.png')] if result_pid.endswith('.png') else result_pid
+    source_pid = source_pid or pid
+    result = {
+        'image_url': workspace.artifact_url('image', source_pid),
+        'draw_url': workspace.artifact_url('draw', pid),
+        'image_info': image_info
+    }
+    
+    # 添加热力图URL
+    if image_info.get('has_heatmap'):
+        result['heatmap_url'] = workspace.artifact_url('heatmap', source_pid)
+    return result
+
+
+def _save_record(result, filename, patient_id, doctor_username):
+    """保存诊断记录到数据库，返回记录ID（失败时为 None）"""
+    image_info = result['image_info']
+    try:
+        record = DiagnosisRecord(
+            patient_id=patient_id,
+            doctor_username=doctor_username,
+            filename=filename,
+            image_url=result['image_url'],
+            draw_url=result['draw_url'],
+            area=_val(image_info, 'area'),
+            perimeter=_val(image_info, 'perimeter'),
+            features=json.dumps(image_info, ensure_ascii=False)
+        )
+        db.session.add(record)
+        db.session.commit()
+        print(f"[Predict] 诊断记录已保存，ID: {record.id}")
+        return record.id
+    except Exception as save_err:
+        db.session.rollback()
+        print(f"[Predict] 保存诊断记录失败: {save_err}")
+        return None
+
+
+def _emit_result(result, job_id=None):
+    """通过 Socket 发送结果"""
+    image_info = result['image_info']
+    payload = {
+        'url2': result['draw_url'],
+        'feature_list': image_info,
+        'area': _val(image_info, 'area'),
+        'perimeter': _val(image_info, 'perimeter'),
+        'record_id': result.get('record_id')
+    }
+    if job_id:
+        payload['job_id'] = job_id
+    socketio.emit('result', payload)
+
+
+def _current_username():
+    if hasattr(request, 'current_user') and request.current_user:
+        return request.current_user.username
+    return None
+
+
 @diagnosis_bp.route('/predict', methods=['POST', 'OPTIONS'])
 @token_required
 def predict_image():
@@ -92,81 +300,45 @@ def predict_image():
         data = request.get_json()
         image_url = data.get('imageUrl', '')
         
-        # 从URL中提取文件名
-        if '/tmp/image/' in image_url:
-            filename = image_url.split('/tmp/image/')[-1].replace('.png', '')
-        else:
+        # 从URL中解析诊断标识（工作区ID/文件名）
+        pid, dcm_path = _resolve_image(image_url)
+        if pid is None:
             return error_response('无效的图像URL')
         
-        print(f"[Predict] 处理文件: {filename}")
+        # 按器官或指定的模型名称选择模型
+        try:
+            model_name = _select_model(data)
+        except PermissionError as e:
+            return error_response(str(e), 403)
+        except ModelNotFound as e:
+            return error_response(str(e), 404)
+        
+        print(f"[Predict] 处理文件: {pid}")
         
         emit_progress(10, '正在准备分析...')
         
         # 检查原始dcm文件是否存在
-        dcm_path = Path(config.BASE_DIR) / 'tmp' / 'ct' / f'{filename}.dcm'
         if not dcm_path.exists():
             socketio.emit('error', '原始图像文件不存在')
             return error_response('原始图像文件不存在')
         
         # 执行预测
         print(f"[Predict] 开始AI分析...")
-        pid, image_info = core.main.c_main(str(dcm_path), current_app.model, emit_progress)
+        timings = {}
+        result_pid, image_info = _compute(pid, dcm_path, emit_progress, timings=timings, model_name=model_name)
         
         emit_progress(100, '分析完成')
         
-        result = {
-            'image_url': f'{config.SERVER_URL}/tmp/image/{pid}',
-            'draw_url': f'{config.SERVER_URL}/tmp/draw/{pid}',
-            'image_info': image_info
-        }
-        
-        # 添加热力图URL
-        if image_info.get('has_heatmap'):
-            # pid 包含 .png，需去掉扩展名用于 heatmap 路径 (假设 heatmap 是 .png)
-            # 实际上 pid = "filename.png"
-            file_stem = pid.replace('.png', '')
-            result['heatmap_url'] = f'{config.SERVER_URL}/tmp/heatmap/{file_stem}_heatmap.png'
+        result = _build_result(result_pid, image_info)
         
         # 保存诊断记录到数据库
-        record_id = None
-        try:
-            patient_id = data.get('patientId')
-            doctor_username = None
-            if hasattr(request, 'current_user') and request.current_user:
-                doctor_username = request.current_user.username
-            
-            # 从新格式 {key: [中文名, 数值]} 中提取数值
-            def _val(info, key):
-                v = info.get(key, 0)
-                return v[1] if isinstance(v, list) else v
-
-            record = DiagnosisRecord(
-                patient_id=patient_id,
-                doctor_username=doctor_username,
-                filename=f'{filename}.dcm',
-                image_url=result['image_url'],
-                draw_url=result['draw_url'],
-                area=_val(image_info, 'area'),
-                perimeter=_val(image_info, 'perimeter'),
-                features=json.dumps(image_info, ensure_ascii=False)
-            )
-            db.session.add(record)
-            db.session.commit()
-            record_id = record.id
-            print(f"[Predict] 诊断记录已保存，ID: {record.id}")
-        except Exception as save_err:
-            print(f"[Predict] 保存诊断记录失败: {save_err}")
-        
-        result['record_id'] = record_id
+        result['record_id'] = _save_record(result, dcm_path.name, data.get('patientId'), _current_username())
         
         # 通过 Socket 发送结果
-        socketio.emit('result', {
-            'url2': result['draw_url'],
-            'feature_list': image_info,
-            'area': _val(image_info, 'area'),
-            'perimeter': _val(image_info, 'perimeter'),
-            'record_id': record_id
-        })
+        _emit_result(result)
+        
+        # 抽样影子推理候选模型
+        _shadow(current_app._get_current_object(), model_name, dcm_path, result_pid, image_info, timings)
         
         print(f"[Predict] 预测完成!")
         print(f"{'='*60}\n")
@@ -180,6 +352,76 @@ def predict_image():
         return error_response(str(e))
 
 
+# ==================== 异步预测任务 ====================
+
+def _predict_job(job, app, pid, dcm_path, patient_id, doctor_username, model_name=None):
+    """后台执行预测任务，在独立的应用上下文中保存诊断记录"""
+    manager = app.job_manager
+    
+    def progress(pct, msg):
+        manager.update(job, pct, msg)
+    
+    with app.app_context():
+        result_pid, image_info = _compute(pid, dcm_path, progress, timings=job.timings, model_name=model_name)
+        result = _build_result(result_pid, image_info)
+        result['record_id'] = _save_record(result, dcm_path.name, patient_id, doctor_username)
+        _emit_result(result, job.id)
+        _shadow(app, model_name, dcm_path, result_pid, image_info, job.timings)
+        return result
+
+
+@diagnosis_bp.route('/predict/jobs', methods=['POST', 'OPTIONS'])
+@token_required
+def submit_predict_job():
+    """提交异步预测任务，立即返回任务ID"""
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 1})
+    
+    try:
+        data = request.get_json() or {}
+        pid, dcm_path = _resolve_image(data.get('imageUrl', ''))
+        if pid is None:
+            return error_response('无效的图像URL')
+        if not dcm_path.exists():
+            return error_response('原始图像文件不存在')
+        try:
+            model_name = _select_model(data)
+        except PermissionError as e:
+            return error_response(str(e), 403)
+        except ModelNotFound as e:
+            return error_response(str(e), 404)
+        
+        app = current_app._get_current_object()
+        try:
+            job = app.job_manager.submit(
+                _predict_job, app, pid, dcm_path,
+                data.get('patientId'), _current_username(), model_name,
+                kind='predict', key=pid
+            )
+        except JobQueueFull as e:
+            return error_response(str(e), 503)
+        
+        print(f"[Predict] 已提交异步任务: {job.id} ({pid})")
+        return success_response(job.to_dict(), '任务已提交')
+        
+    except Exception as e:
+        print(f"[Predict] 提交任务失败: {e}")
+        return error_response(str(e))
+
+
+@diagnosis_bp.route('/predict/jobs/<job_id>', methods=['GET', 'OPTIONS'])
+@token_required
+def get_predict_job(job_id):
+    """查询异步预测任务状态，完成后包含结果"""
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 1})
+    
+    job = current_app.job_manager.get(job_id)
+    if job is None:
+        return error_response('任务不存在', 404)
+    return success_response(job.to_dict())
+
+
 @diagnosis_bp.route('/analyze', methods=['POST', 'OPTIONS'])
 @token_required
 def analyze_condition():
@@ -308,6 +550,56 @@ def save_doctor_record(record_id):
         return error_response(str(e))
 
 
+@diagnosis_bp.route('/diagnosis/<int:record_id>/threshold', methods=['POST', 'OPTIONS'])
+@token_required
+def rethreshold_record(record_id):
+    """
+    调整二值化阈值：使用诊断时保存的概率图重新生成轮廓图与特征并更新诊断记录，不重新推理
+    请求体 {"threshold": 0.35}，缺省时使用系统设置中的阈值
+    """
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 1})
+    
+    try:
+        record = DiagnosisRecord.query.get(record_id)
+        if not record:
+            return error_response('诊断记录不存在', 404)
+        
+        pid = workspace.pid_from_url(record.image_url or '', 'image')
+        if pid is None:
+            return error_response('诊断记录缺少有效的图像')
+        
+        data = request.get_json(silent=True) or {}
+        try:
+            threshold = core.predict.parse_threshold(data.get('threshold', core.predict.threshold))
+        except (TypeError, ValueError) as e:
+            return error_response(f'无效的阈值: {e}')
+        
+        current_app.artifact_store.touch(pid)
+        timings = {}
+        try:
+            result_pid, image_info = core.main.c_rethreshold(pid, threshold, timings)
+        except FileNotFoundError as e:
+            return error_response(str(e), 404)
+        
+        result = _build_result(result_pid, image_info, source_pid=pid)
+        record.draw_url = result['draw_url']
+        record.area = _val(image_info, 'area')
+        record.perimeter = _val(image_info, 'perimeter')
+        record.features = json.dumps(image_info, ensure_ascii=False)
+        db.session.commit()
+        
+        log_audit('rethreshold', 'diagnosis', target=record_id, detail={'threshold': round(threshold, 2)})
+        
+        result.update(record_id=record.id, threshold=round(threshold, 2), timings=timings)
+        return success_response(result, '阈值已更新')
+        
+    except Exception as e:
+        db.session.rollback()
+        print(f"[Diagnosis] 重新二值化失败: {e}")
+        return error_response(str(e))
+
+
 @diagnosis_bp.route('/statistics', methods=['GET', 'OPTIONS'])
 def get_statistics():
     """获取系统统计数据"""
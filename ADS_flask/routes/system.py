@@ -32,12 +32,53 @@ def health_check():
     except:
         db_status = '异常'
     
-    return success_response({
+    data = {
         'server': config.SERVER_URL,
         'model': model_status,
         'database': db_status,
         'version': '1.0.0'
-    }, '服务运行正常')
+    }
+    # 多进程推理池的忙碌进程数（压测时观察并发度）
+    pool_stats = getattr(current_app.model, 'stats', None)
+    if getattr(current_app.model, 'parallel', False) and pool_stats:
+        data['inference_pool'] = dict(pool_stats)
+    return success_response(data, '服务运行正常')
+
+
+# ==================== 存储管理 ====================
+
+@system_bp.route('/artifacts/stats', methods=['GET', 'OPTIONS'])
+@admin_required
+def artifact_stats():
+    """tmp/ 产物与上传存储的占用、淘汰统计"""
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 1})
+    
+    from flask import current_app
+    from core.writebehind import writer
+    return success_response({
+        'artifacts': current_app.artifact_store.info(),
+        'uploads': current_app.upload_store.info(),
+        'hot_cache': current_app.artifact_server.info(),
+        'write_behind': writer.info()
+    })
+
+
+@system_bp.route('/artifacts/sweep', methods=['POST', 'OPTIONS'])
+@admin_required
+def artifact_sweep():
+    """立即执行一次 tmp/ 产物清理"""
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 1})
+    
+    try:
+        from flask import current_app
+        from core.artifacts import referenced_pids
+        evicted = current_app.artifact_store.sweep(referenced_pids())
+        log_audit('sweep', 'artifacts', detail={'evicted': evicted})
+        return success_response(current_app.artifact_store.info(), f'清理完成，淘汰 {evicted} 个工作区')
+    except Exception as e:
+        return error_response(f'清理失败: {str(e)}')
 
 
 # ==================== 系统设置 ====================
@@ -84,6 +125,23 @@ def update_settings():
         settings = data['settings']
         updated_count = 0
         
+        from flask import current_app
+        from core import encoding, predict
+        for key, value in settings.items():
+            if key.startswith(encoding.SETTING_PREFIX):
+                kind = key[len(encoding.SETTING_PREFIX):]
+                if kind not in encoding.DEFAULTS:
+                    return error_response(f'未知的编码设置: {key}')
+                try:
+                    encoding.parse(kind, value)
+                except encoding.EncodingError as e:
+                    return error_response(f'{key}: {e}')
+            elif key == predict.THRESHOLD_SETTING:
+                try:
+                    predict.parse_threshold(value)
+                except ValueError as e:
+                    return error_response(f'{key}: {e}')
+        
         for key, value in settings.items():
             setting = SystemSetting.query.filter_by(key=key).first()
             if setting:
@@ -102,6 +160,10 @@ def update_settings():
                 updated_count += 1
         
         db.session.commit()
+        encoding.load_settings()
+        predict.load_settings()
+        current_app.model_manager.load_settings()
+        current_app.shadow.load_settings()
         
         log_audit('update', 'settings', 
                   detail={'updated_count': updated_count, 'keys': list(settings.keys())})
@@ -156,6 +218,8 @@ def reset_settings():
             'system_session_timeout': '24',
             'system_auto_backup': 'false',
         }
+        from core import encoding, predict
+        defaults.update({encoding.SETTING_PREFIX + kind: value for kind, value in encoding.DEFAULTS.items()})
         
         user = get_current_user()
         username = user.username if user else 'unknown'
@@ -174,6 +238,8 @@ def reset_settings():
                 reset_count += 1
         
         db.session.commit()
+        encoding.load_settings()
+        predict.load_settings()
         
         log_audit('reset', 'settings', 
                   detail={'category': category or 'all', 'reset_count': reset_count})
@@ -560,6 +626,7 @@ def delete_announcement(id):
 # ==================== 模型管理 ====================
 
 import os
+import uuid
 from pathlib import Path
 from werkzeug.utils import secure_filename
 
@@ -632,9 +699,13 @@ def get_current_model():
     try:
         from flask import current_app
         
-        # 获取当前模型设置
-        current_model_setting = SystemSetting.query.filter_by(key='current_model').first()
-        current_model_name = current_model_setting.value if current_model_setting else 'default'
+        # 当前模型以实际加载的为准，尚未加载时读取模型设置
+        manager_info = current_app.model_manager.info()
+        if manager_info['current']:
+            current_model_name = manager_info['current']['name']
+        else:
+            current_model_setting = SystemSetting.query.filter_by(key='current_model').first()
+            current_model_name = current_model_setting.value if current_model_setting else 'default'
         
         # 检查模型是否已加载
         model_loaded = current_app.model is not None
@@ -659,24 +730,48 @@ def get_current_model():
             'current_model': current_model_name,
             'model_loaded': model_loaded,
             'model_info': model_info,
-            'device': device
+            'device': device,
+            'previous_model': manager_info['previous']['name'] if manager_info['previous'] else None,
+            'switch': manager_info['switch']
         })
         
     except Exception as e:
         return error_response(str(e))
 
 
+def _save_current_model(model_name, username):
+    """保存当前模型设置"""
+    setting = SystemSetting.query.filter_by(key='current_model').first()
+    if setting:
+        setting.value = model_name
+        setting.updated_by = username
+    else:
+        setting = SystemSetting(
+            key='current_model',
+            value=model_name,
+            category='model',
+            description='当前使用的诊断模型',
+            updated_by=username
+        )
+        db.session.add(setting)
+    
+    db.session.commit()
+
+
 @system_bp.route('/models/switch', methods=['POST', 'OPTIONS'])
 @admin_required
 def switch_model():
-    """切换当前使用的模型"""
+    """
+    切换当前使用的模型
+    新模型在后台加载并预热，完成后原子替换，进行中的诊断继续使用旧模型；
+    进度通过 GET /models/switch/status 查询
+    """
     if request.method == 'OPTIONS':
         return jsonify({'status': 1})
     
     try:
         from flask import current_app
-        import torch
-        import core.net.unet as net
+        from core.model_manager import ModelSwitchInProgress
         
         data = request.get_json()
         model_name = data.get('model_name')
@@ -685,69 +780,416 @@ def switch_model():
             return error_response('请指定模型名称')
         
         # 确定模型路径
-        if model_name == 'default':
-            model_path = Path(config.BASE_DIR) / 'core' / 'net' / 'model.pth'
-        else:
-            model_path = MODELS_DIR / f'{model_name}.pth'
+        from core import loader
+        try:
+            model_path = loader.model_file(model_name)
+        except ValueError as e:
+            return error_response(str(e))
         
         if not model_path.exists():
             return error_response(f'模型文件不存在: {model_name}')
         
-        # 加载新模型
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        new_model = net.Unet(1, 1).to(device)
+        # 后台加载并预热（已按需常驻的模型直接切换），完成后切换并保存当前模型设置；模型ID变化后旧的结果缓存自然失效
+        user = get_current_user()
+        username = user.username if user else 'unknown'
+        try:
+            current_app.model_manager.switch(
+                model_name, model_path,
+                on_ready=lambda slot: _save_current_model(slot.name, username)
+            )
+        except ModelSwitchInProgress as e:
+            return error_response(str(e))
         
-        if torch.cuda.is_available():
-            new_model.load_state_dict(torch.load(str(model_path)))
-        else:
-            new_model.load_state_dict(torch.load(str(model_path), map_location='cpu'))
+        log_audit('switch', 'model', target=model_name, 
+                  detail={'model_path': str(model_path)})
         
-        new_model.eval()
+        return success_response(
+            {'model_name': model_name, 'model_path': str(model_path),
+             'switch': current_app.model_manager.info()['switch']},
+            message=f'正在后台加载模型: {model_name}，完成后自动切换'
+        )
         
-        # 更新应用的模型
-        current_app.model = new_model
+    except Exception as e:
+        return error_response(f'切换模型失败: {str(e)}')
+
+
+@system_bp.route('/models/switch/status', methods=['GET', 'OPTIONS'])
+@admin_required
+def switch_model_status():
+    """模型切换进度及当前、上一个模型"""
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 1})
+    
+    from flask import current_app
+    return success_response(current_app.model_manager.info())
+
+
+@system_bp.route('/models/rollback', methods=['POST', 'OPTIONS'])
+@admin_required
+def rollback_model():
+    """立即切回上一个模型（上一个模型始终保留在内存中）"""
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 1})
+    
+    try:
+        from flask import current_app
+        
+        try:
+            slot = current_app.model_manager.rollback()
+        except ValueError as e:
+            return error_response(str(e))
         
-        # 保存当前模型设置到数据库
         user = get_current_user()
-        username = user.username if user else 'unknown'
+        _save_current_model(slot.name, user.username if user else 'unknown')
+        log_audit('rollback', 'model', target=slot.name)
         
-        setting = SystemSetting.query.filter_by(key='current_model').first()
-        if setting:
-            setting.value = model_name
-            setting.updated_by = username
-        else:
-            setting = SystemSetting(
-                key='current_model',
-                value=model_name,
-                category='model',
-                description='当前使用的诊断模型',
-                updated_by=username
-            )
-            db.session.add(setting)
+        return success_response(current_app.model_manager.info(), message=f'已回滚到模型: {slot.name}')
+        
+    except Exception as e:
+        db.session.rollback()
+        return error_response(f'回滚失败: {str(e)}')
+
+
+@system_bp.route('/models/routes', methods=['GET', 'OPTIONS'])
+@admin_required
+def get_model_routes():
+    """获取器官模型路由及常驻内存的模型"""
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 1})
+    
+    from flask import current_app
+    from core.model_manager import DEFAULT_ORGAN
+    info = current_app.model_manager.info()
+    return success_response({
+        'routes': info['routes'],
+        'default_organ': DEFAULT_ORGAN,
+        'resident': info['resident'],
+        'budget_mb': info['budget_mb'],
+        'used_mb': info['used_mb'],
+        'stats': info['stats']
+    })
+
+
+@system_bp.route('/models/routes', methods=['PUT'])
+@admin_required
+def update_model_routes():
+    """
+    更新器官模型路由
+    请求体: {"routes": {"lung": "lung_unet", "liver": ""}}，模型名称为空表示删除该器官的路由
+    """
+    try:
+        from flask import current_app
+        from core import loader
+        from core.model_manager import ROUTE_PREFIX
+        
+        routes = (request.get_json() or {}).get('routes')
+        if not isinstance(routes, dict) or not routes:
+            return error_response('请提供器官模型路由')
+        
+        for organ, model_name in routes.items():
+            if not organ.replace('_', '').isalnum():
+                return error_response(f'无效的器官名称: {organ}')
+            if model_name:
+                try:
+                    model_path = loader.model_file(model_name)
+                except ValueError as e:
+                    return error_response(str(e))
+                if not model_path.exists():
+                    return error_response(f'模型不存在: {model_name}')
         
+        user = get_current_user()
+        for organ, model_name in routes.items():
+            key = ROUTE_PREFIX + organ
+            setting = SystemSetting.query.filter_by(key=key).first()
+            if not model_name:
+                if setting:
+                    db.session.delete(setting)
+                continue
+            if setting:
+                setting.value = model_name
+                setting.updated_by = user.username if user else None
+            else:
+                db.session.add(SystemSetting(
+                    key=key,
+                    value=model_name,
+                    category='model',
+                    description=f'{organ} 诊断使用的模型',
+                    updated_by=user.username if user else None
+                ))
         db.session.commit()
+        current_app.model_manager.load_settings()
         
-        log_audit('switch', 'model', target=model_name, 
-                  detail={'model_path': str(model_path)})
+        log_audit('update', 'model_routes', detail=routes)
         
-        return success_response(
-            {'model_name': model_name, 'model_path': str(model_path)},
-            message=f'已成功切换到模型: {model_name}'
-        )
+        return success_response({'routes': current_app.model_manager.routes}, message='模型路由已更新')
         
     except Exception as e:
         db.session.rollback()
-        return error_response(f'切换模型失败: {str(e)}')
+        return error_response(f'更新失败: {str(e)}')
+
+
+@system_bp.route('/models/shadow', methods=['GET', 'OPTIONS'])
+@admin_required
+def get_model_shadow():
+    """获取候选模型影子推理的设置与比较结果（Dice、特征差值、推理耗时分位数）"""
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 1})
+    
+    from flask import current_app
+    return success_response(current_app.shadow.summary())
+
+
+@system_bp.route('/models/shadow', methods=['PUT'])
+@admin_required
+def update_model_shadow():
+    """
+    设置影子推理的候选模型与抽样比例
+    请求体: {"candidate": "unet_v2", "rate": 0.1}，候选模型为空表示停用
+    """
+    try:
+        from flask import current_app
+        from core.model_manager import ModelNotFound
+        from core.shadow import CANDIDATE_SETTING, RATE_SETTING, parse_rate
+        
+        data = request.get_json() or {}
+        candidate = (data.get('candidate') or '').strip()
+        try:
+            rate = parse_rate(data.get('rate', 0))
+        except (TypeError, ValueError):
+            return error_response('抽样比例应为 0-1 之间的数值')
+        if candidate:
+            try:
+                current_app.model_manager.resolve(model=candidate)
+            except ModelNotFound as e:
+                return error_response(str(e), 404)
+        
+        user = get_current_user()
+        values = {
+            CANDIDATE_SETTING: (candidate, '影子推理的候选模型'),
+            RATE_SETTING: (str(rate), '影子推理的抽样比例 (0-1)'),
+        }
+        for key, (value, description) in values.items():
+            setting = SystemSetting.query.filter_by(key=key).first()
+            if setting:
+                setting.value = value
+                setting.updated_by = user.username if user else None
+            else:
+                db.session.add(SystemSetting(
+                    key=key,
+                    value=value,
+                    category='model',
+                    description=description,
+                    updated_by=user.username if user else None
+                ))
+        db.session.commit()
+        current_app.shadow.load_settings()
+        
+        log_audit('update', 'model_shadow', detail={'candidate': candidate, 'rate': rate})
+        
+        return success_response(current_app.shadow.summary(), message='影子推理设置已更新')
+        
+    except Exception as e:
+        db.session.rollback()
+        return error_response(f'更新失败: {str(e)}')
+
+
+@system_bp.route('/models/shadow/stats', methods=['DELETE', 'OPTIONS'])
+@admin_required
+def reset_model_shadow():
+    """清空影子推理的比较结果"""
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 1})
+    
+    from flask import current_app
+    current_app.shadow.reset()
+    log_audit('delete', 'model_shadow_stats')
+    return success_response(message='影子推理统计已清空')
+
+
+def _validate_model_job(job, app, upload_id, sha256):
+    """后台任务：在独立进程中校验上传的模型，通过后移入模型目录"""
+    import time
+    from core import offload
+    from core.model_upload import validate_in_subprocess
+    
+    uploads = app.model_uploads
+    session = uploads.get(upload_id)
+    app.job_manager.update(job, 10, '正在校验模型文件...')
+    try:
+        check = offload.run_blocking(validate_in_subprocess, session.part_path)
+    except Exception:
+        session.status = 'failed'
+        session.updated_at = time.time()
+        uploads.discard(session, forget=False)
+        raise
+    
+    model_path = uploads.install(session)
+    size_mb = round(model_path.stat().st_size / (1024 * 1024), 2)
+    print(f"[ModelUpload] ✅ 模型校验通过: {model_path.name} ({size_mb}MB)")
+    return {
+        'filename': model_path.name,
+        'model_name': model_path.stem,
+        'size_mb': size_mb,
+        'sha256': sha256,
+        'tensors': check.get('tensors'),
+        'parameters': check.get('parameters')
+    }
+
+
+def _submit_validation(session):
+    """核对上传并提交后台校验任务，返回 (任务, SHA-256)"""
+    from flask import current_app
+    
+    from core.jobs import JobQueueFull
+    
+    app = current_app._get_current_object()
+    sha256 = session.finish()
+    try:
+        job = app.job_manager.submit(_validate_model_job, app, session.id, sha256,
+                                     kind='model_validate', key=session.id)
+    except JobQueueFull:
+        session.status = 'uploading'
+        raise
+    session.job_id = job.id
+    return job, sha256
+
+
+def _upload_status(session):
+    """上传会话状态，已提交校验时附带任务状态（完成后包含模型信息）"""
+    from flask import current_app
+    
+    data = session.to_dict()
+    job = current_app.job_manager.get(session.job_id) if session.job_id else None
+    data['job'] = job.to_dict() if job else None
+    return data
+
+
+@system_bp.route('/models/uploads', methods=['POST', 'OPTIONS'])
+@admin_required
+def create_model_upload():
+    """
+    创建分块上传
+    请求体: {"model_name": "lung_v2", "size": 125686203, "sha256": "..."}（sha256 可选）
+    之后按 chunk_size 逐块 PUT /models/uploads/<upload_id>?offset=<偏移>，全部上传后 POST .../complete
+    """
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 1})
+    
+    from flask import current_app
+    from core.model_upload import UploadError
+    
+    data = request.get_json() or {}
+    user = get_current_user()
+    try:
+        session = current_app.model_uploads.create(
+            data.get('model_name'), data.get('size'), data.get('sha256'),
+            user.username if user else None
+        )
+    except UploadError as e:
+        return error_response(str(e))
+    
+    print(f"[ModelUpload] 创建上传: {session.id} ({session.model_name}, {session.size} 字节)")
+    return success_response(session.to_dict())
+
+
+@system_bp.route('/models/uploads/<upload_id>', methods=['GET', 'OPTIONS'])
+@admin_required
+def get_model_upload(upload_id):
+    """查询上传进度（断点续传时从 received 处继续）与校验任务状态"""
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 1})
+    
+    from flask import current_app
+    session = current_app.model_uploads.get(upload_id)
+    if session is None:
+        return error_response('上传不存在或已过期', 404)
+    return success_response(_upload_status(session))
+
+
+@system_bp.route('/models/uploads/<upload_id>', methods=['PUT'])
+@admin_required
+def put_model_chunk(upload_id):
+    """上传一块数据：请求体为原始字节，offset 为本块起始偏移"""
+    from flask import current_app
+    from core.model_upload import OffsetMismatch, UploadError
+    
+    session = current_app.model_uploads.get(upload_id)
+    if session is None:
+        return error_response('上传不存在或已过期', 404)
+    try:
+        offset = int(request.args.get('offset', -1))
+    except ValueError:
+        return error_response('无效的偏移量')
+    
+    try:
+        received = session.write(offset, request.stream, request.content_length)
+    except OffsetMismatch as e:
+        response = jsonify({'status': 0, 'error': str(e), 'data': session.to_dict()})
+        response.status_code = 409
+        return response
+    except UploadError as e:
+        return error_response(str(e))
+    
+    return success_response({'received': received, 'size': session.size})
+
+
+@system_bp.route('/models/uploads/<upload_id>', methods=['DELETE'])
+@admin_required
+def cancel_model_upload(upload_id):
+    """取消上传并删除暂存文件"""
+    from flask import current_app
+    
+    session = current_app.model_uploads.get(upload_id)
+    if session is None:
+        return error_response('上传不存在或已过期', 404)
+    if session.status != 'uploading':
+        return error_response('上传已提交校验，不能取消')
+    current_app.model_uploads.discard(session)
+    return success_response(message='上传已取消')
+
+
+@system_bp.route('/models/uploads/<upload_id>/complete', methods=['POST', 'OPTIONS'])
+@admin_required
+def complete_model_upload(upload_id):
+    """完成上传：核对大小与校验和后提交后台校验任务，结果通过任务状态返回"""
+    if request.method == 'OPTIONS':
+        return jsonify({'status': 1})
+    
+    from flask import current_app
+    from core.jobs import JobQueueFull
+    from core.model_upload import UploadError
+    
+    session = current_app.model_uploads.get(upload_id)
+    if session is None:
+        return error_response('上传不存在或已过期', 404)
+    try:
+        job, sha256 = _submit_validation(session)
+    except UploadError as e:
+        return error_response(str(e))
+    except JobQueueFull as e:
+        return error_response(str(e), 503)
+    
+    log_audit('upload', 'model', target=session.model_name,
+              detail={'size_mb': round(session.size / (1024 * 1024), 2), 'sha256': sha256, 'job_id': job.id})
+    
+    return success_response(_upload_status(session), message='上传完成，正在后台校验模型')
 
 
 @system_bp.route('/models/upload', methods=['POST', 'OPTIONS'])
 @admin_required
 def upload_model():
-    """上传新模型文件"""
+    """
+    上传整个模型文件（小文件；大文件使用 /models/uploads 分块上传）
+    文件写入暂存目录后在后台校验，结果通过 GET /models/uploads/<upload_id> 查询
+    """
     if request.method == 'OPTIONS':
         return jsonify({'status': 1})
     
     try:
+        from flask import current_app
+        from core.jobs import JobQueueFull
+        from core.model_upload import STAGING_DIR, UploadError
+        
         if 'file' not in request.files:
             return error_response('没有选择文件')
         
@@ -763,53 +1205,31 @@ def upload_model():
         model_name = request.form.get('model_name', '').strip()
         if not model_name:
             model_name = Path(file.filename).stem
+        model_name = Path(secure_filename(f'{model_name}.pth')).stem
         
-        # 安全的文件名
-        safe_filename = secure_filename(f'{model_name}.pth')
-        
-        # 确保目录存在
-        MODELS_DIR.mkdir(parents=True, exist_ok=True)
-        
-        # 保存文件
-        save_path = MODELS_DIR / safe_filename
-        
-        # 如果同名文件已存在，添加时间戳
-        if save_path.exists():
-            timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-            safe_filename = f'{model_name}_{timestamp}.pth'
-            save_path = MODELS_DIR / safe_filename
+        # 写入暂存目录（分块写盘，不在内存中保留整个文件）
+        STAGING_DIR.mkdir(parents=True, exist_ok=True)
+        temp_path = STAGING_DIR / f'{uuid.uuid4().hex}.tmp'
+        file.save(str(temp_path))
         
-        file.save(str(save_path))
-        
-        # 验证模型文件
+        user = get_current_user()
         try:
-            import torch
-            import core.net.unet as net
-            
-            device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-            test_model = net.Unet(1, 1).to(device)
-            
-            if torch.cuda.is_available():
-                test_model.load_state_dict(torch.load(str(save_path)))
-            else:
-                test_model.load_state_dict(torch.load(str(save_path), map_location='cpu'))
-            
-            del test_model  # 释放内存
-            
-        except Exception as e:
-            # 删除无效的模型文件
-            save_path.unlink()
-            return error_response(f'模型文件无效: {str(e)}')
+            session = current_app.model_uploads.create_from_file(
+                model_name, temp_path, user.username if user else None
+            )
+        except UploadError as e:
+            temp_path.unlink()
+            return error_response(str(e))
+        try:
+            job, sha256 = _submit_validation(session)
+        except JobQueueFull as e:
+            current_app.model_uploads.discard(session)
+            return error_response(str(e), 503)
         
-        user = get_current_user()
-        log_audit('upload', 'model', target=safe_filename,
-                  detail={'size_mb': round(save_path.stat().st_size / (1024 * 1024), 2)})
+        log_audit('upload', 'model', target=model_name,
+                  detail={'size_mb': round(session.size / (1024 * 1024), 2), 'sha256': sha256, 'job_id': job.id})
         
-        return success_response({
-            'filename': safe_filename,
-            'model_name': Path(safe_filename).stem,
-            'size_mb': round(save_path.stat().st_size / (1024 * 1024), 2)
-        }, message='模型上传成功')
+        return success_response(_upload_status(session), message='上传完成，正在后台校验模型')
         
     except Exception as e:
         return error_response(f'上传失败: {str(e)}')
@@ -826,17 +1246,36 @@ def delete_model(model_name):
         if model_name == 'default':
             return error_response('不能删除默认模型')
         
+        from flask import current_app
+        from core import loader
+        
         # 检查是否是当前使用的模型
         current_model_setting = SystemSetting.query.filter_by(key='current_model').first()
         if current_model_setting and current_model_setting.value == model_name:
             return error_response('不能删除当前正在使用的模型，请先切换到其他模型')
-        
-        model_path = MODELS_DIR / f'{model_name}.pth'
+        if current_app.model_manager.in_use(model_name):
+            return error_response('不能删除当前或可回滚的模型，请先切换到其他模型')
+        if model_name in current_app.model_manager.routes.values():
+            return error_response('该模型已配置为器官诊断模型，请先修改模型路由')
+        if model_name == current_app.shadow.candidate:
+            return error_response('该模型正在进行影子推理，请先停用影子推理')
+
+        try:
+            model_path = loader.model_file(model_name)
+        except ValueError as e:
+            return error_response(str(e))
         if not model_path.exists():
             return error_response(f'模型不存在: {model_name}')
         
-        # 删除文件
+        # 释放常驻内存的模型
+        current_app.model_manager.unload(model_name)
+        
+        # 删除文件（连同优化构建产物与映射权重）
         model_path.unlink()
+        from core import optimize, weights
+        for derived in (optimize.optimized_path(model_path), weights.weights_path(model_path)):
+            if derived.exists():
+                derived.unlink()
         
         log_audit('delete', 'model', target=model_name)
         
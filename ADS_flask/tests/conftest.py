@@ -0,0 +1,9 @@
+"""
+后端单元测试公共配置
+测试直接导入 core 模块，不启动 Flask 应用，也不调用 eventlet.monkey_patch()（offload.run_blocking 直接调用）。
+在 ADS_flask 目录下运行: python -m pytest -q tests
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
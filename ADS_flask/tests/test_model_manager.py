@@ -0,0 +1,147 @@
+"""在线模型热切换、回滚与释放（core.model_manager）"""
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from core import loader
+from core.model_manager import ModelManager, ModelSwitchInProgress
+
+
+class FakeModel:
+    """代替服务模型，记录是否被释放"""
+
+    def __init__(self, name):
+        self.name = name
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+
+@pytest.fixture
+def weights_dir(tmp_path):
+    for name in ('a', 'b', 'c'):
+        (tmp_path / f'{name}.pth').write_bytes(b'w' * 16)
+    return tmp_path
+
+
+@pytest.fixture
+def manager(weights_dir, monkeypatch):
+    monkeypatch.setattr(loader, 'load_serving_model', lambda path: FakeModel(path.stem))
+    app = SimpleNamespace(model=None, model_id=None)
+    manager = ModelManager(app, drain_timeout=5, budget_mb=1)
+    manager.install('a', weights_dir / 'a.pth', FakeModel('a'), 'a:1')
+    return manager
+
+
+def _wait_switch(manager, timeout=5):
+    deadline = time.time() + timeout
+    while manager.status['state'] == 'loading':
+        assert time.time() < deadline, '模型切换未完成'
+        time.sleep(0.01)
+    return manager.status['state']
+
+
+def test_failed_load_keeps_current_model(manager, weights_dir, monkeypatch):
+    def broken(path):
+        raise RuntimeError('bad weights')
+
+    monkeypatch.setattr(loader, 'load_serving_model', broken)
+    manager.switch('b', weights_dir / 'b.pth')
+
+    assert _wait_switch(manager) == 'failed'
+    assert 'bad weights' in manager.status['error']
+    assert manager.current.name == 'a'
+    assert manager.previous is None
+    assert manager.app.model_id == 'a:1'
+
+
+def test_switch_then_rollback(manager, weights_dir):
+    model_a = manager.current.model
+    manager.switch('b', weights_dir / 'b.pth')
+    assert _wait_switch(manager) == 'ready'
+    assert manager.current.name == 'b'
+    assert manager.previous.name == 'a'
+    assert manager.app.model is manager.current.model
+
+    slot = manager.rollback()
+    assert slot.name == 'a'
+    assert manager.app.model is model_a
+    assert manager.previous.name == 'b'
+    # 回滚不释放任何模型
+    assert not model_a.stopped and not manager.previous.model.stopped
+
+
+def test_rollback_without_previous(manager):
+    with pytest.raises(ValueError):
+        manager.rollback()
+
+
+def test_concurrent_switch_is_rejected(manager, weights_dir, monkeypatch):
+    release = threading.Event()
+
+    def slow(path):
+        release.wait(5)
+        return FakeModel(path.stem)
+
+    monkeypatch.setattr(loader, 'load_serving_model', slow)
+    manager.switch('b', weights_dir / 'b.pth')
+    with pytest.raises(ModelSwitchInProgress):
+        manager.switch('c', weights_dir / 'c.pth')
+    release.set()
+    assert _wait_switch(manager) == 'ready'
+    assert manager.current.name == 'b'
+
+
+def test_pinned_request_finishes_on_old_model(manager, weights_dir):
+    model_a = manager.current.model
+    with manager.acquire() as slot:
+        manager.switch('b', weights_dir / 'b.pth')
+        assert _wait_switch(manager) == 'ready'
+        # 切换前开始的请求继续使用旧模型，新请求使用新模型
+        assert slot.model is model_a
+        with manager.acquire() as new_slot:
+            assert new_slot.name == 'b'
+        assert manager.info()['previous']['active_requests'] == 1
+    assert manager.info()['previous']['active_requests'] == 0
+
+
+def test_unload_drains_active_requests(manager, weights_dir):
+    manager.switch('b', weights_dir / 'b.pth')
+    assert _wait_switch(manager) == 'ready'
+    manager.switch('c', weights_dir / 'c.pth')
+    assert _wait_switch(manager) == 'ready'
+    # a 被挤出当前/上一个模型，预算允许时继续常驻
+    assert [slot.name for slot in manager.resident.values()] == ['a']
+
+    unloaded = threading.Event()
+    with manager.acquire('a') as slot:
+        model_a = slot.model
+        threading.Thread(target=lambda: manager.unload('a') and unloaded.set(), daemon=True).start()
+        assert not unloaded.wait(0.3)
+        assert not model_a.stopped
+    assert unloaded.wait(5)
+    assert model_a.stopped
+    assert 'a' not in manager.resident
+
+
+def test_busy_model_over_budget_released_after_last_request(manager, weights_dir):
+    manager.budget = 0  # 被挤出的模型不再常驻
+    model_a = manager.current.model
+    with manager.acquire() as slot:
+        manager.switch('b', weights_dir / 'b.pth')
+        assert _wait_switch(manager) == 'ready'
+        manager.switch('c', weights_dir / 'c.pth')
+        assert _wait_switch(manager) == 'ready'
+        # 仍在使用，暂不释放
+        assert 'a' in manager.resident
+        assert not model_a.stopped
+        assert slot.model is model_a
+    deadline = time.time() + 5
+    while not model_a.stopped:
+        assert time.time() < deadline, '旧模型未在请求结束后释放'
+        time.sleep(0.01)
+    assert 'a' not in manager.resident
+    assert manager.stats['evictions'] == 1
@@ -0,0 +1,126 @@
+"""模型分块上传的偏移校验与断点续传（core.model_upload）"""
+import hashlib
+import io
+
+import pytest
+
+from core import model_upload
+from core.model_upload import ModelUploads, OffsetMismatch, UploadError
+
+DATA = bytes(range(256)) * 40
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    monkeypatch.setattr(model_upload, 'STAGING_DIR', tmp_path / '.uploads')
+    monkeypatch.setattr(model_upload, 'MODELS_DIR', tmp_path)
+    return ModelUploads()
+
+
+def _put(session, offset, data):
+    return session.write(offset, io.BytesIO(data), len(data))
+
+
+def test_chunks_must_continue_from_received(uploads):
+    session = uploads.create('unet_v2', len(DATA), hashlib.sha256(DATA).hexdigest())
+    assert _put(session, 0, DATA[:1000]) == 1000
+
+    # 重复发送或跳过分块都被拒绝，并告知应继续的偏移
+    for offset in (0, 500, 2000):
+        with pytest.raises(OffsetMismatch) as exc:
+            _put(session, offset, DATA[offset:offset + 100])
+        assert exc.value.received == 1000
+    assert session.received == 1000
+
+    assert _put(session, 1000, DATA[1000:]) == len(DATA)
+    assert session.finish() == hashlib.sha256(DATA).hexdigest()
+    assert session.status == 'validating'
+    with pytest.raises(UploadError):
+        _put(session, len(DATA), b'x')
+
+
+def test_interrupted_chunk_keeps_partial_progress(uploads):
+    session = uploads.create('unet_v2', len(DATA))
+
+    class Broken(io.BytesIO):
+        def read(self, size=-1):
+            data = super().read(min(size, 300))
+            if not data:
+                raise ConnectionError('client disconnected')
+            return data
+
+    with pytest.raises(ConnectionError):
+        session.write(0, Broken(DATA[:1000]), 2000)
+    # 已写入的部分计入进度，客户端从 received 处继续
+    assert session.received == 1000
+    _put(session, 1000, DATA[1000:])
+    assert session.finish() == hashlib.sha256(DATA).hexdigest()
+
+
+def test_resume_after_restart(uploads):
+    session = uploads.create('unet_v2', len(DATA), hashlib.sha256(DATA).hexdigest())
+    _put(session, 0, DATA[:4096])
+
+    # 新的管理器（服务重启）由暂存文件恢复会话与校验和
+    restarted = ModelUploads()
+    restored = restarted.get(session.id)
+    assert restored is not session
+    assert restored.received == 4096
+    assert restored.model_name == 'unet_v2'
+    with pytest.raises(OffsetMismatch):
+        _put(restored, 0, DATA[:10])
+    _put(restored, 4096, DATA[4096:])
+    assert restored.finish() == hashlib.sha256(DATA).hexdigest()
+
+
+def test_data_beyond_declared_size_is_rejected(uploads):
+    session = uploads.create('unet_v2', 100)
+    with pytest.raises(UploadError):
+        _put(session, 0, DATA[:200])
+    # 拒绝前已写入的数据不超过声明的大小
+    assert session.received <= 100
+
+
+def test_checksum_mismatch_restarts_upload(uploads):
+    session = uploads.create('unet_v2', len(DATA), hashlib.sha256(b'other').hexdigest())
+    _put(session, 0, DATA)
+    with pytest.raises(UploadError):
+        session.finish()
+    assert session.received == 0
+    assert session.status == 'uploading'
+    assert session.part_path.stat().st_size == 0
+
+
+def test_finish_requires_complete_file(uploads):
+    session = uploads.create('unet_v2', len(DATA))
+    _put(session, 0, DATA[:10])
+    with pytest.raises(UploadError):
+        session.finish()
+
+
+@pytest.mark.parametrize('name, size, sha256', [
+    ('../evil', 10, None),
+    ('', 10, None),
+    ('unet', 0, None),
+    ('unet', '10', None),
+    ('unet', 10, 'not-a-hash'),
+])
+def test_create_validates_request(uploads, name, size, sha256):
+    with pytest.raises(UploadError):
+        uploads.create(name, size, sha256)
+
+
+def test_get_rejects_invalid_ids(uploads):
+    assert uploads.get('../../etc/passwd') is None
+    assert uploads.get('0' * 32) is None
+
+
+def test_install_moves_file_into_models_dir(uploads, tmp_path):
+    session = uploads.create('unet_v2', len(DATA))
+    _put(session, 0, DATA)
+    session.finish()
+    target = uploads.install(session)
+    assert target == tmp_path / 'unet_v2.pth'
+    assert target.read_bytes() == DATA
+    assert not session.part_path.exists() and not session.meta_path.exists()
+    assert session.status == 'done'
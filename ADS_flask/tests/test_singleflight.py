@@ -0,0 +1,159 @@
+"""同键请求合并（core.singleflight）"""
+import threading
+
+import pytest
+
+from core.singleflight import SingleFlight
+
+
+def _start_follower(flight, key, results, progress=None):
+    """在线程中发起同键调用，返回线程"""
+    def follow():
+        try:
+            results.append(flight.do(key, lambda p: 'follower', progress))
+        except Exception as e:
+            results.append(e)
+
+    thread = threading.Thread(target=follow, daemon=True)
+    thread.start()
+    return thread
+
+
+def _wait_for_waiters(flight, key, count):
+    for _ in range(500):
+        if flight.in_flight().get(key) == count:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError(f'等待者未到达: {flight.in_flight()}')
+
+
+def test_concurrent_calls_run_once():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def leader_fn(progress):
+        calls.append(1)
+        release.wait(5)
+        return 'result'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do('k', leader_fn)), daemon=True)
+    leader.start()
+    for _ in range(500):
+        if 'k' in flight.in_flight():
+            break
+        threading.Event().wait(0.01)
+    followers = [_start_follower(flight, 'k', results) for _ in range(3)]
+    _wait_for_waiters(flight, 'k', 3)
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert sorted(results, key=lambda r: r[1]) == [('result', False)] + [('result', True)] * 3
+    assert flight.stats == {'executed': 1, 'coalesced': 3}
+    assert flight.in_flight() == {}
+
+
+def test_leader_error_propagates_to_followers():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def failing(progress):
+        release.wait(5)
+        raise ValueError('boom')
+
+    leader_error = []
+
+    def lead():
+        try:
+            flight.do('k', failing)
+        except ValueError as e:
+            leader_error.append(e)
+
+    leader = threading.Thread(target=lead, daemon=True)
+    leader.start()
+    for _ in range(500):
+        if 'k' in flight.in_flight():
+            break
+        threading.Event().wait(0.01)
+    results = []
+    follower = _start_follower(flight, 'k', results)
+    _wait_for_waiters(flight, 'k', 1)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert len(leader_error) == 1
+    assert results == [leader_error[0]]
+    # 失败后键被移除，下一次调用重新执行
+    assert flight.do('k', lambda p: 'retry') == ('retry', False)
+
+
+def test_followers_receive_progress():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def leader_fn(progress):
+        started.set()
+        release.wait(5)
+        progress(10, 'start')
+        progress(90, 'almost')
+        return 'done'
+
+    leader = threading.Thread(target=lambda: flight.do('k', leader_fn), daemon=True)
+    leader.start()
+    assert started.wait(5)
+    seen, results = [], []
+    follower = _start_follower(flight, 'k', results, lambda pct, msg: seen.append(pct))
+    _wait_for_waiters(flight, 'k', 1)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert seen == [10, 90]
+    assert results == [('done', True)]
+
+
+def test_late_follower_gets_last_progress():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def leader_fn(progress):
+        progress(10, 'start')
+        progress(40, 'predict')
+        started.set()
+        release.wait(5)
+        return 'done'
+
+    leader = threading.Thread(target=lambda: flight.do('k', leader_fn), daemon=True)
+    leader.start()
+    assert started.wait(5)
+    seen, results = [], []
+    follower = _start_follower(flight, 'k', results, lambda pct, msg: seen.append((pct, msg)))
+    _wait_for_waiters(flight, 'k', 1)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    # 加入时只补发最近一次进度
+    assert seen == [(40, 'predict')]
+    assert results == [('done', True)]
+
+
+def test_different_keys_do_not_coalesce():
+    flight = SingleFlight()
+    assert flight.do('a', lambda p: 1) == (1, False)
+    assert flight.do('b', lambda p: 2) == (2, False)
+    assert flight.stats['coalesced'] == 0
+
+
+def test_sequential_calls_run_again():
+    flight = SingleFlight()
+    counter = []
+    for _ in range(2):
+        flight.do('k', lambda p: counter.append(1))
+    assert len(counter) == 2
+    with pytest.raises(KeyError):
+        flight.do('k', lambda p: {}['missing'])
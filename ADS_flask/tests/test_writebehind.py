@@ -0,0 +1,103 @@
+"""产物延迟写入（core.writebehind）"""
+import threading
+
+from core.writebehind import WriteBehind
+
+
+def test_pending_data_is_readable_before_write(tmp_path):
+    writer = WriteBehind(workers=1)
+    path = tmp_path / 'a' / 'mask.png'
+    release = threading.Event()
+
+    def produce():
+        release.wait(5)
+        return b'mask'
+
+    writer.submit(path, produce)
+    assert writer.pending(path)
+    assert writer.exists(path)
+    assert not path.exists()
+    release.set()
+    # 未落盘时从内存读取（等待编码完成）
+    assert writer.read_bytes(path) == b'mask'
+    assert writer.flush(5)
+    assert path.read_bytes() == b'mask'
+    assert not writer.pending(path)
+    assert writer.read(path) is None
+    assert writer.read_bytes(path) == b'mask'
+
+
+def test_latest_write_per_path_wins(tmp_path):
+    writer = WriteBehind(workers=2)
+    path = tmp_path / 'draw.png'
+    slow = threading.Event()
+
+    def old():
+        # 旧内容编码较慢，晚于新内容完成
+        slow.wait(5)
+        return b'old'
+
+    writer.submit(path, old)
+    writer.submit(path, lambda: b'new')
+    assert writer.read_bytes(path) == b'new'
+    slow.set()
+    assert writer.flush(5)
+    assert path.read_bytes() == b'new'
+    assert writer.info()['superseded'] == 1
+
+
+def test_burst_of_writes_keeps_last(tmp_path):
+    writer = WriteBehind(workers=4)
+    path = tmp_path / 'prob.npz'
+    for i in range(20):
+        writer.submit(path, lambda i=i: str(i).encode())
+    assert writer.flush(10)
+    assert path.read_bytes() == b'19'
+    info = writer.info()
+    assert info['pending'] == 0
+    assert info['written'] + info['superseded'] == 20
+
+
+def test_version_matches_mtime_after_write(tmp_path):
+    writer = WriteBehind(workers=1)
+    path = tmp_path / 'image.png'
+    release = threading.Event()
+    writer.submit(path, lambda: release.wait(5) and b'x')
+    version = writer.version(path)
+    assert version is not None
+    release.set()
+    assert writer.flush(5)
+    # 落盘后的修改时间即提交时间，内容版本不变
+    assert f'{path.stat().st_mtime_ns:x}' == version
+    assert writer.version(path) is None
+
+
+def test_failed_produce_is_not_written(tmp_path):
+    writer = WriteBehind(workers=1)
+    path = tmp_path / 'heatmap.png'
+
+    def broken():
+        raise RuntimeError('encode failed')
+
+    writer.submit(path, broken)
+    assert writer.flush(5)
+    assert not path.exists()
+    assert writer.info()['failed'] == 1
+
+
+def test_backpressure_blocks_until_written(tmp_path):
+    writer = WriteBehind(workers=1, max_pending=1)
+    release = threading.Event()
+    writer.submit(tmp_path / 'a.png', lambda: release.wait(5) and b'a')
+    submitted = threading.Event()
+
+    def second():
+        writer.submit(tmp_path / 'b.png', lambda: b'b')
+        submitted.set()
+
+    threading.Thread(target=second, daemon=True).start()
+    assert not submitted.wait(0.2)
+    release.set()
+    assert submitted.wait(5)
+    assert writer.flush(5)
+    assert (tmp_path / 'b.png').read_bytes() == b'b'
@@ -0,0 +1,150 @@
+"""
+Unet INT8 训练后静态量化（CPU 推理用）
+
+- 使用 FX 图模式量化，覆盖 DoubleConv、AttentionGate（add/mul/sigmoid）与跳连 cat
+- 用训练集切片做校准，与 train.py 相同的按患者划分 (get_d1, seed=42)；
+  校准切片按固定种子打乱后在各训练患者间轮流抽取，避免只覆盖数据集开头的少数患者
+- 在留出的测试患者上比较 FP32 与 INT8 的 Dice，并输出单张推理耗时
+- 结果保存为 TorchScript，Flask 端设置 INFERENCE_BACKEND=int8 即可加载
+
+用法 (在 ADS_model/net 目录下):
+    python quantize.py --weights ../model_weights.pth --output ../model_weights.int8.pt
+"""
+import argparse
+import copy
+import sys
+import time
+
+sys.path.append("..")
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Subset
+
+from data_set import make
+from net import unet
+from utils import dice_loss
+
+rate = 0.50
+
+
+def _quant_api():
+    """兼容 torch.ao (>=1.13) 与旧版 torch.quantization 的 FX 量化接口"""
+    try:
+        from torch.ao.quantization import get_default_qconfig_mapping
+        from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+        def prepare(model, example):
+            return prepare_fx(model, get_default_qconfig_mapping('fbgemm'), example_inputs=(example,))
+    except ImportError:
+        from torch.quantization import get_default_qconfig
+        from torch.quantization.quantize_fx import prepare_fx, convert_fx
+
+        def prepare(model, example):
+            return prepare_fx(model, {'': get_default_qconfig('fbgemm')})
+    return prepare, convert_fx
+
+
+def load_fp32(weights):
+    model = unet.Unet(1, 1)
+    model.load_state_dict(torch.load(weights, map_location='cpu'))
+    return model.eval()
+
+
+def calibration_indices(dataset, count, seed=42):
+    """
+    按固定种子选取 count 个校准切片：患者顺序与患者内切片顺序均打乱后轮流抽取，
+    切片尽量均匀地分布在所有患者上
+    """
+    rng = np.random.RandomState(seed)
+    by_patient = {}
+    for index, item in enumerate(getattr(dataset, 'images', [])):
+        by_patient.setdefault(item[1], []).append(index)
+    if not by_patient:
+        return rng.permutation(len(dataset))[:count].tolist()
+
+    groups = [by_patient[pid] for pid in sorted(by_patient)]
+    for group in groups:
+        rng.shuffle(group)
+    rng.shuffle(groups)
+    indices = []
+    for depth in range(max(len(group) for group in groups)):
+        indices.extend(group[depth] for group in groups if depth < len(group))
+        if len(indices) >= count:
+            break
+    return indices[:count]
+
+
+def quantize(model, calib_dataset, num_batches=64, seed=42):
+    """用校准集统计激活范围并转换为 INT8 模型"""
+    torch.backends.quantized.engine = 'fbgemm'
+    prepare, convert = _quant_api()
+
+    example = calib_dataset[0][0][0].unsqueeze(0)
+    prepared = prepare(copy.deepcopy(model).eval(), example)
+
+    loader = DataLoader(calib_dataset, batch_size=1, shuffle=True, num_workers=0,
+                        generator=torch.Generator().manual_seed(seed))
+    with torch.no_grad():
+        for step, (x, _) in enumerate(loader):
+            if step >= num_batches:
+                break
+            prepared(x[0])
+            print("\r校准中 %d/%d" % (step + 1, min(num_batches, len(loader))), end='')
+    print()
+    return convert(prepared).eval()
+
+
+def evaluate(model, dataset):
+    """返回 (平均 Dice, 单张平均耗时ms)，二值化方式与 train.test() 一致"""
+    total_dice, total_time = 0.0, 0.0
+    loader = DataLoader(dataset, batch_size=1, shuffle=False, num_workers=0)
+    with torch.no_grad():
+        for x, mask in loader:
+            t = time.perf_counter()
+            y = model(x[0])
+            total_time += time.perf_counter() - t
+            img_y = torch.squeeze(y).numpy()
+            pred = (img_y >= rate).astype(np.uint8)
+            total_dice += dice_loss.dice(pred, mask[1].squeeze(0).numpy())
+    n = max(1, len(loader))
+    return total_dice / n, total_time / n * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Unet INT8 量化')
+    parser.add_argument('--data', default='../../src/train', help='数据路径（与 train.py 相同）')
+    parser.add_argument('--weights', default='../model_weights.pth', help='FP32 权重')
+    parser.add_argument('--output', default='../model_weights.int8.pt', help='INT8 TorchScript 输出路径')
+    parser.add_argument('--calib-batches', type=int, default=64, help='校准使用的切片数')
+    parser.add_argument('--seed', type=int, default=42, help='校准切片抽样的随机种子')
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+
+    train_dataset, _, test_dataset = make.get_d1(args.data)
+    calib_dataset = Subset(train_dataset, calibration_indices(train_dataset, args.calib_batches * 4, args.seed))
+    print(f"校准切片: {len(calib_dataset)} 张，来自 "
+          f"{len({train_dataset.images[i][1] for i in calib_dataset.indices})} 位患者")
+
+    fp32 = load_fp32(args.weights)
+    int8 = quantize(fp32, calib_dataset, args.calib_batches, args.seed)
+
+    example = test_dataset[0][0][0].unsqueeze(0)
+    scripted = torch.jit.trace(int8, example)
+    scripted = torch.jit.freeze(scripted)
+    torch.jit.save(scripted, args.output)
+    print(f"INT8 模型已保存: {args.output}")
+
+    fp32_dice, fp32_ms = evaluate(fp32, test_dataset)
+    int8_dice, int8_ms = evaluate(scripted, test_dataset)
+    print(f"\n{'='*60}")
+    print(f"测试患者切片数: {len(test_dataset)}")
+    print(f"FP32  Dice: {fp32_dice:.4f} | {fp32_ms:.1f} ms/张")
+    print(f"INT8  Dice: {int8_dice:.4f} | {int8_ms:.1f} ms/张")
+    print(f"Dice 变化: {int8_dice - fp32_dice:+.4f} | 加速比: {fp32_ms / max(int8_ms, 1e-6):.2f}x")
+    print(f"{'='*60}")
+
+
+if __name__ == '__main__':
+    main()
@@ -83,6 +83,48 @@ export const switchModel = (modelName) => {
   })
 }
 
+/**
+ * 获取模型切换进度（模型在后台加载预热后切换）
+ */
+export const getModelSwitchStatus = () => {
+  return request({
+    url: '/api/models/switch/status',
+    method: 'get'
+  })
+}
+
+/**
+ * 获取器官模型路由及常驻内存的模型
+ */
+export const getModelRoutes = () => {
+  return request({
+    url: '/api/models/routes',
+    method: 'get'
+  })
+}
+
+/**
+ * 更新器官模型路由
+ * @param {Object} routes - 器官 -> 模型名称，模型名称为空表示删除该路由
+ */
+export const updateModelRoutes = (routes) => {
+  return request({
+    url: '/api/models/routes',
+    method: 'put',
+    data: { routes }
+  })
+}
+
+/**
+ * 回滚到上一个模型
+ */
+export const rollbackModel = () => {
+  return request({
+    url: '/api/models/rollback',
+    method: 'post'
+  })
+}
+
 /**
  * 上传新模型
  * @param {FormData} formData - 包含 file 和可选的 model_name
@@ -98,6 +140,58 @@ export const uploadModel = (formData) => {
   })
 }
 
+/**
+ * 创建模型分块上传
+ * @param {Object} data - { model_name, size, sha256? }
+ */
+export const createModelUpload = (data) => {
+  return request({
+    url: '/api/models/uploads',
+    method: 'post',
+    data
+  })
+}
+
+/**
+ * 上传一块模型数据
+ * @param {String} uploadId - 上传ID
+ * @param {Number} offset - 本块在文件中的起始偏移
+ * @param {Blob} chunk - 数据块
+ */
+export const putModelChunk = (uploadId, offset, chunk) => {
+  return request({
+    url: `/api/models/uploads/${uploadId}`,
+    method: 'put',
+    params: { offset },
+    data: chunk,
+    headers: {
+      'Content-Type': 'application/octet-stream'
+    }
+  })
+}
+
+/**
+ * 完成上传，服务端在后台校验模型
+ * @param {String} uploadId - 上传ID
+ */
+export const completeModelUpload = (uploadId) => {
+  return request({
+    url: `/api/models/uploads/${uploadId}/complete`,
+    method: 'post'
+  })
+}
+
+/**
+ * 查询上传进度与校验任务状态
+ * @param {String} uploadId - 上传ID
+ */
+export const getModelUpload = (uploadId) => {
+  return request({
+    url: `/api/models/uploads/${uploadId}`,
+    method: 'get'
+  })
+}
+
 /**
  * 删除模型
  * @param {String} modelName - 模型名称
@@ -108,3 +202,35 @@ export const deleteModel = (modelName) => {
     method: 'delete'
   })
 }
+
+/**
+ * 获取候选模型影子推理的设置与比较结果
+ */
+export const getModelShadow = () => {
+  return request({
+    url: '/api/models/shadow',
+    method: 'get'
+  })
+}
+
+/**
+ * 设置影子推理的候选模型与抽样比例
+ * @param {Object} data - { candidate: 模型名称（为空表示停用）, rate: 0-1 }
+ */
+export const updateModelShadow = (data) => {
+  return request({
+    url: '/api/models/shadow',
+    method: 'put',
+    data
+  })
+}
+
+/**
+ * 清空影子推理的比较结果
+ */
+export const resetModelShadow = () => {
+  return request({
+    url: '/api/models/shadow/stats',
+    method: 'delete'
+  })
+}